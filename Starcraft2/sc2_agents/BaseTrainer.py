@@ -1,6 +1,10 @@
+import contextlib
+import functools
 import threading
 import time
 
+import torch
+
 from pysc2 import maps
 from pysc2.env import available_actions_printer
 # from pysc2.env import run_loop
@@ -13,6 +17,14 @@ from absl import flags
 # from sc2_agents.dqn_double_q_agent import DQNDoubleQAgent as Agent
 from sc2_agents.dqn_dueling_agent import DQNDuelingAgent as Agent
 # from sc2_agents.dqn_per_agent import DQNPERAgent as Agent
+from sc2_agents.dqn_per_agent import DQNPERAgent, DQNPERCNN
+from sc2_agents.vec_env import VecEnv
+from sc2_agents.fake_env import BatchMoveToBeacon, MoveToBeacon
+from sc2_agents import apex
+from utils.timings import timings
+from utils.metrics import make_sink
+from utils.inference import InferenceServer
+from utils.precision import PRECISIONS, COMPILE_MODES
 
 FLAGS = flags.FLAGS
 flags.DEFINE_bool("render", False, "Whether to render with pygame.")
@@ -34,16 +46,46 @@ flags.DEFINE_enum("difficulty", None, sc2_env.difficulties.keys(),
 
 flags.DEFINE_bool("profile", False, "Whether to turn on code profiling.")
 flags.DEFINE_bool("trace", False, "Whether to trace the code execution.")
-flags.DEFINE_integer("parallel", 1, "How many instances to run in parallel.")
+flags.DEFINE_integer("parallel", 1, "How many environments the agent steps together.")
 
 flags.DEFINE_bool("save_replay", False, "Whether to save a replay at the end.")
-
+flags.DEFINE_integer("actors", 0,
+                     "Train DQNPERAgent Ape-X style with this many actor processes, 0 to disable.")
+flags.DEFINE_integer("max_updates", 0, "Learner updates in Ape-X mode, 0 to run until interrupted.")
+flags.DEFINE_string("replay_path", None,
+                    "Directory for a memory mapped replay memory, resumed if it exists.")
+
+flags.DEFINE_integer("replay_shards", 1,
+                     "Splits the replay memory into this many shards, one per --parallel env stream, each "
+                     "behind its own lock.")
+
+flags.DEFINE_string("checkpoint_path", None,
+                    "Checkpoint of the learner, optimizer, epsilon and replay, resumed if it exists and "
+                    "rewritten every checkpoint_frequency frames.")
+flags.DEFINE_string("device", None, "Torch device to train on (cpu, cuda, cuda:1), defaults to cuda if available.")
+flags.DEFINE_integer("num_threads", 0, "Torch CPU threads when training on the cpu, 0 for one per core.")
+flags.DEFINE_enum("precision", "fp32", list(PRECISIONS),
+                  "Learner precision, bf16 and fp16 run the learner's forward pass under autocast.")
+flags.DEFINE_enum("compile", "none", COMPILE_MODES,
+                  "Runs the learner's networks scripted (torch.jit.script) or compiled (torch.compile).")
+flags.DEFINE_bool("fused_adam", False, "Whether the learner uses the fused Adam implementation.")
+flags.DEFINE_bool("fake_env", False,
+                  "Train against the NumPy MoveToBeacon stand-in (sc2_agents/fake_env.py) instead of StarCraft II.")
+flags.DEFINE_enum("plot", "window", ["none", "file", "window"],
+                  "Where training metrics are drawn: nowhere, png/csv files in --plot_dir or a live window.")
+flags.DEFINE_string("plot_dir", "./data/metrics", "Directory for --plot=file.")
+flags.DEFINE_integer("eval_threads", 1,
+                     "With --train=False, how many threads play --parallel envs each, their greedy actions "
+                     "batched by one inference server.")
+flags.DEFINE_integer("inference_batch_size", 64, "Most screens the inference server runs in one forward pass.")
+flags.DEFINE_float("inference_max_wait_ms", 2.0,
+                   "How long the inference server waits for more screens before running a partial batch.")
 flags.DEFINE_string("map", "MoveToBeacon", "Name of a map to use.")
 flags.mark_flag_as_required("map")
 
 
-def run_thread(map_name, visualize):
-  with sc2_env.SC2Env(
+def make_env(map_name, visualize):
+  return sc2_env.SC2Env(
       map_name=map_name,
       agent_race=FLAGS.agent_race,
       bot_race=FLAGS.bot_race,
@@ -52,21 +94,81 @@ def run_thread(map_name, visualize):
       game_steps_per_episode=FLAGS.game_steps_per_episode,
       screen_size_px=(FLAGS.screen_resolution, FLAGS.screen_resolution),
       minimap_size_px=(FLAGS.minimap_resolution, FLAGS.minimap_resolution),
-      visualize=visualize) as env:
-    env = available_actions_printer.AvailableActionsPrinter(env)
-    agent = Agent()
+      visualize=visualize)
+
+
+def run_thread(map_name, visualize, inference=None, plot=None):
+  """Runs one agent over --parallel envs, only the first one is visualized."""
+  with contextlib.ExitStack() as stack:
+    if FLAGS.fake_env:
+      envs = []
+      env = BatchMoveToBeacon(FLAGS.parallel, screen_size=FLAGS.screen_resolution)
+    else:
+      envs = [stack.enter_context(make_env(map_name, visualize and i == 0)) for i in range(FLAGS.parallel)]
+      env = VecEnv([available_actions_printer.AvailableActionsPrinter(env) for env in envs])
+    metrics = stack.enter_context(contextlib.closing(make_sink(plot or FLAGS.plot, FLAGS.plot_dir)))
+    # evaluation threads act through the server's network, they restore no replay or checkpoint of their own
+    replay_path = None if inference else FLAGS.replay_path
+    checkpoint_path = None if inference else FLAGS.checkpoint_path
+    agent = Agent(replay_path=replay_path, device=FLAGS.device, num_threads=FLAGS.num_threads or None,
+                  metrics=metrics, checkpoint_path=checkpoint_path, inference=inference,
+                  precision=FLAGS.precision, compile_mode=FLAGS.compile, fused_adam=FLAGS.fused_adam,
+                  replay_shards=FLAGS.replay_shards)
     # run_loop([agent], env, FLAGS.max_agent_steps)
     agent.train(env, FLAGS.train)
-    if FLAGS.save_replay:
-      env.save_replay(Agent.__name__)
+    env.close()
+    if FLAGS.save_replay and envs:
+      envs[0].save_replay(Agent.__name__)
+
+def run_eval(map_name, visualize):
+  """Evaluates --eval_threads agents at once, one InferenceServer batches all their greedy actions."""
+  agent = Agent(device=FLAGS.device, num_threads=FLAGS.num_threads or None, checkpoint_path=FLAGS.checkpoint_path)
+  server = InferenceServer(agent._Q, agent._device, max_batch_size=FLAGS.inference_batch_size,
+                           max_wait=FLAGS.inference_max_wait_ms / 1000)
+  with contextlib.closing(server.start()):
+    threads = [threading.Thread(target=run_thread, args=(map_name, visualize and i == 0, server,
+                                                         None if i == 0 else "none"))
+               for i in range(FLAGS.eval_threads)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+  print(server)
+
+def run_apex(map_name):
+  """Trains DQNPERAgent as the learner of --actors actor processes."""
+  agent_fn = lambda: DQNPERAgent(replay_path=FLAGS.replay_path, device=FLAGS.device,
+                                 num_threads=FLAGS.num_threads or None, checkpoint_path=FLAGS.checkpoint_path,
+                                 precision=FLAGS.precision, compile_mode=FLAGS.compile,
+                                 fused_adam=FLAGS.fused_adam, replay_shards=FLAGS.replay_shards)
+  if FLAGS.fake_env:
+    env_fn = functools.partial(MoveToBeacon, FLAGS.screen_resolution)
+  else:
+    env_fn = functools.partial(make_env, map_name, False)
+  agent = apex.train(agent_fn, DQNPERCNN, env_fn, num_actors=FLAGS.actors,
+                     max_updates=FLAGS.max_updates)
+  torch.save(agent._Q.state_dict(), agent._Q_weights_path)
+  agent._memory.flush()
+  if agent._checkpointer is not None:
+    agent.checkpoint()
+    agent._checkpointer.wait()
+
 
 def main(unused_argv):
   """Run an agent."""
   stopwatch.sw.enabled = FLAGS.profile or FLAGS.trace
   stopwatch.sw.trace = FLAGS.trace
+  # the agents' hot path sections, reported every timings_report_frequency frames and added to stopwatch.sw
+  timings.enabled = stopwatch.sw.enabled
+  timings.stopwatch = stopwatch.sw
 
   maps.get(FLAGS.map)  # Assert the map exists.
-  run_thread(FLAGS.map, FLAGS.render)
+  if FLAGS.actors:
+    run_apex(FLAGS.map)
+  elif not FLAGS.train and FLAGS.eval_threads > 1:
+    run_eval(FLAGS.map, FLAGS.render)
+  else:
+    run_thread(FLAGS.map, FLAGS.render)
 
   if FLAGS.profile:
     print(stopwatch.sw)
@@ -0,0 +1,176 @@
+"""Ape-X style training: many actor processes feeding one prioritised learner.
+
+Every actor runs its own env and a CPU copy of the learner's network, which
+it refreshes from shared memory every `sync_every` steps. Transitions are
+shipped to the learner in batches, each with an initial priority computed
+by the actor. The learner owns the PrioritisedReplayMemory, trains on it and
+publishes its weights every `publish_every` updates. Everything runs on one
+box with local multiprocessing (fork start method, Linux only).
+"""
+import queue
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from utils.replay_memory import Transition
+from utils.timings import timings
+from sc2_agents.dqn_agent import get_env_action, select_friendly_action
+
+
+def actor_epsilon(actor_id, num_actors, epsilon=0.4, alpha=7):
+  """Exploration rate of each actor, spread between epsilon and epsilon ** (1 + alpha)."""
+  if num_actors == 1:
+    return epsilon
+  return epsilon ** (1 + alpha * actor_id / (num_actors - 1))
+
+
+class SharedWeights(object):
+  """The latest learner weights in shared memory, with a version actors poll."""
+  def __init__(self, network):
+    self.network = network
+    self.network.share_memory()
+    self.version = mp.Value("i", 0)
+    self.lock = mp.Lock()
+
+  def publish(self, state_dict):
+    with self.lock:
+      self.network.load_state_dict(state_dict)
+      self.version.value += 1
+
+  def pull(self, network, version):
+    """Copies the shared weights into network if they are newer than version."""
+    if self.version.value == version:
+      return version
+    with self.lock:
+      network.load_state_dict(self.network.state_dict())
+      return self.version.value
+
+
+def _send(actor_id, network, batch, gamma, transitions):
+  items = [transition for transition, _ in batch]
+  q = np.array([q for _, q in batch])
+  s_1 = torch.from_numpy(np.stack([transition.s_1 for transition in items])).float()
+  with torch.no_grad():
+    q_1 = network(s_1).view(len(items), -1).max(dim=1)[0].numpy()
+  r = np.array([transition.r for transition in items], dtype=np.float64)
+  done = np.array([transition.done for transition in items], dtype=np.float64)
+  errors = r + gamma * (1 - done) * q_1 - q
+  transitions.put((actor_id, items, errors))
+
+
+def run_actor(actor_id, num_actors, make_env, network, weights, transitions, stop, frames,
+              gamma=0.99, send_every=50, sync_every=400, screen_size=28):
+  torch.set_num_threads(1)
+  epsilon = actor_epsilon(actor_id, num_actors)
+  while weights.version.value == 0 and not stop.is_set():
+    time.sleep(0.1)
+  version = weights.pull(network, 0)
+  batch = []
+  steps = 0
+
+  with make_env() as env:
+    while not stop.is_set():
+      obs = env.reset()[0]
+      obs = env.step([select_friendly_action(obs)])[0]
+      while not obs.last() and not stop.is_set():
+        s = np.expand_dims(obs.observation["screen"][5], 0)
+        with torch.no_grad():
+          q = network(torch.from_numpy(s).unsqueeze(0).float()).view(-1).numpy()
+        if np.random.rand() > epsilon:
+          action = q.argmax()
+        else:
+          action = np.random.randint(0, screen_size * screen_size)
+        obs = env.step([get_env_action(action, obs, screen_size)])[0]
+
+        r = obs.reward
+        s1 = np.expand_dims(obs.observation["screen"][5], 0)
+        batch.append((Transition(s, action, s1, r, r > 0), q[action]))
+        steps += 1
+        if len(batch) == send_every:
+          _send(actor_id, network, batch, gamma, transitions)
+          with frames.get_lock():
+            frames.value += len(batch)
+          batch = []
+        if steps % sync_every == 0:
+          version = weights.pull(network, version)
+
+
+def train(agent_fn, network_fn, make_env, num_actors=4, max_updates=0, publish_every=100,
+          queue_size=64, send_every=50, sync_every=400):
+  """Trains agent_fn() as the learner with num_actors actor processes.
+
+  The actors are forked before the learner is built, so they never inherit
+  a CUDA context. agent_fn must build a DQNPERAgent-like learner exposing
+  _Q, _Qt, _memory, _prefetcher, _priorities, _scalars and train_q(), network_fn a CPU network of
+  the same architecture and make_env a pysc2 env usable as a context manager.
+  """
+  ctx = mp.get_context("fork")
+  weights = SharedWeights(network_fn())
+  transitions = ctx.Queue(maxsize=queue_size)
+  stop = ctx.Event()
+  frames = ctx.Value("l", 0)
+  actors = [ctx.Process(target=run_actor, name="actor-%s" % i,
+                        args=(i, num_actors, make_env, network_fn(), weights, transitions, stop, frames),
+                        kwargs={"send_every": send_every, "sync_every": sync_every})
+            for i in range(num_actors)]
+  for actor in actors:
+    actor.start()
+
+  agent = agent_fn()
+  memory = agent._memory
+  weights.publish(agent._Q.state_dict())
+  warm_up = min(agent.steps_before_training, memory.capacity)
+  target_update_frequency = max(agent.target_q_update_frequency // agent.train_q_per_step, 1)
+  checkpoint_frequency = max(agent.checkpoint_frequency // agent.train_q_per_step, 1)
+  updates = 0
+  start_time = time.time()
+  timings.reset()
+
+  try:
+    while not max_updates or updates < max_updates:
+      # block for transitions while warming up, afterwards only take what is ready
+      warming_up = len(memory) < warm_up
+      while True:
+        try:
+          actor_id, items, errors = transitions.get(block=warming_up, timeout=1)
+        except queue.Empty:
+          break
+        with agent._prefetcher.lock:
+          for item, error in zip(items, errors):
+            memory.push(item, stream=actor_id, error=error)
+        if warming_up:
+          break
+      if len(memory) < warm_up:
+        continue
+
+      agent.train_q()
+      updates += 1
+      if updates % publish_every == 0:
+        weights.publish(agent._Q.state_dict())
+      if updates % target_update_frequency == 0:
+        agent.sync_target()
+      if agent._checkpointer is not None and updates % checkpoint_frequency == 0:
+        agent.checkpoint()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    stop.set()
+    # actors may be blocked on a full queue, keep draining until they exit
+    while any(actor.is_alive() for actor in actors):
+      try:
+        transitions.get(timeout=0.1)
+      except queue.Empty:
+        pass
+    for actor in actors:
+      actor.join()
+    agent._prefetcher.close()
+    agent._priorities.close()
+    agent._scalars.flush()
+    elapsed_time = time.time() - start_time
+    print("Took %.3f seconds for %s actor frames: %.3f fps, %s learner updates: %.3f updates/s" % (
+        elapsed_time, frames.value, frames.value / elapsed_time, updates, updates / elapsed_time))
+    if timings.enabled:
+      print(timings.report(frames.value))
+  return agent
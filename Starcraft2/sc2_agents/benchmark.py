@@ -0,0 +1,351 @@
+"""Benchmarks for the replay memories and the agents' learner step.
+
+Every run uses a fixed seed and synthetic 28x28 MoveToBeacon screens, and
+writes its results as JSON so runs can be compared across commits:
+
+  PYTHONPATH=. python sc2_agents/benchmark.py --out before.json
+  PYTHONPATH=. python sc2_agents/benchmark.py --out after.json --compare before.json
+
+The replay benchmarks need neither StarCraft II nor pysc2, the learner
+benchmark imports the agents and so needs pysc2 installed. A 1e7 replay of
+agent screens takes ~30GB, run it memory mapped from a scratch directory:
+
+  PYTHONPATH=. python sc2_agents/benchmark.py --benchmarks replay --capacities 1e7 --memmap_dir /scratch
+
+--benchmarks solve trains DQNPERAgent on the NumPy MoveToBeacon (no pysc2
+needed beyond the agent imports) with and without importance sampling
+weights, and reports the frames each needed to reach --solve_score. It takes
+hours on a CPU, a solved field of false means the budget ran out first.
+
+--benchmarks env times the NumPy MoveToBeacon alone, game steps per second
+for each of --env_parallel games stepped together.
+
+--learner_modes times the learner in several modes side by side, e.g.
+
+  PYTHONPATH=. python sc2_agents/benchmark.py --benchmarks learner --learner_modes fp32,bf16,bf16+script+fused_adam
+"""
+import argparse
+import collections
+import contextlib
+import io
+import json
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from utils.replay_memory import ReplayMemory, PrioritisedReplayMemory, Transition
+from utils.precision import PRECISIONS, COMPILE_MODES
+
+MEMORIES = {
+  "uniform": ReplayMemory,
+  "prioritised": PrioritisedReplayMemory,
+}
+
+# network name -> (agent module, agent class)
+LEARNERS = {
+  "DQNCNN": ("sc2_agents.dqn_double_q_agent", "DQNDoubleQAgent"),
+  "DQNDuelingCNN": ("sc2_agents.dqn_dueling_agent", "DQNDuelingAgent"),
+  "DQNPERCNN": ("sc2_agents.dqn_per_agent", "DQNPERAgent"),
+}
+
+# pysc2's actions.FunctionCall, enough for the NumPy MoveToBeacon
+FunctionCall = collections.namedtuple("FunctionCall", ["function", "arguments"])
+_SELECT_ARMY = 7
+_MOVE_SCREEN = 331
+
+# fields that hold measurements, every other field identifies the result
+METRICS = ("per_second", "p50_ms", "p99_ms", "mean_ms", "frames", "episodes", "seconds", "solved")
+
+
+def seed(value):
+  random.seed(value)
+  np.random.seed(value)
+  torch.manual_seed(value)
+
+
+def synthetic_screens(count, screen_size=28, seed=0):
+  """`count` player_relative screens (1 x size x size int32) of a marine walking to a beacon."""
+  rng = np.random.RandomState(seed)
+  screens = np.zeros((count, 1, screen_size, screen_size), dtype=np.int32)
+  marine = rng.randint(screen_size, size=2)
+  beacon = rng.randint(1, screen_size - 1, size=2)
+  for i in range(count):
+    marine = np.clip(marine + rng.randint(-1, 2, size=2), 0, screen_size - 1)
+    screens[i, 0, beacon[1] - 1:beacon[1] + 2, beacon[0] - 1:beacon[0] + 2] = 3
+    screens[i, 0, marine[1], marine[0]] = 1
+  return screens
+
+
+def transitions(screens, count, episode_length=100):
+  """Yields `count` transitions walking through screens, chained so dedup_frames can share them."""
+  rng = np.random.RandomState(1)
+  actions = rng.randint(screens.shape[-1] ** 2, size=count)
+  rewards = (rng.rand(count) < 0.05).astype(np.float64)
+  for i in range(count):
+    done = (i + 1) % episode_length == 0
+    yield Transition(screens[i % len(screens)], actions[i], screens[(i + 1) % len(screens)], rewards[i], done)
+
+
+def latencies(fn, repeats):
+  times = []
+  for _ in range(repeats):
+    start_time = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start_time)
+  times = np.array(times) * 1000
+  return {
+    "p50_ms": float(np.percentile(times, 50)),
+    "p99_ms": float(np.percentile(times, 99)),
+    "mean_ms": float(times.mean()),
+  }
+
+
+def bench_replay(kind, capacity, batch_sizes, repeats, max_fill, screens, memmap_dir=None):
+  """Push rate while filling, then sample latency (and priority update latency) per batch size."""
+  seed(0)
+  path = tempfile.mkdtemp(dir=memmap_dir) if memmap_dir else None
+  try:
+    return _bench_replay(MEMORIES[kind](capacity=capacity, dedup_frames=True, path=path),
+                         kind, batch_sizes, repeats, max_fill, screens)
+  finally:
+    if path:
+      shutil.rmtree(path)
+
+
+def _bench_replay(memory, kind, batch_sizes, repeats, max_fill, screens):
+  capacity = memory.capacity
+  fill = min(capacity, max_fill)
+  start_time = time.perf_counter()
+  for transition in transitions(screens, fill):
+    memory.push(transition)
+  push_time = time.perf_counter() - start_time
+  common = {"memory": kind, "capacity": capacity, "filled": len(memory), "memmap": memory.path is not None}
+  results = [dict(common, benchmark="push", per_second=fill / push_time)]
+
+  for batch_size in batch_sizes:
+    if batch_size > len(memory):
+      continue
+    results.append(dict(common, benchmark="sample", batch_size=batch_size,
+                        **latencies(lambda: memory.sample(batch_size), repeats)))
+    if kind == "prioritised":
+      _, indices = memory.sample(batch_size)
+      errors = np.random.randn(batch_size)
+      timing = latencies(lambda: memory.update(indices, errors), repeats)
+      results.append(dict(common, benchmark="update", batch_size=batch_size,
+                          per_second=batch_size / (timing["mean_ms"] / 1000), **timing))
+  return results
+
+
+def parse_mode(mode):
+  """Splits a learner mode such as bf16+script+fused_adam into the agents' keyword arguments."""
+  kwargs = {"precision": "fp32", "compile_mode": "none", "fused_adam": False}
+  for part in mode.split("+"):
+    if part in PRECISIONS:
+      kwargs["precision"] = part
+    elif part in COMPILE_MODES:
+      kwargs["compile_mode"] = part
+    elif part == "fused_adam":
+      kwargs["fused_adam"] = True
+    else:
+      raise ValueError("unknown learner mode %s" % part)
+  return kwargs
+
+
+def bench_learner(network, batch_size, steps, device, screens, mode="fp32"):
+  """Learner steps per second of the agent owning network in a learner mode, train_q on a synthetic replay."""
+  import importlib
+  module, agent_name = LEARNERS[network]
+  seed(0)
+  agent = getattr(importlib.import_module(module), agent_name)(device=device, **parse_mode(mode))
+  agent.train_q_batch_size = batch_size
+  for transition in transitions(screens, 4 * batch_size):
+    agent._memory.push(transition)
+  try:
+    # warm up, starts the prefetcher and leaves torch.compile time out of the timings
+    agent.train_q()
+    agent.train_q()
+    timing = latencies(agent.train_q, steps)
+  finally:
+    agent._prefetcher.close()
+    if agent._priorities is not None:
+      agent._priorities.close()
+
+  s = torch.from_numpy(screens[:1]).float().to(agent._device)
+  if s.device.type == "cpu":
+    s = s.contiguous(memory_format=torch.channels_last)
+  with torch.no_grad(), agent._precision.autocast():
+    agent._Q_learner(s)
+    forward = latencies(lambda: agent._Q_learner(s), steps)
+  common = dict(network=network, device=str(agent._device), mode=mode, threads=torch.get_num_threads())
+  return [
+    dict(common, benchmark="learner", batch_size=batch_size, per_second=1000 / timing["mean_ms"], **timing),
+    dict(common, benchmark="forward", batch_size=1, **forward),
+  ]
+
+
+def bench_env(parallel, steps, screen_size):
+  """Game steps per second of a BatchMoveToBeacon of `parallel` games moving to random targets."""
+  from sc2_agents.fake_env import BatchMoveToBeacon
+  seed(0)
+  env = BatchMoveToBeacon(parallel, screen_size=screen_size, seed=0)
+  env.reset()
+  env.step([FunctionCall(_SELECT_ARMY, [[0]])] * parallel)
+  targets = np.random.randint(screen_size, size=(steps, parallel, 2))
+  start_time = time.perf_counter()
+  for i in range(steps):
+    timesteps = env.step([FunctionCall(_MOVE_SCREEN, [[0], target]) for target in targets[i]])
+    ended = [j for j, timestep in enumerate(timesteps) if timestep.last()]
+    if ended:
+      env.reset(ended)
+      env.step([FunctionCall(_SELECT_ARMY, [[0]])] * len(ended), ended)
+  seconds = time.perf_counter() - start_time
+  return [dict(benchmark="env", parallel=parallel, per_second=parallel * steps / seconds)]
+
+
+def bench_solve(importance_sampling, learning_rate, solve_score, solve_window, max_frames, parallel,
+                epsilon_increment, batch_size, device):
+  """Frames DQNPERAgent needs on the NumPy MoveToBeacon until its last solve_window episodes
+  average solve_score, with or without importance sampling weights in the loss."""
+  from sc2_agents.dqn_per_agent import DQNPERAgent
+  from sc2_agents.fake_env import BatchMoveToBeacon
+  Agent = type("SolveAgent", (DQNPERAgent,), {
+    "weights_path": "", "max_frames": max_frames, "plot_frequency": 0, "importance_sampling": importance_sampling,
+    "learning_rate": learning_rate, "solve_score": solve_score, "solve_window": solve_window})
+  seed(0)
+  agent = Agent(device=device)
+  agent._epsilon._update_increment = epsilon_increment
+  agent.train_q_batch_size = batch_size
+  start_time = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()):
+    agent.run_loop(BatchMoveToBeacon(parallel, seed=0), max_frames)
+  return [dict(benchmark="solve", network="DQNPERCNN", device=str(agent._device),
+               importance_sampling=importance_sampling, learning_rate=learning_rate, solve_score=solve_score,
+               batch_size=batch_size, solved=bool(agent.solved()), frames=agent.frames,
+               episodes=len(agent.episode_scores), seconds=time.perf_counter() - start_time)]
+
+
+def metadata(args):
+  try:
+    commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    commit = None
+  return {
+    "commit": commit,
+    "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "python": platform.python_version(),
+    "numpy": np.__version__,
+    "torch": torch.__version__,
+    "machine": platform.machine(),
+    "processor": platform.processor(),
+    "args": vars(args),
+  }
+
+
+def key(result):
+  return tuple(sorted((k, v) for k, v in result.items() if k not in METRICS))
+
+
+def compare(results, baseline):
+  """Prints the speed up of every result over the matching baseline result."""
+  baseline = {key(result): result for result in baseline}
+  for result in results:
+    old = baseline.get(key(result))
+    if old is None:
+      continue
+    if "per_second" in result:
+      ratio, metric = result["per_second"] / old["per_second"], "per_second"
+    elif "frames" in result:
+      ratio, metric = old["frames"] / result["frames"], "frames"
+    else:
+      ratio, metric = old["p50_ms"] / result["p50_ms"], "p50_ms"
+    name = " ".join("%s=%s" % (k, v) for k, v in key(result) if k != "filled")
+    print("%-80s %s %10.3f -> %10.3f  x%.2f" % (name, metric, old[metric], result[metric], ratio))
+
+
+def run(args):
+  screens = synthetic_screens(10000, args.screen_size)
+  results = []
+  if "replay" in args.benchmarks:
+    for kind in args.memories:
+      for capacity in args.capacities:
+        results += bench_replay(kind, capacity, args.batch_sizes, args.repeats, args.max_fill, screens,
+                                args.memmap_dir)
+        print(results[-1])
+  if "learner" in args.benchmarks:
+    for network in args.networks:
+      base = None
+      for mode in args.learner_modes:
+        results += bench_learner(network, args.learner_batch_size, args.learner_steps, args.device, screens, mode)
+        base = base or results[-2]
+        print(results[-2], "x%.2f over %s" % (results[-2]["per_second"] / base["per_second"], base["mode"]))
+  if "env" in args.benchmarks:
+    for parallel in args.env_parallel:
+      results += bench_env(parallel, args.env_steps, args.screen_size)
+      print(results[-1])
+  if "solve" in args.benchmarks:
+    for learning_rate in args.solve_learning_rates:
+      for importance_sampling in [False, True]:
+        results += bench_solve(importance_sampling, learning_rate, args.solve_score, args.solve_window,
+                               args.solve_max_frames, args.solve_parallel, args.solve_epsilon_increment,
+                               args.solve_batch_size, args.device)
+        print(results[-1])
+  return results
+
+
+def parse_args(argv=None):
+  ints = lambda value: [int(float(v)) for v in value.split(",")]
+  names = lambda value: value.split(",")
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--out", help="Where to write the JSON results.")
+  parser.add_argument("--compare", help="JSON results of an earlier run to compare against.")
+  parser.add_argument("--benchmarks", type=names, default=["replay", "learner"])
+  parser.add_argument("--memories", type=names, default=list(MEMORIES))
+  parser.add_argument("--capacities", type=ints, default=[1000, 10000, 100000, 1000000])
+  parser.add_argument("--batch_sizes", type=ints, default=[32, 64, 128, 256, 512, 1024])
+  parser.add_argument("--max_fill", type=int, default=200000,
+                      help="Transitions pushed per memory, larger capacities are sampled partly filled.")
+  parser.add_argument("--memmap_dir", help="Keep the replay memories memory mapped in a temporary directory here.")
+  parser.add_argument("--repeats", type=int, default=200)
+  parser.add_argument("--networks", type=names, default=list(LEARNERS))
+  parser.add_argument("--learner_batch_size", type=int, default=256)
+  parser.add_argument("--learner_steps", type=int, default=10)
+  parser.add_argument("--learner_modes", type=names, default=["fp32"],
+                      help="Learner modes to time, precision (fp32, bf16, fp16) joined by + with script, "
+                           "compile or fused_adam, e.g. fp32,bf16,bf16+script+fused_adam.")
+  parser.add_argument("--env_parallel", type=ints, default=[1, 8, 64])
+  parser.add_argument("--env_steps", type=int, default=2000)
+  floats = lambda value: [float(v) for v in value.split(",")]
+  parser.add_argument("--solve_learning_rates", type=floats, default=[1e-8, 1e-5])
+  parser.add_argument("--solve_score", type=float, default=20,
+                      help="Mean episode score that counts as solving the NumPy MoveToBeacon.")
+  parser.add_argument("--solve_window", type=int, default=100)
+  parser.add_argument("--solve_max_frames", type=int, default=2000000)
+  parser.add_argument("--solve_parallel", type=int, default=8)
+  parser.add_argument("--solve_batch_size", type=int, default=256)
+  parser.add_argument("--solve_epsilon_increment", type=float, default=0.002,
+                      help="Per episode epsilon decay, faster than the agents' own to keep the runs short.")
+  parser.add_argument("--device", default="cpu")
+  parser.add_argument("--screen_size", type=int, default=28)
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  args = parse_args(argv)
+  results = run(args)
+  if args.out:
+    with open(args.out, "w") as f:
+      json.dump({"meta": metadata(args), "results": results}, f, indent=1)
+  if args.compare:
+    with open(args.compare) as f:
+      compare(results, json.load(f)["results"])
+  return results
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,49 @@
+from utils.checkpoint import Checkpointer, snapshot
+from utils.timings import timings
+
+
+class CheckpointMixin(object):
+  """Periodic, asynchronous checkpoints of a DQN agent's learner.
+
+  A checkpoint holds _Q, _Qt, the optimizer state, epsilon and (when
+  checkpoint_replay is set) the replay memory. A memory mapped replay is
+  only flushed, it is already on disk. Expects _Q, _Qt, _optimizer,
+  _epsilon, _memory, _prefetcher and _device on the agent.
+  """
+  checkpoint_frequency = 100000
+  checkpoint_replay = True
+
+  def _init_checkpoints(self, checkpoint_path):
+    """Restores checkpoint_path if it exists, later checkpoints are written there."""
+    self._checkpointer = Checkpointer(checkpoint_path) if checkpoint_path else None
+    if self._checkpointer is not None and self._checkpointer.exists():
+      self.restore_checkpoint()
+
+  def checkpoint(self):
+    """Snapshots the learner on this thread, the checkpointer serialises it in the background."""
+    with timings("checkpoint"):
+      state = snapshot({
+        "Q": self._Q.state_dict(),
+        "Qt": self._Qt.state_dict(),
+        "optimizer": self._optimizer.state_dict(),
+        "epsilon": self._epsilon.state_dict(),
+      })
+      replay = None
+      if self.checkpoint_replay:
+        with self._prefetcher.lock:
+          if self._memory.path is not None:
+            self._memory.flush()
+          else:
+            replay = self._memory.state_dict()
+      self._checkpointer.save(state, replay)
+
+  def restore_checkpoint(self):
+    state, replay = self._checkpointer.load(map_location=self._device)
+    self._Q.load_state_dict(state["Q"])
+    self._Qt.load_state_dict(state["Qt"])
+    self._optimizer.load_state_dict(state["optimizer"])
+    self._epsilon.load_state_dict(state["epsilon"])
+    # a resumed memory mapped replay is newer than the checkpoint's copy
+    if replay is not None and len(self._memory) == 0:
+      self._memory.load_state_dict(replay)
+    print("Resuming checkpoint:", self._checkpointer.path, len(self._memory), "transitions")
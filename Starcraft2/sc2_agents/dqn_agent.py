@@ -0,0 +1,422 @@
+from pysc2.agents.base_agent import BaseAgent
+
+from utils.epsilon import Epsilon
+import contextlib
+import time
+import numpy as np
+import os.path
+from utils.prefetcher import BatchPrefetcher, PriorityWriter
+from utils.timings import timings
+from utils.metrics import NullSink, DeferredScalars
+from sc2_agents.checkpointing import CheckpointMixin
+from utils.device import get_device, to_device, as_tensor
+from utils.precision import MixedPrecision, compile_network, make_adam
+from sc2_agents.vec_env import BatchEnv, VecEnv, frames_crossed
+from utils.replay_memory import ReplayMemory, Transition, PrioritisedReplayMemory, ShardedReplayMemory
+
+import torch
+import torch.nn as nn
+from torch.autograd import Variable
+
+from pysc2.lib import actions
+from pysc2.lib import features
+
+
+_PLAYER_RELATIVE = features.SCREEN_FEATURES.player_relative.index
+_PLAYER_FRIENDLY = 1
+_PLAYER_NEUTRAL = 3  # beacon/minerals
+_PLAYER_HOSTILE = 4
+_NO_OP = actions.FUNCTIONS.no_op.id
+_MOVE_SCREEN = actions.FUNCTIONS.Move_screen.id
+_ATTACK_SCREEN = actions.FUNCTIONS.Attack_screen.id
+_SELECT_ARMY = actions.FUNCTIONS.select_army.id
+_NOT_QUEUED = [0]
+_SELECT_ALL = [0]
+_SELECT_POINT = actions.FUNCTIONS.select_point.id
+
+
+def get_env_action(action, obs, screen_size):
+  action = np.unravel_index(action, [1, screen_size, screen_size])
+  target = [action[2], action[1]]
+  command = _MOVE_SCREEN #action[0]   # removing unit selection out of the equation
+  # if command == 0:
+  #   command = _SELECT_POINT
+  # else:
+  #   command = _MOVE_SCREEN
+
+  if command in obs.observation["available_actions"]:
+    return actions.FunctionCall(command, [[0], target])
+  else:
+    return actions.FunctionCall(_NO_OP, [])
+
+
+def select_friendly_action(obs):
+  player_relative = obs.observation["screen"][_PLAYER_RELATIVE]
+  friendly_y, friendly_x = (player_relative == _PLAYER_FRIENDLY).nonzero()
+  target = [int(friendly_x.mean()), int(friendly_y.mean())]
+  return actions.FunctionCall(_SELECT_POINT, [[0], target])
+
+
+class DQNAgent(CheckpointMixin, BaseAgent):
+  """Double Q learning on the MoveToBeacon screen, the engine of the SC2 DQN agents.
+
+  Acting, the run loop, replay prefetching, device handling, checkpoints and
+  metrics live here. The agents are configurations of it:
+    network: the nn.Module class of _Q and _Qt
+    weights_path: where the trained _Q is saved and loaded from
+    max_frames, epsilon_end: training length and final exploration rate
+    plot_frequency: frames between screen/action plots, 0 to never plot
+    learning_rate: Adam's learning rate
+    make_memory(replay_path): the replay memory, a PrioritisedReplayMemory gets TD error priorities
+      and, with importance_sampling set, importance sampling weights for the loss
+    sync_target(): the target network update, every target_q_update_frequency frames
+    td_target(r, done, Q_1, Qt): the bootstrapped target y
+    td_loss(Q, y, indices, weights): the loss, indices and weights come with prioritised batches
+
+  The run loop stops early once the mean score of the last solve_window
+  episodes reaches solve_score, when that is set. With replay_shards > 1
+  the replay is that many make_memory() shards behind a ShardedReplayMemory,
+  env i pushing into shard i % replay_shards without a global lock.
+  """
+  network = None
+  weights_path = None
+  max_frames = 2000000
+  epsilon_end = 0.1
+  plot_frequency = 1000
+  learning_rate = 1e-8
+  importance_sampling = False
+  solve_score = None
+  solve_window = 100
+
+  def __init__(self, replay_path=None, device=None, num_threads=None, metrics=None,
+               checkpoint_path=None, inference=None, precision="fp32", compile_mode="none", fused_adam=False,
+               replay_shards=1):
+    super(DQNAgent, self).__init__()
+    self.training = False
+    self._epsilon = Epsilon(start=1.0, end=self.epsilon_end, update_increment=0.0001)
+    self.gamma = 0.99
+    self.train_q_per_step = 4
+    self.train_q_batch_size = 256
+    self.steps_before_training = 10000
+    self.target_q_update_frequency = 50000
+    self.prefetch_depth = 4
+    self.timings_report_frequency = 10000
+    self.metrics_flush_frequency = 100
+    self._device = get_device(device, num_threads)
+    # halves the learner's kernel launches on a GPU, on the CPU backpropagating through
+    # the s_1 half costs more than the second pass saves
+    self.fuse_online_pass = self._device.type == "cuda"
+
+    self._Q_weights_path = self.weights_path
+    self._Q = self.network()
+    if os.path.isfile(self._Q_weights_path):
+      self._Q.load_state_dict(torch.load(self._Q_weights_path, map_location=self._device))
+      print("Loading weights:", self._Q_weights_path)
+    self._Qt = self.network()
+
+    self._Qt.load_state_dict(self._Q.state_dict())
+    for param in self._Qt.parameters():
+      param.requires_grad = False
+    to_device(self._Q, self._device)
+    to_device(self._Qt, self._device)
+    self._optimizer = make_adam(self._Q.parameters(), lr=self.learning_rate, fused=fused_adam)
+    # opt-in learner mode: train_q runs these scripted or compiled views of _Q and _Qt under autocast
+    self._precision = MixedPrecision(self._device, precision)
+    self._Q_learner = compile_network(self._Q, compile_mode)
+    self._Qt_learner = compile_network(self._Qt, compile_mode)
+    self._criterion = nn.MSELoss()
+    self._memory = self.make_sharded_memory(replay_path, replay_shards)
+    self.sharded = isinstance(self._memory, ShardedReplayMemory)
+    self.prioritised = self._memory.prioritised if self.sharded else isinstance(self._memory, PrioritisedReplayMemory)
+    self._init_checkpoints(checkpoint_path)
+    if len(self._memory) >= min(self.steps_before_training, self._memory.capacity):
+      # resumed from a memory mapped replay or a checkpoint, no need to warm it up again
+      print("Resuming replay memory:", len(self._memory))
+      self.steps_before_training = 0
+    # a sharded memory locks each shard itself, pushes only wait on the sampler while it reads their shard
+    lock = contextlib.nullcontext() if self.sharded else None
+    self._prefetcher = BatchPrefetcher(self._sample_batch, self._batch_to_tensors, depth=self.prefetch_depth,
+                                       lock=lock)
+    self._priorities = PriorityWriter(self._memory.update, self._prefetcher.lock) if self.prioritised else None
+
+    self._metrics = metrics or NullSink()
+    # loss and max Q stay on the device until metrics_flush_frequency of them are queued
+    self._scalars = DeferredScalars(self._metrics, ["loss", "max_q"], every=self.metrics_flush_frequency)
+    # greedy actions from a shared InferenceServer when evaluating
+    self._inference = inference
+    self._action = None
+    self._screen = None
+    self.episode_scores = []
+    self.frames = 0
+
+    self._screen_size = 28
+
+  def make_memory(self, replay_path):
+    return ReplayMemory(capacity=100000, dedup_frames=True, path=replay_path)
+
+  def make_sharded_memory(self, replay_path, shards):
+    """make_memory() once per shard (each in its own replay_path subdirectory) behind a ShardedReplayMemory."""
+    if shards == 1:
+      return self.make_memory(replay_path)
+    return ShardedReplayMemory([
+        self.make_memory(os.path.join(replay_path, "shard%s" % i) if replay_path else None)
+        for i in range(shards)])
+
+  def get_env_action(self, action, obs):
+    return get_env_action(action, obs, self._screen_size)
+
+  def _serving(self):
+    return self._inference is not None and not self._epsilon.isTraining
+
+  '''
+    :param
+      s = obs.observation["screen"]
+    :returns
+      action = argmax action
+  '''
+  def get_action(self, s):
+    # greedy
+    if np.random.rand() > self._epsilon.value():
+      # print("greedy action")
+      if self._serving():
+        return self._inference.act(np.expand_dims(s, 0))[0]
+      s = Variable(as_tensor(np.expand_dims(s, 0), self._device))
+      self._action = self._Q(s).squeeze().cpu().data.numpy()
+      return self._action.argmax()
+    # explore
+    else:
+      # print("random choice")
+      # action = np.random.choice([0, 1])
+      action = 0
+      target = np.random.randint(0, self._screen_size, size=2)
+      return action * self._screen_size*self._screen_size + target[0] * self._screen_size + target[1]
+
+  @timings.decorate("select_action")
+  def get_actions(self, s):
+    """Epsilon greedy actions for a batch of screens, one forward pass for all greedy rows."""
+    size = self._screen_size
+    actions = np.random.randint(0, size * size, size=s.shape[0])
+    greedy = np.random.rand(s.shape[0]) > self._epsilon.value()
+    if greedy.any() and self._serving():
+      actions[greedy] = self._inference.act(s[greedy])
+    elif greedy.any():
+      q = self._Q(Variable(as_tensor(s[greedy], self._device)))
+      self._action = q[0].squeeze().cpu().data.numpy()
+      actions[greedy] = q.view(q.size()[0], -1).max(dim=1)[1].cpu().data.numpy()
+    return actions
+
+  def select_friendly_action(self, obs):
+    return select_friendly_action(obs)
+
+
+  def train(self, env, training=True):
+    self._epsilon.isTraining = training
+    self.run_loop(env, self.max_frames)
+    if self._epsilon.isTraining:
+      with timings("checkpoint"):
+        torch.save(self._Q.state_dict(), self._Q_weights_path)
+        self._memory.flush()
+      if self._checkpointer is not None:
+        self.checkpoint()
+        self._checkpointer.wait()
+
+  def reset_envs(self, envs, indices):
+    """Resets the envs at indices and selects the friendly unit in each.
+
+    Unit selection is removed from the equation by selecting the friendly on every new game.
+    """
+    obs = envs.reset(indices)
+    obs = envs.step([self.select_friendly_action(o) for o in obs], indices)
+    for _ in indices:
+      self.reset()
+    return obs
+
+  def run_loop(self, env, max_frames=0):
+    """A run loop to have agents and an environment interact.
+
+    env is either a single pysc2 env or a BatchEnv such as VecEnv, whose N
+    envs are stepped together with one batched forward pass per tick. Every
+    env pushes into the shared replay memory as its own stream.
+    """
+    envs = env if isinstance(env, BatchEnv) else VecEnv([env])
+    total_frames = 0
+    start_time = time.time()
+
+    action_spec = envs.action_spec()
+    observation_spec = envs.observation_spec()
+
+    self.setup(observation_spec, action_spec)
+    self._metrics.start()
+    timings.reset(total_frames)
+
+    try:
+      obs = self.reset_envs(envs, range(len(envs)))
+      scores = np.zeros(len(envs))
+      while True:
+        if max_frames and total_frames >= max_frames:
+          print("max frames reached")
+          return
+        if self.solved():
+          print("solved after", total_frames, "frames")
+          return
+
+        self._screen = obs[0].observation["screen"][5]
+        s = np.stack([np.expand_dims(o.observation["screen"][5], 0) for o in obs])
+        actions = self.get_actions(s)
+        env_actions = [self.get_env_action(action, o) for action, o in zip(actions, obs)]
+        with timings("env_step"):
+          obs = envs.step(env_actions)
+        previous_frames = total_frames
+        total_frames += len(envs)
+        scores += [o.reward for o in obs]
+
+        if self._epsilon.isTraining:
+          with self._prefetcher.lock, timings("push"):
+            for i, o in enumerate(obs):
+              r = o.reward
+              s1 = np.expand_dims(o.observation["screen"][5], 0)
+              done = r > 0
+              self._memory.push(Transition(s[i], actions[i], s1, r, done), stream=i)
+
+        ended = [i for i, o in enumerate(obs) if o.last()]
+        for i in ended:
+          print("total frames:", total_frames, "Epsilon:", self._epsilon.value())
+          self._epsilon.increment()
+          self.episode_scores.append(scores[i])
+          scores[i] = 0
+        if ended:
+          for i, o in zip(ended, self.reset_envs(envs, ended)):
+            obs[i] = o
+
+        if total_frames > self.steps_before_training and self._epsilon.isTraining:
+          for _ in range(frames_crossed(previous_frames, total_frames, self.train_q_per_step)):
+            self.train_q()
+
+          if frames_crossed(previous_frames, total_frames, self.target_q_update_frequency):
+            with timings("target_sync"):
+              self.sync_target()
+
+          if self.plot_frequency and frames_crossed(previous_frames, total_frames, self.plot_frequency):
+            self.plot()
+
+        if self.plot_frequency and not self._epsilon.isTraining and frames_crossed(previous_frames, total_frames, 3):
+          self.plot()
+
+        if (self._checkpointer is not None and self._epsilon.isTraining and
+            frames_crossed(previous_frames, total_frames, self.checkpoint_frequency)):
+          self.checkpoint()
+
+        if timings.enabled and frames_crossed(previous_frames, total_frames, self.timings_report_frequency):
+          print(timings.report(total_frames))
+
+    except KeyboardInterrupt:
+      pass
+    finally:
+      self.frames = total_frames
+      print("finished")
+      elapsed_time = time.time() - start_time
+      print("Took %.3f seconds for %s steps: %.3f fps" % (
+          elapsed_time, total_frames, total_frames / elapsed_time))
+      print("replay memory: %s transitions, %s bytes per transition" % (
+          len(self._memory), self._memory.bytes_per_transition()))
+      self._prefetcher.close()
+      print(self._prefetcher)
+      self._scalars.flush()
+      if self._priorities is not None:
+        self._priorities.close()
+        print(self._priorities)
+      if timings.enabled and timings.stats():
+        print(timings.report(total_frames))
+      if envs is not env:
+        envs.close()
+
+  def solved(self):
+    window = self.episode_scores[-self.solve_window:]
+    return (self.solve_score is not None and len(window) == self.solve_window and
+            np.mean(window) >= self.solve_score)
+
+  def sync_target(self):
+    """Copies _Q into _Qt, and flushes a memory mapped replay alongside."""
+    self._Qt.load_state_dict(self._Q.state_dict())
+    with self._prefetcher.lock:
+      self._memory.flush()
+    self._Qt.train()
+
+  @timings.decorate("plot")
+  def plot(self):
+    """Hands the latest screen and action to the metrics sink, which draws them off this thread."""
+    self._metrics.image("screen", self._screen)
+    self._metrics.image("action", self._action)
+
+  @timings.decorate("sample")
+  def _sample_batch(self):
+    """Returns (transition, indices, weights), indices are None for uniform batches, weights
+    unless importance_sampling is set."""
+    if not self.prioritised:
+      return self._memory.sample(self.train_q_batch_size), None, None
+    if self.importance_sampling:
+      transition, [indices, weights] = self._memory.sample(self.train_q_batch_size, weights=True)
+      return transition, indices, weights
+    transition, indices = self._memory.sample(self.train_q_batch_size)
+    return transition, indices, None
+
+  @timings.decorate("transfer")
+  def _batch_to_tensors(self, batch):
+    """Runs on the prefetch thread, so the host to device copies overlap with training."""
+    transition, indices, weights = batch
+    s, a, s_1, r, done = transition
+    s = as_tensor(s, self._device)
+    a = as_tensor(a, self._device, torch.long)
+    s_1 = as_tensor(s_1, self._device)
+    r = as_tensor(r, self._device)
+    done = as_tensor(1 - done, self._device)
+    if weights is not None:
+      weights = as_tensor(weights, self._device)
+    return [s, a, s_1, r, done], indices, weights
+
+  def td_target(self, r, done, Q_1, Qt):
+    """Double Q: _Q picks the best next action, _Qt values it."""
+    best_action = Q_1.detach().max(dim=1, keepdim=True)[1]
+    return r + done * self.gamma * Qt.gather(1, best_action)
+    # Q
+    # return r + done * self.gamma * Qt.max(dim=1)[0].unsqueeze(1)
+
+  def td_loss(self, Q, y, indices, weights):
+    """Mean squared TD error, each one scaled by its importance sampling weight when given."""
+    error = Q - y
+    if indices is not None:
+      with timings("priority_update"):
+        self._priorities.put(indices, error.detach().view(-1))
+    if weights is None:
+      return self._criterion(Q, y)
+    return (weights * error ** 2).mean()
+
+  def train_q(self):
+    if self.train_q_batch_size >= len(self._memory):
+      return
+
+    with timings("prefetch_wait"):
+      transition, indices, weights = self._prefetcher.start().get()
+    s, a, s_1, r, done = [Variable(t) for t in transition]
+
+    # Q_sa = r + gamma * max(Q_s'a')
+    with timings("forward"), self._precision.autocast():
+      if self.fuse_online_pass:
+        # one pass of the online network over s and s_1
+        Q, Q_1 = self._Q_learner(torch.cat([s, s_1])).view(2 * self.train_q_batch_size, -1).chunk(2)
+      else:
+        Q = self._Q_learner(s).view(self.train_q_batch_size, -1)
+        with torch.no_grad():
+          Q_1 = self._Q_learner(s_1).view(self.train_q_batch_size, -1)
+      Q = Q.gather(1, a)
+
+      Qt = self._Qt_learner(s_1).view(self.train_q_batch_size, -1)
+      y = self.td_target(r, done, Q_1, Qt)
+
+      loss = self.td_loss(Q, y, indices, weights)
+      self._scalars.add(loss.sum(), Q.max())
+    with timings("backward"):
+      self._optimizer.zero_grad()   # zero the gradient buffers
+      self._precision.backward(loss)
+    with timings("optimizer_step"):
+      self._precision.step(self._optimizer)
@@ -0,0 +1,186 @@
+"""A pure NumPy stand-in for the MoveToBeacon minigame, no StarCraft II needed.
+
+Implements the part of the pysc2 env interface the agents use: reset, step,
+action_spec, observation_spec and timesteps with observation["screen"],
+observation["available_actions"], reward and last(). A marine moves towards
+Move_screen targets at a fixed speed, touching the beacon scores 1 and
+respawns the beacon somewhere else. Only the player_relative and selected
+screen layers are drawn.
+
+BatchMoveToBeacon steps N games at once with array ops, a BatchEnv like
+VecEnv so run_loop takes it as is.
+"""
+import collections
+
+import numpy as np
+
+from sc2_agents.vec_env import BatchEnv
+
+# ids and layer indices as in pysc2
+_NO_OP = 0
+_SELECT_POINT = 2
+_SELECT_ARMY = 7
+_MOVE_SCREEN = 331
+_SCREEN_LAYERS = 17
+_PLAYER_RELATIVE = 5
+_SELECTED = 7
+_PLAYER_FRIENDLY = 1
+_PLAYER_NEUTRAL = 3
+
+_UNSELECTED_ACTIONS = np.array([_NO_OP, _SELECT_POINT, _SELECT_ARMY], dtype=np.int32)
+_SELECTED_ACTIONS = np.array([_NO_OP, _SELECT_POINT, _SELECT_ARMY, _MOVE_SCREEN], dtype=np.int32)
+
+
+class StepType(object):
+  FIRST = 0
+  MID = 1
+  LAST = 2
+
+
+class TimeStep(collections.namedtuple("TimeStep", ["step_type", "reward", "discount", "observation"])):
+  """Mirrors pysc2.env.environment.TimeStep."""
+  def first(self):
+    return self.step_type == StepType.FIRST
+
+  def mid(self):
+    return self.step_type == StepType.MID
+
+  def last(self):
+    return self.step_type == StepType.LAST
+
+
+class BatchMoveToBeacon(BatchEnv):
+  """N MoveToBeacon games stepped together, one timestep per game.
+
+  Positions are continuous screen coordinates (x, y). The marine moves up to
+  `speed` pixels a step and an episode lasts `episode_length` steps, the
+  real minigame is 120 seconds, 336 agent steps at step_mul 8.
+  """
+  def __init__(self, num_envs=1, screen_size=28, episode_length=336, speed=2.0,
+               beacon_radius=2, marine_radius=1, seed=None):
+    self.num_envs = num_envs
+    self.screen_size = screen_size
+    self.episode_length = episode_length
+    self.speed = speed
+    self.beacon_radius = beacon_radius
+    self.marine_radius = marine_radius
+    self._random = np.random.RandomState(seed)
+
+    self._marine = np.zeros((num_envs, 2))
+    self._target = np.zeros((num_envs, 2))
+    self._beacon = np.zeros((num_envs, 2))
+    self._selected = np.zeros(num_envs, dtype=np.bool_)
+    self._steps = np.zeros(num_envs, dtype=np.int64)
+    self._y, self._x = np.mgrid[0:screen_size, 0:screen_size]
+
+  def __len__(self):
+    return self.num_envs
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def action_spec(self):
+    return {"functions": tuple(_SELECTED_ACTIONS), "screen": (self.screen_size, self.screen_size)}
+
+  def observation_spec(self):
+    return {"screen": (_SCREEN_LAYERS, self.screen_size, self.screen_size), "available_actions": (0,)}
+
+  def close(self):
+    pass
+
+  def _indices(self, indices):
+    return np.arange(self.num_envs) if indices is None else np.asarray(indices, dtype=np.int64)
+
+  def _spawn(self, count):
+    margin = self.beacon_radius
+    return self._random.uniform(margin, self.screen_size - 1 - margin, size=(count, 2))
+
+  def reset(self, indices=None):
+    indices = self._indices(indices)
+    self._marine[indices] = self._spawn(len(indices))
+    self._target[indices] = self._marine[indices]
+    self._beacon[indices] = self._spawn(len(indices))
+    self._selected[indices] = False
+    self._steps[indices] = 0
+    return self._timesteps(indices, np.zeros(len(indices)), StepType.FIRST)
+
+  def step(self, actions, indices=None):
+    """Applies actions[i], pysc2 FunctionCalls or anything with function and arguments, to indices[i]."""
+    indices = self._indices(indices)
+    for i, action in zip(indices, actions):
+      if action.function == _MOVE_SCREEN and self._selected[i]:
+        self._target[i] = action.arguments[1]
+      elif action.function == _SELECT_POINT:
+        distance = np.hypot(*(np.asarray(action.arguments[1]) - self._marine[i]))
+        self._selected[i] = distance <= self.marine_radius + 1
+      elif action.function == _SELECT_ARMY:
+        self._selected[i] = True
+
+    offset = self._target[indices] - self._marine[indices]
+    distance = np.hypot(offset[:, 0], offset[:, 1])
+    scale = np.minimum(1, self.speed / np.maximum(distance, 1e-8))
+    self._marine[indices] += offset * scale[:, None]
+
+    offset = self._beacon[indices] - self._marine[indices]
+    reached = np.hypot(offset[:, 0], offset[:, 1]) <= self.beacon_radius
+    if reached.any():
+      self._beacon[indices[reached]] = self._spawn(reached.sum())
+
+    self._steps[indices] += 1
+    step_type = np.where(self._steps[indices] >= self.episode_length, StepType.LAST, StepType.MID)
+    return self._timesteps(indices, reached.astype(np.float64), step_type)
+
+  def _screens(self, indices):
+    screens = np.zeros((len(indices), _SCREEN_LAYERS, self.screen_size, self.screen_size), dtype=np.int32)
+    marine = np.rint(self._marine[indices])
+    beacon = np.rint(self._beacon[indices])
+    beacon_mask = ((self._x - beacon[:, 0, None, None]) ** 2 +
+                   (self._y - beacon[:, 1, None, None]) ** 2) <= self.beacon_radius ** 2
+    marine_mask = ((self._x - marine[:, 0, None, None]) ** 2 +
+                   (self._y - marine[:, 1, None, None]) ** 2) <= self.marine_radius ** 2
+    player_relative = screens[:, _PLAYER_RELATIVE]
+    player_relative[beacon_mask] = _PLAYER_NEUTRAL
+    player_relative[marine_mask] = _PLAYER_FRIENDLY
+    screens[:, _SELECTED] = marine_mask & self._selected[indices, None, None]
+    return screens
+
+  def _timesteps(self, indices, rewards, step_types):
+    step_types = np.broadcast_to(step_types, rewards.shape)
+    screens = self._screens(indices)
+    timesteps = []
+    for j, i in enumerate(indices):
+      available_actions = _SELECTED_ACTIONS if self._selected[i] else _UNSELECTED_ACTIONS
+      observation = {"screen": screens[j], "available_actions": available_actions}
+      discount = 0.0 if step_types[j] == StepType.LAST else 1.0
+      timesteps.append(TimeStep(int(step_types[j]), rewards[j], discount, observation))
+    return timesteps
+
+
+class MoveToBeacon(object):
+  """A single MoveToBeacon game with the pysc2 SC2Env interface, lists of one timestep."""
+  def __init__(self, screen_size=28, **kwargs):
+    self._env = BatchMoveToBeacon(1, screen_size=screen_size, **kwargs)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def action_spec(self):
+    return self._env.action_spec()
+
+  def observation_spec(self):
+    return self._env.observation_spec()
+
+  def reset(self):
+    return self._env.reset()
+
+  def step(self, actions):
+    return self._env.step(actions)
+
+  def close(self):
+    self._env.close()
@@ -0,0 +1,51 @@
+import functools
+import multiprocessing
+import unittest
+import torch
+import torch.nn as nn
+from sc2_agents import apex
+from sc2_agents.dqn_per_agent import DQNPERAgent, DQNPERCNN
+from sc2_agents.fake_env import MoveToBeacon
+
+
+def small_agent():
+  agent = DQNPERAgent(device="cpu")
+  agent.steps_before_training = 40
+  agent.train_q_batch_size = 8
+  return agent
+
+
+class TestSharedWeights(unittest.TestCase):
+  def test_publish_pull(self):
+    weights = apex.SharedWeights(nn.Linear(2, 2))
+    network = nn.Linear(2, 2)
+    before = network.weight.clone()
+    # nothing published yet, the network is left alone
+    self.assertEqual(weights.pull(network, 0), 0)
+    self.assertTrue(torch.equal(network.weight, before))
+
+    learner = nn.Linear(2, 2)
+    weights.publish(learner.state_dict())
+    self.assertEqual(weights.version.value, 1)
+    self.assertEqual(weights.pull(network, 0), 1)
+    self.assertTrue(torch.equal(network.weight, learner.weight))
+
+    # an actor that is up to date does not copy again
+    with torch.no_grad():
+      network.weight.zero_()
+    self.assertEqual(weights.pull(network, 1), 1)
+    self.assertEqual(network.weight.abs().sum().item(), 0)
+
+
+class TestApex(unittest.TestCase):
+  def test_train(self):
+    agent = apex.train(small_agent, DQNPERCNN, functools.partial(MoveToBeacon, 28, seed=0), num_actors=2,
+                       max_updates=20, send_every=10, sync_every=20)
+    self.assertGreaterEqual(len(agent._memory), 40)
+    self.assertGreater(agent._priorities.updates, 0)
+    self.assertFalse([process for process in multiprocessing.active_children()
+                      if process.name.startswith("actor-")])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,43 @@
+import json
+import os
+import tempfile
+import unittest
+from sc2_agents import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+  def test_replay(self):
+    with tempfile.TemporaryDirectory() as directory:
+      out = os.path.join(directory, "results.json")
+      args = ["--benchmarks", "replay", "--capacities", "1e3", "--batch_sizes", "32,2048",
+              "--max_fill", "500", "--repeats", "3", "--out", out]
+      results = benchmark.main(args)
+      with open(out) as f:
+        saved = json.load(f)
+    self.assertEqual(saved["results"], results)
+    self.assertEqual(saved["meta"]["args"]["capacities"], [1000])
+    kinds = sorted((r["memory"], r["benchmark"]) for r in results)
+    self.assertEqual(kinds, [("prioritised", "push"), ("prioritised", "sample"), ("prioritised", "update"),
+                             ("uniform", "push"), ("uniform", "sample")])
+    self.assertTrue(all(r["filled"] == 500 for r in results))
+
+  def test_env(self):
+    results = benchmark.main(["--benchmarks", "env", "--env_parallel", "1,4", "--env_steps", "400"])
+    self.assertEqual([r["parallel"] for r in results], [1, 4])
+    self.assertTrue(all(r["per_second"] > 0 for r in results))
+
+  def test_synthetic_transitions_dedup(self):
+    screens = benchmark.synthetic_screens(10)
+    transitions = list(benchmark.transitions(screens, 20))
+    for previous, transition in zip(transitions, transitions[1:]):
+      self.assertTrue((previous.s_1 == transition.s).all())
+
+  def test_parse_mode(self):
+    self.assertEqual(benchmark.parse_mode("fp32"), {"precision": "fp32", "compile_mode": "none", "fused_adam": False})
+    self.assertEqual(benchmark.parse_mode("bf16+script+fused_adam"),
+                     {"precision": "bf16", "compile_mode": "script", "fused_adam": True})
+    self.assertRaises(ValueError, benchmark.parse_mode, "fp8")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import numpy as np
+import torch
+from sc2_agents.dqn_agent import DQNAgent
+from sc2_agents.dqn_double_q_agent import DQNDoubleQAgent, DQNCNN
+from sc2_agents.dqn_dueling_agent import DQNDuelingAgent
+from sc2_agents.dqn_per_agent import DQNPERAgent
+from sc2_agents.fake_env import BatchMoveToBeacon
+from utils.replay_memory import ReplayMemory
+
+
+class SmallAgent(DQNAgent):
+  network = DQNCNN
+  weights_path = "./data/SmallAgent"
+
+  def make_memory(self, replay_path):
+    return ReplayMemory(capacity=500, dedup_frames=True, path=replay_path)
+
+
+class TestDQNAgent(unittest.TestCase):
+  def train(self, agent, frames=80):
+    agent.steps_before_training = 40
+    agent.train_q_batch_size = 8
+    agent._epsilon.isTraining = True
+    agent.run_loop(BatchMoveToBeacon(2, seed=0), frames)
+    return agent
+
+  def test_configurations(self):
+    for Agent, network, prioritised in [(DQNDoubleQAgent, "DQNCNN", False),
+                                        (DQNDuelingAgent, "DQNDuelingCNN", False),
+                                        (DQNPERAgent, "DQNPERCNN", True)]:
+      agent = Agent(device="cpu")
+      self.assertEqual(type(agent._Q).__name__, network)
+      self.assertEqual(agent.prioritised, prioritised)
+      self.assertEqual(agent._priorities is not None, prioritised)
+      self.assertFalse(any(param.requires_grad for param in agent._Qt.parameters()))
+    self.assertEqual(DQNPERAgent.max_frames, 4000000)
+    self.assertEqual(DQNDuelingAgent(device="cpu")._memory.n, 6)
+
+  def test_train(self):
+    agent = SmallAgent(device="cpu")
+    before = [param.clone() for param in agent._Q.parameters()]
+    self.train(agent)
+    self.assertEqual(len(agent._memory), 80)
+    self.assertEqual(agent._prefetcher.batches, 10)
+    self.assertTrue(any(not torch.equal(a, b) for a, b in zip(before, agent._Q.parameters())))
+
+  def test_priorities(self):
+    agent = self.train(DQNPERAgent(device="cpu"))
+    errors = agent._memory.errors[:len(agent._memory)]
+    # the replayed transitions got their TD errors back
+    self.assertGreater(agent._priorities.updates, 0)
+    self.assertFalse(np.allclose(errors, errors[0]))
+
+  def test_replay_shards(self):
+    agent = self.train(SmallAgent(device="cpu", replay_shards=2))
+    # each env pushed into its own shard
+    self.assertEqual([len(shard) for shard in agent._memory.shards], [40, 40])
+    self.assertEqual(agent._prefetcher.batches, 10)
+    agent = self.train(DQNPERAgent(device="cpu", replay_shards=2))
+    self.assertTrue(agent.prioritised)
+    self.assertGreater(agent._priorities.updates, 0)
+    errors = np.concatenate([shard.errors[:len(shard)] for shard in agent._memory.shards])
+    self.assertFalse(np.allclose(errors, errors[0]))
+
+  def test_weighted_loss(self):
+    agent = DQNPERAgent(device="cpu")
+    self.assertTrue(agent.importance_sampling)
+    self.assertEqual(agent._memory.beta, 0.4)
+    Q = torch.tensor([[1.0], [2.0]])
+    y = torch.tensor([[0.0], [0.0]])
+    self.assertAlmostEqual(agent.td_loss(Q, y, None, None).item(), 2.5)
+    self.assertAlmostEqual(agent.td_loss(Q, y, None, torch.tensor([[1.0], [0.5]])).item(), 1.5)
+
+  def test_solved(self):
+    agent = SmallAgent(device="cpu")
+    agent.solve_score = 0
+    agent.solve_window = 2
+    self.train(agent, frames=2000)
+    self.assertTrue(agent.solved())
+    self.assertEqual(len(agent.episode_scores), 2)
+    self.assertLess(agent.frames, 2000)
+
+  def test_sync_target(self):
+    agent = SmallAgent(device="cpu")
+    with torch.no_grad():
+      for param in agent._Q.parameters():
+        param.add_(1)
+    agent.sync_target()
+    for a, b in zip(agent._Q.parameters(), agent._Qt.parameters()):
+      self.assertTrue(torch.equal(a, b))
+
+  def test_get_actions(self):
+    agent = SmallAgent(device="cpu")
+    agent._epsilon.isTraining = False
+    s = np.random.rand(3, 1, 28, 28).astype(np.float32)
+    with torch.no_grad():
+      expected = agent._Q(torch.from_numpy(s)).view(3, -1).max(dim=1)[1].numpy()
+    self.assertTrue((agent.get_actions(s) == expected).all())
+
+
+if __name__ == "__main__":
+  unittest.main()
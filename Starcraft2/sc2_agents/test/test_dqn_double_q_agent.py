@@ -1,5 +1,5 @@
 import unittest
-from sc2_agents.dqn_double_q_agent import DQNCNN, BaseRLAgent
+from sc2_agents.dqn_double_q_agent import DQNCNN, DQNDoubleQAgent
 
 import numpy as np
 
@@ -20,17 +20,17 @@ class TestDQN(unittest.TestCase):
 
   def setUp(self):
     self.dqn = DQNCNN()
-    self.agent = BaseRLAgent()
+    self.agent = DQNDoubleQAgent()
 
   def test_DQN(self):
-    x = torch.rand(5, 17, 84, 84)
+    x = torch.rand(5, 1, 28, 28)
     x = Variable(torch.Tensor(x))
 
     output = self.dqn(x)
     self.assertEqual(5, output.size()[0])
-    self.assertEqual(2, output.size()[1])
-    self.assertEqual(84, output.size()[2])
-    self.assertEqual(84, output.size()[3])
+    self.assertEqual(1, output.size()[1])
+    self.assertEqual(28, output.size()[2])
+    self.assertEqual(28, output.size()[3])
 
   def test_get_random_action(self):
     s = np.random.rand(17, 84, 84)
@@ -40,13 +40,14 @@ class TestDQN(unittest.TestCase):
     self.assertTrue(action < 2*84*84)
 
   def test_get_greedy_action(self):
-    self.agent._epsilon.increment(100)
-    s = np.random.rand(17, 84, 84)
+    # epsilon is 0 outside training
+    self.agent._epsilon.isTraining = False
+    s = np.random.rand(1, 28, 28).astype(np.float32)
     action = self.agent.get_action(s)
-    # print(action)
-    # self.assertTrue(action[0] in [0, 1])
-    # self.assertTrue(action[1:].shape[0] == 2)
-    self.assertTrue(action < 2 * 84 * 84)
+    self.assertTrue(action < 28 * 28)
+    with torch.no_grad():
+      expected = self.agent._Q(torch.from_numpy(s).unsqueeze(0)).view(-1).max(dim=0)[1].item()
+    self.assertEqual(action, expected)
 
   def test_gather(self):
     s = np.array([[1, 2], [3, 4]])
@@ -40,13 +40,14 @@ class TestDQN(unittest.TestCase):
     self.assertTrue(action < 2*84*84)
 
   def test_get_greedy_action(self):
-    self.agent._epsilon.increment(100)
-    s = np.random.rand(17, 84, 84)
+    # epsilon is 0 outside training
+    self.agent._epsilon.isTraining = False
+    s = np.random.rand(1, 28, 28).astype(np.float32)
     action = self.agent.get_action(s)
-    # print(action)
-    # self.assertTrue(action[0] in [0, 1])
-    # self.assertTrue(action[1:].shape[0] == 2)
-    self.assertTrue(action < 2 * 84 * 84)
+    self.assertTrue(action < 28 * 28)
+    with torch.no_grad():
+      expected = self.agent._Q(torch.from_numpy(s).unsqueeze(0)).view(-1).max(dim=0)[1].item()
+    self.assertEqual(action, expected)
 
   def test_gather(self):
     s = np.array([[1, 2], [3, 4]])
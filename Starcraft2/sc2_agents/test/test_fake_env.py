@@ -0,0 +1,57 @@
+import collections
+import unittest
+import numpy as np
+from sc2_agents.fake_env import BatchMoveToBeacon, MoveToBeacon
+from sc2_agents.vec_env import BatchEnv
+
+FunctionCall = collections.namedtuple("FunctionCall", ["function", "arguments"])
+
+
+def friendly(timestep):
+  y, x = (timestep.observation["screen"][5] == 1).nonzero()
+  return [int(x.mean()), int(y.mean())]
+
+
+def beacon(timestep):
+  y, x = (timestep.observation["screen"][5] == 3).nonzero()
+  return [int(round(x.mean())), int(round(y.mean()))]
+
+
+class TestMoveToBeacon(unittest.TestCase):
+  def test_interface(self):
+    with MoveToBeacon(episode_length=3, seed=0) as env:
+      timestep = env.reset()[0]
+      self.assertTrue(timestep.first())
+      self.assertEqual(timestep.observation["screen"].shape, (17, 28, 28))
+      self.assertNotIn(331, timestep.observation["available_actions"])
+      timestep = env.step([FunctionCall(2, [[0], friendly(timestep)])])[0]
+      self.assertIn(331, timestep.observation["available_actions"])
+      self.assertFalse(timestep.last())
+      env.step([FunctionCall(0, [])])
+      self.assertTrue(env.step([FunctionCall(0, [])])[0].last())
+
+  def test_reach_beacon(self):
+    env = MoveToBeacon(seed=1)
+    env.reset()
+    timestep = env.step([FunctionCall(7, [[0]])])[0]
+    score = 0
+    for _ in range(100):
+      timestep = env.step([FunctionCall(331, [[0], beacon(timestep)])])[0]
+      score += timestep.reward
+    self.assertGreater(score, 3)
+
+  def test_batch(self):
+    envs = BatchMoveToBeacon(4, seed=0)
+    self.assertIsInstance(envs, BatchEnv)
+    self.assertEqual(len(envs), 4)
+    timesteps = envs.reset()
+    self.assertEqual(len(timesteps), 4)
+    timesteps = envs.step([FunctionCall(2, [[0], friendly(t)]) for t in timesteps[::2]], indices=[0, 2])
+    self.assertEqual(len(timesteps), 2)
+    self.assertTrue(envs._selected[[0, 2]].all())
+    self.assertFalse(envs._selected[[1, 3]].any())
+    self.assertEqual(envs._steps.tolist(), [1, 0, 1, 0])
+
+
+if __name__ == "__main__":
+  unittest.main()
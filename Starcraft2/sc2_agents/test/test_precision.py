@@ -0,0 +1,43 @@
+import unittest
+import torch
+from sc2_agents.dqn_double_q_agent import DQNCNN
+from sc2_agents.dqn_dueling_agent import DQNDuelingCNN
+from sc2_agents.dqn_per_agent import DQNPERCNN
+from utils.device import as_tensor
+from utils.precision import MixedPrecision, compile_network
+
+import numpy as np
+
+
+class TestLearnerPrecision(unittest.TestCase):
+  """Q-values of the learner modes against eager fp32, on 28x28 MoveToBeacon screens."""
+  def setUp(self):
+    torch.manual_seed(0)
+    self.device = torch.device("cpu")
+    screens = np.zeros((32, 1, 28, 28), dtype=np.float32)
+    screens[:, 0, 10:12, 10:12] = 1
+    screens[:, 0, 3:8, 15:20] = 3
+    self.s = as_tensor(screens + np.random.rand(*screens.shape).astype(np.float32), self.device)
+
+  def q_values(self, network, precision="fp32", compile_mode="none"):
+    mixed = MixedPrecision(self.device, precision)
+    with torch.no_grad(), mixed.autocast():
+      return compile_network(network, compile_mode)(self.s).float().view(len(self.s), -1)
+
+  def assertParity(self, network, precision, compile_mode="none", tolerance=0.02):
+    expected = self.q_values(network)
+    q = self.q_values(network, precision, compile_mode)
+    error = ((q - expected).abs().max() / expected.abs().max()).item()
+    self.assertLess(error, tolerance, "%s %s %s" % (type(network).__name__, precision, compile_mode))
+
+  def test_parity(self):
+    for network_fn in [DQNCNN, DQNDuelingCNN, DQNPERCNN]:
+      network = network_fn().to(memory_format=torch.channels_last)
+      self.assertParity(network, "fp32", "script", tolerance=1e-5)
+      self.assertParity(network, "bf16")
+      self.assertParity(network, "bf16", "script")
+      self.assertParity(network, "fp16", tolerance=0.005)
+
+
+if __name__ == "__main__":
+  unittest.main()
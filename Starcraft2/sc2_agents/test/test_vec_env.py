@@ -0,0 +1,52 @@
+import unittest
+from sc2_agents.vec_env import VecEnv, frames_crossed
+
+
+class CountingEnv(object):
+  def __init__(self, offset):
+    self.offset = offset
+    self.t = 0
+
+  def action_spec(self):
+    return "action_spec"
+
+  def observation_spec(self):
+    return "observation_spec"
+
+  def reset(self):
+    self.t = 0
+    return [self.offset]
+
+  def step(self, actions):
+    self.t += actions[0]
+    return [self.offset + self.t]
+
+
+class TestVecEnv(unittest.TestCase):
+  def setUp(self):
+    self.envs = VecEnv([CountingEnv(100 * i) for i in range(4)])
+
+  def tearDown(self):
+    self.envs.close()
+
+  def test_specs(self):
+    self.assertEqual(len(self.envs), 4)
+    self.assertEqual(self.envs.action_spec(), "action_spec")
+    self.assertEqual(self.envs.observation_spec(), "observation_spec")
+
+  def test_step(self):
+    self.assertEqual(self.envs.reset(), [0, 100, 200, 300])
+    self.assertEqual(self.envs.step([1, 2, 3, 4]), [1, 102, 203, 304])
+    self.assertEqual(self.envs.step([1, 1], indices=[1, 3]), [103, 305])
+    self.assertEqual(self.envs.reset([3]), [300])
+    self.assertEqual(self.envs.step([1, 1, 1, 1]), [2, 104, 204, 301])
+
+  def test_frames_crossed(self):
+    self.assertEqual(frames_crossed(0, 4, 4), 1)
+    self.assertEqual(frames_crossed(3, 7, 4), 1)
+    self.assertEqual(frames_crossed(4, 7, 4), 0)
+    self.assertEqual(frames_crossed(6, 14, 4), 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
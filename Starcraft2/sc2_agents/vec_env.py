@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def frames_crossed(previous_frames, total_frames, every):
+  """How many multiples of `every` lie in (previous_frames, total_frames]."""
+  return total_frames // every - previous_frames // every
+
+
+class BatchEnv(object):
+  """Base of the envs that step N games together.
+
+  len() is N, reset(indices) and step(actions, indices) return one timestep
+  per game. run_loop wraps any other env in a VecEnv.
+  """
+
+
+class VecEnv(BatchEnv):
+  """Steps N pysc2 environments together behind one agent.
+
+  Each env is driven from its own worker thread, the game itself runs in a
+  separate SC2 process so the threads mostly wait on its socket. Timesteps
+  are returned one per env (not wrapped in a list as pysc2 does).
+  """
+  def __init__(self, envs):
+    self.envs = list(envs)
+    self._executor = ThreadPoolExecutor(max_workers=len(self.envs))
+
+  def __len__(self):
+    return len(self.envs)
+
+  def action_spec(self):
+    return self.envs[0].action_spec()
+
+  def observation_spec(self):
+    return self.envs[0].observation_spec()
+
+  def _indices(self, indices):
+    return range(len(self.envs)) if indices is None else indices
+
+  def reset(self, indices=None):
+    """Resets the envs at indices (all by default) and returns their first timesteps."""
+    return list(self._executor.map(lambda i: self.envs[i].reset()[0], self._indices(indices)))
+
+  def step(self, actions, indices=None):
+    """Steps the env at indices[i] with actions[i] and returns the new timesteps."""
+    return list(self._executor.map(lambda i, action: self.envs[i].step([action])[0],
+                                   self._indices(indices), actions))
+
+  def close(self):
+    self._executor.shutdown()
@@ -0,0 +1,296 @@
+"""CartPole-v0 as NumPy arrays, N poles stepped at once.
+
+BatchCartPole uses gym's CartPole dynamics (Euler steps of 0.02 seconds)
+and its termination: the cart leaves +-2.4, the pole leans past 12 degrees
+or, as CartPole-v0's TimeLimit does, 200 steps pass. Every step is worth a
+reward of 1, the last one included. Poles whose episode ended start a new
+one straight away.
+
+train_batched() runs the DQN notebooks' learners on it: one forward pass
+picks the actions of all N poles and all N transitions go into the
+learner's replay memory each tick.
+
+CartPoleRenderer and FrameStack feed the CNN learner without gym's
+renderer: the cart and pole are drawn straight from the state vector into
+the grayscale 180 x 600 crop process_screen() used to cut out of gym's
+600 x 400 screen.
+"""
+import math
+
+import numpy as np
+import torch
+from torch.autograd import Variable
+
+from utils.replay_memory import Transition
+
+GRAVITY = 9.8
+MASS_CART = 1.0
+MASS_POLE = 0.1
+TOTAL_MASS = MASS_CART + MASS_POLE
+LENGTH = 0.5  # half the pole's length
+POLE_MASS_LENGTH = MASS_POLE * LENGTH
+FORCE_MAG = 10.0
+TAU = 0.02
+THETA_THRESHOLD = 12 * 2 * math.pi / 360
+X_THRESHOLD = 2.4
+
+# gym's CartPoleEnv.render() geometry, in pixels with y pointing up
+SCREEN_WIDTH = 600
+SCREEN_HEIGHT = 400
+SCALE = SCREEN_WIDTH / (2 * X_THRESHOLD)
+CART_Y = 100
+CART_WIDTH = 50.0
+CART_HEIGHT = 30.0
+POLE_WIDTH = 10.0
+POLE_LENGTH = SCALE * 2 * LENGTH
+
+
+class BatchCartPole(object):
+  """num_envs CartPole-v0 games stepped together.
+
+  States are num_envs x 4 float64 arrays of (x, x_dot, theta, theta_dot).
+  step() returns the state each action led to, the rewards and which
+  episodes ended (done) or hit max_steps (truncated, CartPole-v0 reports
+  both as done). Those copies are reset at once, self.s holds the states
+  to act on next.
+  """
+  def __init__(self, num_envs=1, max_steps=200, seed=None):
+    self.num_envs = num_envs
+    self.max_steps = max_steps
+    self.num_actions = 2
+    self._random = np.random.RandomState(seed)
+    self.s = np.zeros((num_envs, 4))
+    self.steps = np.zeros(num_envs, dtype=np.int64)
+
+  def __len__(self):
+    return self.num_envs
+
+  def _indices(self, indices):
+    return np.arange(self.num_envs) if indices is None else np.asarray(indices, dtype=np.int64)
+
+  def reset(self, indices=None):
+    """Starts new episodes for the copies at indices (all by default) and returns their states."""
+    indices = self._indices(indices)
+    self.s[indices] = self._random.uniform(low=-0.05, high=0.05, size=(len(indices), 4))
+    self.steps[indices] = 0
+    return self.s[indices].copy()
+
+  def step(self, actions):
+    """Pushes cart i right for actions[i] == 1, left otherwise.
+
+    Returns (s_1, r, done, truncated) of every copy, s_1 being the state
+    before any reset.
+    """
+    x, x_dot, theta, theta_dot = self.s.T
+    force = np.where(np.asarray(actions) == 1, FORCE_MAG, -FORCE_MAG)
+    costheta = np.cos(theta)
+    sintheta = np.sin(theta)
+    temp = (force + POLE_MASS_LENGTH * theta_dot * theta_dot * sintheta) / TOTAL_MASS
+    thetaacc = (GRAVITY * sintheta - costheta * temp) / (
+        LENGTH * (4.0 / 3.0 - MASS_POLE * costheta * costheta / TOTAL_MASS))
+    xacc = temp - POLE_MASS_LENGTH * thetaacc * costheta / TOTAL_MASS
+    s_1 = np.stack([x + TAU * x_dot, x_dot + TAU * xacc, theta + TAU * theta_dot, theta_dot + TAU * thetaacc],
+                   axis=1)
+
+    done = ((s_1[:, 0] < -X_THRESHOLD) | (s_1[:, 0] > X_THRESHOLD) |
+            (s_1[:, 2] < -THETA_THRESHOLD) | (s_1[:, 2] > THETA_THRESHOLD))
+    self.steps += 1
+    truncated = ~done & (self.steps >= self.max_steps)
+    self.s = s_1.copy()
+    ended = np.flatnonzero(done | truncated)
+    if len(ended):
+      self.reset(ended)
+    return s_1, np.ones(self.num_envs), done, truncated
+
+
+def train_batched(learner, nb_episodes=1, display=None):
+  """DQNLinearLearner.train() for a learner whose env is a BatchCartPole.
+
+  Keeps the notebooks' schedule per transition: train_q every
+  train_q_per_step transitions, the target network every
+  target_q_update_frequency and epsilon once per finished episode after
+  steps_before_training. Env i pushes into the replay memory as stream i,
+  so n-step memories keep each pole's window apart.
+  """
+  env = learner.env
+  learner.epsilon.isTraining = True
+  step = 0
+  episodes = 0
+  episode_reward = np.zeros(len(env))
+  s = env.reset()
+
+  while episodes < nb_episodes:
+    with torch.no_grad():
+      Q = learner.Q(Variable(torch.from_numpy(s)).float())
+    actions = Q.max(dim=1)[1].numpy()
+    explore = np.random.rand(len(env)) <= learner.epsilon.value()
+    actions[explore] = np.random.randint(env.num_actions, size=explore.sum())
+
+    s_1, r, done, truncated = env.step(actions)
+    ended = done | truncated
+    for i in range(len(env)):
+      learner.memory.push(Transition(s[i], actions[i], s_1[i], r[i], ended[i]), stream=i)
+    episode_reward += r
+    previous_step = step
+    step += len(env)
+    s = env.s.copy()
+
+    if step > learner.steps_before_training:
+      for _ in range(step // learner.train_q_per_step - previous_step // learner.train_q_per_step):
+        learner.train_q()
+      if step // learner.target_q_update_frequency > previous_step // learner.target_q_update_frequency:
+        learner.update_target_q()
+    if display is not None and step // 100 > previous_step // 100:
+      display(learner)
+
+    for i in np.flatnonzero(ended)[:nb_episodes - episodes]:
+      if step > learner.steps_before_training:
+        learner.epsilon.increment()  # increment epsilon per episode
+      learner.episode_rewards.append(episode_reward[i])
+      learner.epsilon_log.append(learner.epsilon.value())
+      episodes += 1
+    episode_reward[ended] = 0
+
+  learner.s = s
+  if display is not None:
+    display(learner)
+
+
+def _gray(r, g, b):
+  """cv2.COLOR_RGB2GRAY of one of gym's colours given in [0, 1]."""
+  return round(255 * (0.299 * r + 0.587 * g + 0.114 * b))
+
+
+_POLE_GRAY = _gray(.8, .6, .4)
+_AXLE_GRAY = _gray(.5, .5, .8)
+
+
+def _clip(first, last, size):
+  return slice(min(max(first, 0), size), min(max(last, 0), size))
+
+
+class CartPoleRenderer(object):
+  """Draws CartPole states offscreen as process_screen() saw gym's frames.
+
+  render(state) paints the cart, pole, axle and track of an (x, x_dot,
+  theta, theta_dot) state into a preallocated height x width grayscale
+  array, rows top .. top + height of gym's screen, and returns it. The
+  array and all scratch space are allocated once, so the returned frame is
+  overwritten by the next call.
+  """
+  def __init__(self, top=150, height=180, width=SCREEN_WIDTH, dtype=np.float32):
+    self.shape = (height, width)
+    self.frame = np.empty(self.shape, dtype=dtype)
+    # y of every row's and x of every column's pixel centre
+    self._top_y = SCREEN_HEIGHT - top - 0.5
+    self._y = self._top_y - np.arange(height)
+    self._x = np.arange(width) + 0.5
+    size = 2 * int(math.ceil(POLE_LENGTH)) + 2
+    self._xs = [np.empty(size) for _ in range(2)]
+    self._ys = [np.empty(size) for _ in range(2)]
+    # flat so that the window views below are contiguous, numpy buffers strided outputs
+    self._along = np.empty(size * size)
+    self._across = np.empty(size * size)
+    self._inside = np.empty(size * size, dtype=np.bool_)
+    self._scratch = np.empty(size * size, dtype=np.bool_)
+
+  def _columns(self, low, high):
+    """Columns whose pixel centres lie in [low, high]."""
+    return _clip(math.ceil(low - 0.5), math.floor(high - 0.5) + 1, self.shape[1])
+
+  def _rows(self, low, high):
+    """Rows whose pixel centres lie in [low, high], y going up."""
+    return _clip(math.ceil(self._top_y - high), math.floor(self._top_y - low) + 1, self.shape[0])
+
+  def _window(self, left, right, bottom, top, x, y):
+    """Pixels of the box [left, right] x [bottom, top] with scratch views of its size.
+
+    dx and dy are the offsets of the pixel centres from (x, y). None when
+    the box is off the frame.
+    """
+    rows, columns = self._rows(bottom, top), self._columns(left, right)
+    height, width = rows.stop - rows.start, columns.stop - columns.start
+    if height <= 0 or width <= 0:
+      return None
+    dx, dx_2 = [array[:width] for array in self._xs]
+    dy, dy_2 = [array[:height] for array in self._ys]
+    np.subtract(self._x[columns], x, out=dx)
+    np.subtract(self._y[rows], y, out=dy)
+    along, across, inside, scratch = [array[:height * width].reshape(height, width)
+                                      for array in (self._along, self._across, self._inside, self._scratch)]
+    return rows, columns, dx, dy, dx_2, dy_2, along, across, inside, scratch
+
+  def render(self, state):
+    frame = self.frame
+    x, _, theta, _ = state
+    cart_x = x * SCALE + SCREEN_WIDTH / 2.0
+    frame.fill(255)
+
+    rows = self._rows(CART_Y - CART_HEIGHT / 2, CART_Y + CART_HEIGHT / 2)
+    columns = self._columns(cart_x - CART_WIDTH / 2, cart_x + CART_WIDTH / 2)
+    frame[rows, columns] = 0
+
+    # the pole is a POLE_WIDTH wide rectangle turned by theta around the axle
+    axle_y = CART_Y + CART_HEIGHT / 4
+    sin, cos = math.sin(theta), math.cos(theta)
+    half = POLE_WIDTH / 2
+    corners_x = [cart_x + a * sin + c * cos for a in (-half, POLE_LENGTH - half) for c in (-half, half)]
+    corners_y = [axle_y + a * cos - c * sin for a in (-half, POLE_LENGTH - half) for c in (-half, half)]
+    window = self._window(min(corners_x), max(corners_x), min(corners_y), max(corners_y), cart_x, axle_y)
+    if window is not None:
+      rows, columns, dx, dy, dx_2, dy_2, along, across, inside, scratch = window
+      np.multiply(dx, sin, out=dx_2)
+      np.multiply(dy, cos, out=dy_2)
+      np.add(dy_2[:, None], dx_2[None, :], out=along)
+      np.multiply(dx, cos, out=dx_2)
+      np.multiply(dy, sin, out=dy_2)
+      np.subtract(dx_2[None, :], dy_2[:, None], out=across)
+      np.abs(across, out=across)
+      np.greater_equal(along, -half, out=inside)
+      np.less_equal(along, POLE_LENGTH - half, out=scratch)
+      inside &= scratch
+      np.less_equal(across, half, out=scratch)
+      inside &= scratch
+      np.copyto(frame[rows, columns], _POLE_GRAY, where=inside)
+
+    window = self._window(cart_x - half, cart_x + half, axle_y - half, axle_y + half, cart_x, axle_y)
+    if window is not None:
+      rows, columns, dx, dy, dx_2, dy_2, along, _, inside, _ = window
+      np.multiply(dx, dx, out=dx_2)
+      np.multiply(dy, dy, out=dy_2)
+      np.add(dy_2[:, None], dx_2[None, :], out=along)
+      np.less_equal(along, half * half, out=inside)
+      np.copyto(frame[rows, columns], _AXLE_GRAY, where=inside)
+
+    frame[self._rows(CART_Y - 0.5, CART_Y)] = 0
+    return frame
+
+
+class FrameStack(object):
+  """The last k frames as one k x height x width state, newest first, as image2state() stacked them.
+
+  Two state arrays take turns: push() copies the k - 1 newest frames of
+  the current state behind the new frame in the other array. The state the
+  previous push() returned stays intact until the push after, long enough
+  to go into a Transition next to the new one. Nothing is allocated after
+  __init__.
+  """
+  def __init__(self, shape, k=2, dtype=np.float32):
+    self._states = [np.zeros((k,) + tuple(shape), dtype=dtype) for _ in range(2)]
+    self._current = 0
+
+  def reset(self, frame):
+    """Starts over from frame, the older frames are zeros."""
+    self._current = 1 - self._current
+    state = self._states[self._current]
+    state[0] = frame
+    state[1:] = 0
+    return state
+
+  def push(self, frame):
+    previous = self._states[self._current]
+    self._current = 1 - self._current
+    state = self._states[self._current]
+    state[1:] = previous[:-1]
+    state[0] = frame
+    return state
@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+
+import numpy as np
+import torch
+
+
+def snapshot(state):
+  """Copies every tensor of a nested state dict to the CPU, the copy can be written while training goes on."""
+  if torch.is_tensor(state):
+    return state.detach().to("cpu", copy=True)
+  if isinstance(state, dict):
+    return {key: snapshot(value) for key, value in state.items()}
+  if isinstance(state, list):
+    return [snapshot(value) for value in state]
+  return state
+
+
+def _replace(filename, write):
+  """Writes through filename.tmp and renames it, so filename is always a complete file."""
+  directory = os.path.dirname(filename)
+  if directory:
+    os.makedirs(directory, exist_ok=True)
+  tmp = filename + ".tmp"
+  with open(tmp, "wb") as f:
+    write(f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp, filename)
+
+
+def save_replay(filename, state):
+  """Writes a ReplayMemory.state_dict() as a compressed npz, mostly empty screens shrink a lot."""
+  _replace(filename, lambda f: np.savez_compressed(f, header=np.array(json.dumps(state["header"])),
+                                                   **state["arrays"]))
+
+
+def load_replay(filename):
+  with np.load(filename) as data:
+    arrays = {name: data[name] for name in data.files if name != "header"}
+    return {"header": json.loads(str(data["header"])), "arrays": arrays}
+
+
+class Checkpointer(object):
+  """Writes checkpoints to `path` on a background thread.
+
+  save() takes states that are already snapshots (see snapshot()), so the
+  learner only pays for the copies. The optional replay goes to
+  `path`.replay.npz first, then the state to `path`, each through a temp
+  file and a rename. One checkpoint is written at a time, save() waits for
+  the previous one.
+  """
+  def __init__(self, path):
+    self.path = path
+    self.replay_path = path + ".replay.npz"
+    self._thread = None
+    self._error = None
+
+  def exists(self):
+    return os.path.isfile(self.path)
+
+  def save(self, state, replay=None):
+    self.wait()
+    self._thread = threading.Thread(target=self._write, args=(state, replay), name="Checkpointer")
+    self._thread.start()
+
+  def _write(self, state, replay):
+    try:
+      if replay is not None:
+        save_replay(self.replay_path, replay)
+        state = dict(state, replay=os.path.basename(self.replay_path))
+      _replace(self.path, lambda f: torch.save(state, f))
+    except Exception as e:
+      self._error = e
+
+  def wait(self):
+    """Blocks until the checkpoint being written is on disk, re-raising any error it hit."""
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+    if self._error is not None:
+      error, self._error = self._error, None
+      raise error
+
+  def load(self, map_location=None):
+    """Returns (state, replay state or None) of the last checkpoint."""
+    state = torch.load(self.path, map_location=map_location)
+    replay = None
+    if state.get("replay") is not None:
+      replay = load_replay(os.path.join(os.path.dirname(self.path), state["replay"]))
+    return state, replay
@@ -0,0 +1,49 @@
+import os
+
+import torch
+
+
+def _available_cores():
+  if hasattr(os, "sched_getaffinity"):
+    return len(os.sched_getaffinity(0))
+  return os.cpu_count() or 1
+
+
+def get_device(name=None, num_threads=None):
+  """Resolves a device name ("cpu", "cuda", "cuda:1", None for auto) to a torch.device.
+
+  Picking the CPU also sets torch's intra-op thread count, to num_threads or
+  one thread per available core.
+  """
+  if name is None:
+    name = "cuda" if torch.cuda.is_available() else "cpu"
+  device = torch.device(name)
+  if device.type == "cuda" and not torch.cuda.is_available():
+    raise ValueError("device %s requested but CUDA is not available" % name)
+  if device.type == "cpu":
+    torch.set_num_threads(num_threads or _available_cores())
+  return device
+
+
+def memory_format(device):
+  """Conv layout for device: channels-last runs the CPU convolutions noticeably faster."""
+  return torch.channels_last if device.type == "cpu" else torch.contiguous_format
+
+
+def to_device(network, device):
+  """Moves network to device in the layout memory_format(device) picks."""
+  return network.to(device=device, memory_format=memory_format(device))
+
+
+def as_tensor(array, device, dtype=torch.float):
+  """Copies a numpy array to device, through pinned memory and asynchronously on CUDA.
+
+  4d screens are laid out in memory_format(device) to match the networks.
+  """
+  tensor = torch.from_numpy(array)
+  if device.type == "cuda":
+    tensor = tensor.pin_memory().to(device, non_blocking=True)
+  tensor = tensor.to(dtype)
+  if tensor.dim() == 4:
+    tensor = tensor.contiguous(memory_format=memory_format(device))
+  return tensor
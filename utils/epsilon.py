@@ -14,4 +14,10 @@ class Epsilon(object):
         if not self.isTraining:
             return 0.0
         else:
-            return self._value
\ No newline at end of file
+            return self._value
+
+    def state_dict(self):
+        return {"value": self._value}
+
+    def load_state_dict(self, state):
+        self._value = state["value"]
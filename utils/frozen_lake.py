@@ -0,0 +1,153 @@
+"""FrozenLake as NumPy arrays, N independent copies stepped at once.
+
+The notebooks' FrozenLakeEnv keeps gym's transition dict P[s][a], a list of
+(probability, next state, reward, done) per state and action, and samples
+it one step at a time. compile_transitions() turns any such P into padded
+arrays so BatchFrozenLake can sample the next state of every copy with a
+few fancy-index ops, slippery ice included.
+"""
+import numpy as np
+
+LEFT = 0
+DOWN = 1
+RIGHT = 2
+UP = 3
+
+MAPS = {
+  "4x4": [
+    "SFFF",
+    "FHFH",
+    "FFFH",
+    "HFFG"
+  ],
+  "1x8": [
+    "FFFSFFFG"
+  ],
+  "8x8": [
+    "SFFFFFFF",
+    "FFFFFFFF",
+    "FFFHFFFF",
+    "FFFFFHFF",
+    "FFFHFFFF",
+    "FHHFFFHF",
+    "FHFFHFHF",
+    "FFFHFFFG"
+  ],
+}
+
+
+def frozen_lake_P(desc, is_slippery=True):
+  """gym's P[s][a] for a FrozenLake map, built as the notebooks' FrozenLakeEnv does."""
+  nrow, ncol = desc.shape
+  P = {s: {a: [] for a in range(4)} for s in range(nrow * ncol)}
+
+  def inc(row, col, a):
+    if a == LEFT:
+      col = max(col - 1, 0)
+    elif a == DOWN:
+      row = min(row + 1, nrow - 1)
+    elif a == RIGHT:
+      col = min(col + 1, ncol - 1)
+    elif a == UP:
+      row = max(row - 1, 0)
+    return row, col
+
+  for row in range(nrow):
+    for col in range(ncol):
+      s = row * ncol + col
+      for a in range(4):
+        if desc[row, col] in b"GH":
+          P[s][a].append((1.0, s, 0, True))
+          continue
+        moves = [(a - 1) % 4, a, (a + 1) % 4] if is_slippery else [a]
+        for b in moves:
+          newrow, newcol = inc(row, col, b)
+          letter = desc[newrow, newcol]
+          P[s][a].append((1.0 / len(moves), newrow * ncol + newcol, float(letter == b"G"), letter in b"GH"))
+  return P
+
+
+def compile_transitions(P, num_states, num_actions):
+  """Pads P[s][a] to K outcomes, returns (cumulative probability, next state, reward, done) arrays.
+
+  Each array is num_states x num_actions x K, padded outcomes repeat the
+  last one with probability 0.
+  """
+  K = max(len(P[s][a]) for s in range(num_states) for a in range(num_actions))
+  cumulative = np.ones((num_states, num_actions, K))
+  next_state = np.zeros((num_states, num_actions, K), dtype=np.int64)
+  reward = np.zeros((num_states, num_actions, K))
+  done = np.zeros((num_states, num_actions, K), dtype=np.bool_)
+  for s in range(num_states):
+    for a in range(num_actions):
+      outcomes = P[s][a] + [P[s][a][-1]] * (K - len(P[s][a]))
+      total = 0.0
+      for k, (probability, s_1, r, d) in enumerate(outcomes):
+        total += probability if k < len(P[s][a]) else 0.0
+        cumulative[s, a, k] = total
+        next_state[s, a, k] = s_1
+        reward[s, a, k] = r
+        done[s, a, k] = d
+  # round off must never leave a draw in [total, 1) without an outcome
+  cumulative[:, :, -1] = 1.0
+  return cumulative, next_state, reward, done
+
+
+class BatchFrozenLake(object):
+  """num_envs FrozenLake games stepped together.
+
+  States are ints in [0, num_states) as with FrozenLakeEnv. step() returns
+  the next state, reward and done of every copy, copies that are done stay
+  in their terminal state until reset() with their indices. With max_steps
+  set an episode is also cut off (truncated, not done) after that many
+  steps, as gym's TimeLimit does (100 steps for the 4x4 map, 200 for 8x8).
+  """
+  def __init__(self, num_envs=1, desc=None, map_name="4x4", is_slippery=True, max_steps=None, seed=None):
+    if desc is None and map_name is None:
+      raise ValueError("Must provide either desc or map_name")
+    elif desc is None:
+      desc = MAPS[map_name]
+    self.desc = np.asarray(desc, dtype="c")
+    self.num_envs = num_envs
+    self.num_states = self.desc.size
+    self.num_actions = 4
+    self.max_steps = max_steps
+    self._random = np.random.RandomState(seed)
+    P = frozen_lake_P(self.desc, is_slippery)
+    # one row of outcomes per state * num_actions + action
+    self._cumulative, self._next_state, self._reward, self._done = [
+        array.reshape(self.num_states * self.num_actions, -1)
+        for array in compile_transitions(P, self.num_states, self.num_actions)]
+    self._start_states = np.flatnonzero(self.desc.ravel() == b"S")
+    self.s = np.zeros(num_envs, dtype=np.int64)
+    self.steps = np.zeros(num_envs, dtype=np.int64)
+
+  def __len__(self):
+    return self.num_envs
+
+  def _indices(self, indices):
+    return np.arange(self.num_envs) if indices is None else np.asarray(indices, dtype=np.int64)
+
+  def reset(self, indices=None):
+    """Puts the copies at indices (all by default) on a start state and returns those states."""
+    indices = self._indices(indices)
+    self.s[indices] = self._random.choice(self._start_states, size=len(indices))
+    self.steps[indices] = 0
+    return self.s[indices]
+
+  def step(self, actions):
+    """Takes actions[i] in copy i, returns the (next state, reward, done, truncated) arrays of all copies."""
+    rows = self.s * self.num_actions + actions
+    outcome = np.zeros(self.num_envs, dtype=np.int64)
+    if self._cumulative.shape[1] > 1:
+      draws = self._random.uniform(size=self.num_envs)
+      # outcome k is the first whose cumulative probability exceeds the draw
+      for k in range(self._cumulative.shape[1] - 1):
+        outcome += draws >= self._cumulative[rows, k]
+    s_1 = self._next_state[rows, outcome]
+    r = self._reward[rows, outcome]
+    done = self._done[rows, outcome]
+    self.steps += 1
+    truncated = ~done & (self.steps >= self.max_steps) if self.max_steps is not None else np.zeros_like(done)
+    self.s = s_1
+    return s_1, r, done, truncated
@@ -0,0 +1,126 @@
+import collections
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+
+from utils.device import as_tensor
+
+
+class _Request(object):
+  __slots__ = ("s", "actions", "submitted", "done")
+
+  def __init__(self, s):
+    self.s = s
+    self.actions = None
+    self.submitted = time.perf_counter()
+    self.done = threading.Event()
+
+
+class InferenceServer(object):
+  """Greedy actions for many concurrent envs or threads from one batched forward pass.
+
+  act() queues a batch of screens and blocks until its argmax actions are
+  back. A background thread gathers queued requests until it has
+  `max_batch_size` screens or the oldest request waited `max_wait` seconds,
+  runs the network once under torch.no_grad, takes the argmax on the device
+  and hands every caller only its action indices. `network` is only read,
+  so it can be an agent's _Q shared with the serving thread.
+  """
+  def __init__(self, network, device, max_batch_size=64, max_wait=0.002):
+    self.network = network
+    self.device = device
+    self.max_batch_size = max_batch_size
+    self.max_wait = max_wait
+    self._requests = queue.Queue()
+    self._stop = threading.Event()
+    self._thread = None
+    self._error = None
+
+    self.batches = 0
+    self.screens = 0
+    self._latencies = collections.deque(maxlen=100000)
+
+  def start(self):
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._run, name="InferenceServer", daemon=True)
+      self._thread.start()
+    return self
+
+  def act(self, s):
+    """Argmax action of every screen in s (N x C x H x W), computed with other callers' screens."""
+    if self._error is not None:
+      raise self._error
+    request = _Request(s)
+    self._requests.put(request)
+    while not request.done.wait(0.1):
+      if self._error is not None:
+        raise self._error
+      if self._thread is None:
+        raise RuntimeError("InferenceServer is not running")
+    return request.actions
+
+  def _gather(self):
+    """Blocks for a first request, then takes more until the batch is full or its deadline passed."""
+    try:
+      first = self._requests.get(timeout=0.1)
+    except queue.Empty:
+      return []
+    requests = [first]
+    size = len(first.s)
+    deadline = first.submitted + self.max_wait
+    while size < self.max_batch_size:
+      timeout = deadline - time.perf_counter()
+      try:
+        request = self._requests.get(block=timeout > 0, timeout=max(timeout, 0))
+      except queue.Empty:
+        break
+      requests.append(request)
+      size += len(request.s)
+    return requests
+
+  def _run(self):
+    try:
+      while not self._stop.is_set():
+        requests = self._gather()
+        if requests:
+          self._serve(requests)
+    except Exception as e:
+      self._error = e
+
+  def _serve(self, requests):
+    s = np.concatenate([request.s for request in requests])
+    with torch.no_grad():
+      q = self.network(as_tensor(s, self.device))
+      actions = q.reshape(q.size()[0], -1).argmax(dim=1).cpu().numpy()
+    start = 0
+    served = time.perf_counter()
+    for request in requests:
+      request.actions = actions[start:start + len(request.s)]
+      start += len(request.s)
+      self._latencies.append(served - request.submitted)
+      request.done.set()
+    self.batches += 1
+    self.screens += len(s)
+
+  def stats(self):
+    """Achieved batch size and the latency a request spends queued and served, in milliseconds."""
+    latencies = np.array(self._latencies or [0.0]) * 1000
+    return {
+      "batches": self.batches,
+      "mean_batch_size": self.screens / max(self.batches, 1),
+      "p50_ms": float(np.percentile(latencies, 50)),
+      "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+  def close(self):
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+  def __str__(self):
+    return "inference: %(batches)s batches, mean batch size %(mean_batch_size).2f, " \
+           "added latency p50 %(p50_ms).3f ms, p99 %(p99_ms).3f ms" % self.stats()
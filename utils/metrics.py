@@ -0,0 +1,256 @@
+"""Metrics sinks that keep plotting off the training thread.
+
+The agents hand loss and max Q values (scalar) and screen and action
+snapshots (image) to a sink. These calls only append to a MetricsRing. A
+background thread drains the ring every `interval` seconds and renders the
+last `history` scalars and the latest images: into a matplotlib window run
+by a separate process (WindowSink), into a png and a csv file (FileSink), or
+not at all (NullSink).
+"""
+import collections
+import csv
+import multiprocessing as mp
+import os
+import queue
+import threading
+
+import torch
+
+
+class MetricsRing(object):
+  """Single producer, single consumer ring buffer that never blocks the producer.
+
+  The producer fills a slot and only then publishes it by bumping `_written`,
+  the consumer only reads published slots, so neither side takes a lock.
+  A consumer more than `capacity` items behind loses the oldest ones, they
+  are counted in `dropped`.
+  """
+  def __init__(self, capacity=4096):
+    self.capacity = capacity
+    self._slots = [None] * capacity
+    self._written = 0
+    self._read = 0
+    self.dropped = 0
+
+  def __len__(self):
+    return self._written - self._read
+
+  def put(self, item):
+    self._slots[self._written % self.capacity] = item
+    self._written += 1
+
+  def drain(self):
+    """Returns every item published since the last drain, oldest first."""
+    written = self._written
+    start = max(self._read, written - self.capacity)
+    self.dropped += start - self._read
+    items = [self._slots[i % self.capacity] for i in range(start, written)]
+    self._read = written
+    return items
+
+
+def draw(axes, state):
+  """Draws loss, max Q, screen and action onto 4 matplotlib axes."""
+  for ax, name in zip(axes[:2], ["loss", "max_q"]):
+    ax.clear()
+    ax.set_xlabel("Last %s Training Cycles" % state["history"])
+    ax.set_ylabel({"loss": "Loss", "max_q": "Max Q"}[name])
+    ax.plot(state["scalars"].get(name, []))
+  for ax, name in zip(axes[2:], ["screen", "action"]):
+    ax.clear()
+    ax.set_title(name)
+    if state["images"].get(name) is not None:
+      ax.imshow(state["images"][name])
+
+
+class DeferredScalars(object):
+  """Keeps scalar tensors on their device and hands them to a sink every `every` adds.
+
+  Reading a CUDA tensor's value waits for the device, so the learner only
+  pays for that once per flush instead of once per scalar.
+  """
+  def __init__(self, sink, names, every=100):
+    self.sink = sink
+    self.names = names
+    self.every = every
+    self._pending = []
+
+  def add(self, *values):
+    """Queues one value per name, in the order of names."""
+    self._pending.append(torch.stack([value.detach().float().reshape(()) for value in values]))
+    if len(self._pending) >= self.every:
+      self.flush()
+
+  def flush(self):
+    if not self._pending:
+      return
+    values = torch.stack(self._pending).cpu().numpy()
+    self._pending = []
+    for row in values:
+      for name, value in zip(self.names, row):
+        self.sink.scalar(name, value)
+
+
+class NullSink(object):
+  """Drops every metric, for headless runs that need no plots."""
+  def scalar(self, name, value):
+    pass
+
+  def image(self, name, value):
+    pass
+
+  def start(self):
+    return self
+
+  def close(self):
+    pass
+
+
+class MetricsSink(NullSink):
+  """Base sink: a MetricsRing drained by a background thread that calls render(state)."""
+  def __init__(self, interval=1.0, history=1000, capacity=4096):
+    self.interval = interval
+    self.history = history
+    self._ring = MetricsRing(capacity)
+    self._scalars = collections.defaultdict(lambda: collections.deque(maxlen=history))
+    self._images = {}
+    self._stop = threading.Event()
+    self._thread = None
+
+  def scalar(self, name, value):
+    self._ring.put((name, float(value), False))
+
+  def image(self, name, value):
+    if value is not None:
+      self._ring.put((name, value, True))
+
+  def start(self):
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+      self._thread.start()
+    return self
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      self.update()
+
+  def update(self):
+    """Drains the ring and renders if anything new arrived."""
+    items = self._ring.drain()
+    if not items:
+      return
+    scalars = collections.defaultdict(list)
+    for name, value, is_image in items:
+      if is_image:
+        self._images[name] = value
+      else:
+        self._scalars[name].append(value)
+        scalars[name].append(value)
+    self.render(self.state(), scalars)
+
+  def state(self):
+    return {
+      "history": self.history,
+      "scalars": {name: list(values) for name, values in self._scalars.items()},
+      "images": dict(self._images),
+    }
+
+  def render(self, state, new_scalars):
+    """Called on the background thread with the current state and the scalars added since the last call."""
+    raise NotImplementedError
+
+  def close(self):
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+    self.update()
+
+
+class FileSink(MetricsSink):
+  """Headless sink: redraws `directory`/metrics.png and appends every scalar to metrics.csv."""
+  def __init__(self, directory, interval=10.0, **kwargs):
+    super(FileSink, self).__init__(interval=interval, **kwargs)
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+    self._counts = collections.Counter()
+    self._figure = None
+
+  def render(self, state, new_scalars):
+    with open(os.path.join(self.directory, "metrics.csv"), "a") as f:
+      writer = csv.writer(f)
+      for name, values in new_scalars.items():
+        for value in values:
+          writer.writerow([name, self._counts[name], value])
+          self._counts[name] += 1
+
+    if self._figure is None:
+      # the object oriented API, pyplot's global state is not thread safe
+      from matplotlib.figure import Figure
+      from matplotlib.backends.backend_agg import FigureCanvasAgg
+      self._figure = Figure(figsize=(8, 8))
+      FigureCanvasAgg(self._figure)
+      self._axes = [self._figure.add_subplot(2, 2, i + 1) for i in range(4)]
+    draw(self._axes, state)
+    filename = os.path.join(self.directory, "metrics.png")
+    self._figure.savefig(filename + ".tmp.png")
+    os.replace(filename + ".tmp.png", filename)
+
+
+def _window(states):
+  import matplotlib.pyplot as plt
+  plt.ion()
+  figure = plt.figure()
+  axes = [plt.subplot(2, 2, i + 1) for i in range(4)]
+  while plt.fignum_exists(figure.number):
+    try:
+      state = states.get(timeout=0.1)
+    except queue.Empty:
+      plt.pause(0.05)
+      continue
+    if state is None:
+      break
+    draw(axes, state)
+    plt.pause(0.001)
+
+
+class WindowSink(MetricsSink):
+  """Live matplotlib window drawn by its own process, states it is too busy for are skipped."""
+  def __init__(self, interval=1.0, **kwargs):
+    super(WindowSink, self).__init__(interval=interval, **kwargs)
+    ctx = mp.get_context("spawn")
+    self._states = ctx.Queue(maxsize=1)
+    self._process = ctx.Process(target=_window, args=(self._states,), name="WindowSink", daemon=True)
+
+  def start(self):
+    if not self._process.is_alive() and self._process.exitcode is None:
+      self._process.start()
+    return super(WindowSink, self).start()
+
+  def render(self, state, new_scalars):
+    try:
+      self._states.put_nowait(state)
+    except queue.Full:
+      pass
+
+  def close(self):
+    super(WindowSink, self).close()
+    if self._process.is_alive():
+      try:
+        self._states.put(None, timeout=1)
+      except queue.Full:
+        pass
+      self._process.join(timeout=5)
+      if self._process.is_alive():
+        self._process.terminate()
+
+
+def make_sink(kind="none", directory=None, **kwargs):
+  """Builds a sink of kind none, file (writing into directory) or window."""
+  if kind == "none":
+    return NullSink()
+  if kind == "file":
+    return FileSink(directory, **kwargs)
+  if kind == "window":
+    return WindowSink(**kwargs)
+  raise ValueError("unknown metrics sink %s" % kind)
@@ -0,0 +1,134 @@
+import numpy as np
+
+
+class PolicyGradientMemory(object):
+  """Episodes of transitions for the policy gradient learners, in preallocated arrays.
+
+  append() takes the notebooks' Transition namedtuples (any fields, one of
+  them the reward `r`) and end_episode() closes the current episode, the
+  last one is closed by sample() anyway. The arrays are sized on the first
+  append and double when full. Floating point fields are kept as float32,
+  the network input dtype, rewards as float64 for the returns.
+
+  sample() replaces the rewards by the discounted returns of every stored
+  episode, computed for all episodes together, so one gradient step can
+  train on many episodes.
+  """
+  def __init__(self, gamma=0.9, capacity=1024):
+    self.gamma = gamma
+    self.capacity = capacity
+    self.transition = None
+    self.fields = None
+    self.size = 0
+    self.starts = []
+    self._open = False
+
+  def reset(self):
+    self.size = 0
+    self.starts = []
+    self._open = False
+
+  def _allocate(self, transition):
+    self.transition = type(transition)
+    self.fields = []
+    for name, value in zip(transition._fields, transition):
+      value = np.asarray(value)
+      dtype = np.float64 if name == "r" else np.float32 if value.dtype.kind == "f" else value.dtype
+      self.fields.append(np.zeros((self.capacity,) + value.shape, dtype=dtype))
+
+  def _grow(self):
+    self.capacity *= 2
+    for i, array in enumerate(self.fields):
+      grown = np.zeros((self.capacity,) + array.shape[1:], dtype=array.dtype)
+      grown[:self.size] = array[:self.size]
+      self.fields[i] = grown
+
+  def append(self, transition):
+    if self.fields is None:
+      self._allocate(transition)
+    elif self.size == self.capacity:
+      self._grow()
+    if not self._open:
+      self.starts.append(self.size)
+      self._open = True
+    for array, value in zip(self.fields, transition):
+      array[self.size] = value
+    self.size += 1
+
+  def end_episode(self):
+    """Closes the current episode, the next append() starts a new one."""
+    self._open = False
+
+  def episodes(self):
+    """(starts, lengths) of the stored episodes."""
+    starts = np.array(self.starts, dtype=np.int64)
+    lengths = np.diff(np.append(starts, self.size))
+    return starts, lengths
+
+  def episode_steps(self):
+    """Time step of every transition within its episode."""
+    starts, lengths = self.episodes()
+    return np.arange(self.size) - np.repeat(starts, lengths)
+
+  def returns(self):
+    starts, lengths = self.episodes()
+    return discounted_returns(self.fields[self.transition._fields.index("r")][:self.size], starts, lengths,
+                              self.gamma)
+
+  def sample(self, padded=False, normalise=False):
+    """Every stored transition with r replaced by its discounted return.
+
+    Returns one array per Transition field, the transitions of all episodes
+    one after the other, returns as float32. With normalise the returns
+    are shifted and scaled to zero mean and unit variance over the batch.
+    With padded every array is (episodes, longest episode, ...) instead,
+    zero after the end of shorter episodes, followed by a bool mask of the
+    real steps.
+    """
+    r = self.returns()
+    if normalise:
+      r = (r - r.mean()) / (r.std() + 1e-8)
+    index = self.transition._fields.index("r")
+    batch = [array[:self.size] for array in self.fields]
+    batch[index] = r.astype(np.float32)
+    if not padded:
+      return batch
+
+    starts, lengths = self.episodes()
+    mask = np.arange(lengths.max()) < lengths[:, None]
+    out = []
+    for array in batch:
+      padded_array = np.zeros(mask.shape + array.shape[1:], dtype=array.dtype)
+      padded_array[mask] = array
+      out.append(padded_array)
+    return out + [mask]
+
+  def __len__(self):
+    return self.size
+
+  def __str__(self):
+    result = []
+    for i in range(self.size):
+      result.append(self.transition(*[array[i] for array in self.fields]).__str__() + " \n")
+    return "".join(result)
+
+
+def discounted_returns(r, starts, lengths, gamma):
+  """r[t] + gamma * r[t + 1] + ... to the end of each episode, for every step of the flat r.
+
+  Episode i is r[starts[i]:starts[i] + lengths[i]]. All episodes are
+  scanned backwards together, one vector op per step of the longest one.
+  """
+  returns = np.empty(len(r), dtype=np.float64)
+  # longest first, the episodes still running k steps before their end are then a prefix
+  order = np.argsort(-lengths, kind="stable")
+  ends = (starts + lengths)[order]
+  descending = -lengths[order]
+  running = np.zeros(len(order))
+  longest = -descending[0] if len(order) else 0
+  for k in range(1, longest + 1):
+    n = np.searchsorted(descending, -k, side="right")
+    indices = ends[:n] - k
+    running[:n] = r[indices] + gamma * running[:n]
+    returns[indices] = running[:n]
+  return returns
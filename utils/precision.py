@@ -0,0 +1,55 @@
+import torch
+import torch.optim as optim
+
+PRECISIONS = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+COMPILE_MODES = ["none", "script", "compile"]
+
+
+def compile_network(network, mode="none"):
+  """Returns network scripted (torch.jit.script) or compiled (torch.compile), or as is for mode none.
+
+  Both share the network's parameters, so keep training, syncing and
+  saving the original module and only call the returned one.
+  """
+  if mode == "none":
+    return network
+  if mode == "script":
+    return torch.jit.script(network)
+  if mode == "compile":
+    return torch.compile(network)
+  raise ValueError("unknown compile mode %s" % mode)
+
+
+def make_adam(parameters, lr, fused=False):
+  """Adam, fused into one kernel per step over all parameters when fused is set."""
+  if fused:
+    return optim.Adam(parameters, lr=lr, fused=True)
+  return optim.Adam(parameters, lr=lr)
+
+
+class MixedPrecision(object):
+  """Autocast and loss scaling for a learner step at `precision` (fp32, bf16 or fp16).
+
+  Run the forward pass and loss under autocast(), then call backward(loss)
+  and step(optimizer). bf16 keeps fp32's exponent range and needs no
+  scaling, fp16 gradients go through a GradScaler. fp32 leaves everything
+  as it was.
+  """
+  def __init__(self, device, precision="fp32"):
+    if precision not in PRECISIONS:
+      raise ValueError("unknown precision %s" % precision)
+    self.device = device
+    self.precision = precision
+    self.dtype = PRECISIONS[precision]
+    self._scaler = torch.amp.GradScaler(device.type, enabled=self.dtype == torch.float16)
+
+  def autocast(self):
+    return torch.autocast(device_type=self.device.type, dtype=self.dtype or torch.float32,
+                          enabled=self.dtype is not None)
+
+  def backward(self, loss):
+    self._scaler.scale(loss).backward()
+
+  def step(self, optimizer):
+    self._scaler.step(optimizer)
+    self._scaler.update()
@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class BatchPrefetcher(object):
+  """Keeps up to `depth` ready batches in a bounded queue, filled by a background thread.
+
+  `sample` is called while holding `lock`, so any other thread that mutates
+  the replay memory (push, priority updates) must hold the same lock.
+  `convert` runs outside the lock, e.g. to turn the numpy batch into tensors
+  in pinned memory or on the target device.
+  """
+  def __init__(self, sample, convert=None, depth=4, lock=None):
+    self._sample = sample
+    self._convert = convert
+    self.depth = depth
+    self.lock = lock or threading.Lock()
+    self._queue = queue.Queue(maxsize=depth)
+    self._stop = threading.Event()
+    self._thread = None
+    self._error = None
+
+    self.batches = 0
+    self.stalls = 0
+    self.stall_time = 0.0
+    self._queue_depth_sum = 0
+
+  def start(self):
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._run, name="BatchPrefetcher", daemon=True)
+      self._thread.start()
+    return self
+
+  def _run(self):
+    try:
+      while not self._stop.is_set():
+        with self.lock:
+          batch = self._sample()
+        if self._convert is not None:
+          batch = self._convert(batch)
+        while not self._stop.is_set():
+          try:
+            self._queue.put(batch, timeout=0.1)
+            break
+          except queue.Full:
+            pass
+    except Exception as e:
+      self._error = e
+
+  def get(self):
+    """Pops a ready batch, waiting for the background thread if none is queued."""
+    queue_depth = self._queue.qsize()
+    start_time = time.time()
+    while True:
+      if self._error is not None:
+        raise self._error
+      try:
+        batch = self._queue.get(timeout=0.1)
+        break
+      except queue.Empty:
+        pass
+    if queue_depth == 0:
+      self.stalls += 1
+      self.stall_time += time.time() - start_time
+    self.batches += 1
+    self._queue_depth_sum += queue_depth
+    return batch
+
+  def stats(self):
+    return {
+      "batches": self.batches,
+      "mean_queue_depth": self._queue_depth_sum / max(self.batches, 1),
+      "stalls": self.stalls,
+      "stall_time": self.stall_time,
+    }
+
+  def close(self):
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+  def __str__(self):
+    return "prefetch: %(batches)s batches, mean queue depth %(mean_queue_depth).2f, " \
+           "%(stalls)s stalls, %(stall_time).3f seconds stalled" % self.stats()
+
+
+class PriorityWriter(object):
+  """Applies replay priority updates on a background thread, so the learner never waits on the host.
+
+  put() takes the sampled indices and their TD errors, which may still be
+  device tensors. The thread copies them to the host, merges everything
+  queued since its last pass (the newest error of an index wins) and calls
+  `update` once for all of it while holding `lock`, the prefetcher's lock.
+  put() only blocks once `depth` updates are waiting.
+  """
+  def __init__(self, update, lock, depth=64):
+    self._update = update
+    self.lock = lock
+    self._queue = queue.Queue(maxsize=depth)
+    self._stop = threading.Event()
+    self._thread = None
+    self._error = None
+
+    self.updates = 0
+    self.writes = 0
+
+  def start(self):
+    if self._thread is None:
+      self._stop.clear()
+      self._thread = threading.Thread(target=self._run, name="PriorityWriter", daemon=True)
+      self._thread.start()
+    return self
+
+  def put(self, indices, errors):
+    if self._error is not None:
+      raise self._error
+    self.start()
+    self._queue.put((indices, errors))
+
+  def _run(self):
+    while not self._stop.is_set():
+      try:
+        items = [self._queue.get(timeout=0.1)]
+      except queue.Empty:
+        continue
+      while True:
+        try:
+          items.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+      try:
+        self._write(items)
+      except Exception as e:
+        self._error = e
+      finally:
+        for _ in items:
+          self._queue.task_done()
+
+  def _write(self, items):
+    indices = np.concatenate([np.asarray(indices) for indices, _ in items])
+    errors = np.concatenate([_to_numpy(errors).reshape(-1) for _, errors in items])
+    # keep the last error of every index
+    _, last = np.unique(indices[::-1], return_index=True)
+    keep = len(indices) - 1 - last
+    with self.lock:
+      self._update(indices[keep], errors[keep])
+    self.updates += len(items)
+    self.writes += 1
+
+  def flush(self):
+    """Blocks until every queued update reached the replay memory."""
+    if self._thread is not None:
+      self._queue.join()
+    if self._error is not None:
+      raise self._error
+
+  def close(self):
+    try:
+      self.flush()
+    finally:
+      self._stop.set()
+      if self._thread is not None:
+        self._thread.join()
+        self._thread = None
+
+  def __str__(self):
+    return "priorities: %s updates in %s writes" % (self.updates, self.writes)
+
+
+def _to_numpy(values):
+  if hasattr(values, "detach"):
+    return values.detach().float().cpu().numpy()
+  return np.asarray(values)
@@ -0,0 +1,194 @@
+import functools
+
+import numpy as np
+
+from utils.epsilon import Epsilon
+
+
+class QTable(object):
+  """Q values of the tabular learners in a dense (num_states, num_actions) float array.
+
+  Hashable states (ints, tuples of bins) are mapped to row indices the
+  first time they are seen, their Q values start at initial_q and the array
+  doubles whenever it runs out of rows. With num_states set the states are
+  already row indices in [0, num_states), the array is allocated once and no
+  mapping is kept, which is what the batched methods want.
+
+  get_Q, get_max_Q, set_Q and get_max_a_for_Q keep the notebooks' interface
+  for single states. index()/indices() turn states into rows and max_Q,
+  argmax and update work on arrays of rows at once.
+  """
+  def __init__(self, num_actions=4, num_states=None, capacity=64, initial_q=0., dtype=np.float64):
+    self.num_actions = num_actions
+    self.initial_q = initial_q
+    self.dense = num_states is not None
+    self._states = {}
+    self.size = num_states if self.dense else 0
+    self.Q = np.full((num_states if self.dense else capacity, num_actions), initial_q, dtype=dtype)
+
+  def index(self, s):
+    """Row of state s, adding a row for it if it is new."""
+    if self.dense:
+      return s
+    row = self._states.get(s)
+    if row is None:
+      row = self._states[s] = self.size
+      self.size += 1
+      if self.size > len(self.Q):
+        self._grow()
+    return row
+
+  def indices(self, states):
+    if self.dense:
+      return np.asarray(states)
+    return np.array([self.index(s) for s in states], dtype=np.int64)
+
+  def _grow(self):
+    Q = np.full((2 * len(self.Q), self.num_actions), self.initial_q, dtype=self.Q.dtype)
+    Q[:len(self.Q)] = self.Q
+    self.Q = Q
+
+  """Q(s, a): get the Q value of (s, a) pair"""
+  def get_Q(self, s, a):
+    row = self.index(s)
+    return self.Q[row, a]
+
+  """max Q(s): get the max of all Q value of state s"""
+  def get_max_Q(self, s):
+    row = self.index(s)
+    return self.Q[row].max()
+
+  """Q(s, a) = q: update the q value of (s, a) pair"""
+  def set_Q(self, s, a, q):
+    row = self.index(s)
+    self.Q[row, a] = q
+
+  """argmax_a Q(s, a): get the action which has the highest Q in state s, ties broken at random"""
+  def get_max_a_for_Q(self, s):
+    row = self.index(s)
+    Q = self.Q[row]
+    best = np.flatnonzero(Q == Q.max())
+    return int(best[0]) if len(best) == 1 else int(np.random.choice(best))
+
+  def max_Q(self, rows):
+    rows = np.asarray(rows)
+    if self.size <= len(rows):
+      return _row_max(self.Q[:self.size])[rows]
+    return _row_max(self.Q[rows])
+
+  def argmax(self, rows):
+    """Greedy action of every row, a uniformly random one among equal maxima."""
+    rows = np.asarray(rows)
+    if self.size <= len(rows):
+      # many copies per state: rank the ties once per table row
+      Q = self.Q[:self.size]
+      best = Q == _row_max(Q)[:, None]
+      ranked = np.argsort(~best, axis=1, kind="stable")
+      counts = best.sum(axis=1)
+      k = (np.random.uniform(size=len(rows)) * counts[rows]).astype(np.int64)
+      return ranked[rows, k]
+    Q = self.Q[rows]
+    best = Q == _row_max(Q)[:, None]
+    return (np.random.uniform(size=best.shape) * best).argmax(axis=1)
+
+  def update(self, s, a, r, s_1, done, alpha, gamma):
+    """Applies the Q-learning update of every (s, a, r, s_1, done) row in one go.
+
+    s and s_1 are rows (see indices()). All targets are computed from the
+    table as it was before the call. A (s, a) pair that appears several
+    times moves by alpha times its mean TD error, as if its updates were
+    one. Returns the TD errors.
+    """
+    s, a, s_1 = np.asarray(s), np.asarray(a), np.asarray(s_1)
+    target = r + gamma * (1 - np.asarray(done, dtype=self.Q.dtype)) * self.max_Q(s_1)
+    Q = self.Q.reshape(-1)
+    cells = s * self.num_actions + a
+    errors = target - Q[cells]
+    if Q.size <= 16 * len(cells):
+      # small tables: sum over every cell, cheaper than sorting the batch
+      sums = np.bincount(cells, weights=errors, minlength=Q.size)
+      counts = np.bincount(cells, minlength=Q.size)
+      cells = np.flatnonzero(counts)
+      sums, counts = sums[cells], counts[cells]
+    else:
+      cells, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+      sums = np.bincount(inverse, weights=errors)
+    Q[cells] += alpha * sums / counts
+    return errors
+
+  def states(self):
+    """Every state that has a row, in row order."""
+    if self.dense:
+      return list(range(self.size))
+    return sorted(self._states, key=self._states.get)
+
+  def __len__(self):
+    return self.size
+
+  def __str__(self):
+    output = []
+    for s in self.states():
+      output.append(s.__str__() + ": " + ["{:07.4f}".format(a) for a in self.Q[self.index(s)]].__str__())
+    output.sort()
+    return "QTable (number of actions = " + str(self.num_actions) + ", states = " + str(len(output)) + "):\n" + "\n".join(output)
+
+
+def _row_max(Q):
+  """Max of every row, column by column, numpy's axis=1 reduction is slow for a handful of columns."""
+  return functools.reduce(np.maximum, Q.T)
+
+
+class BatchQLearner(object):
+  """Q-learning on all copies of a batched tabular env (e.g. BatchFrozenLake) per tick.
+
+  Every tick picks an epsilon greedy action for each copy, steps them all
+  and applies every transition in one QTable.update(). With shared set all
+  copies learn one table, otherwise copy i keeps its own in rows
+  i * num_states .. (i + 1) * num_states of Q. Copies whose episode ended are
+  reset and epsilon decays once per finished episode.
+  """
+  def __init__(self, env, alpha=0.1, gamma=0.9, epsilon=None, shared=True):
+    self.env = env
+    self.alpha = alpha
+    self.gamma = gamma
+    self.epsilon = epsilon or Epsilon(start=1.0, end=0.01, update_increment=0.01)
+    self.shared = shared
+    copies = 1 if shared else len(env)
+    self.Q = QTable(num_actions=env.num_actions, num_states=copies * env.num_states)
+    self._offsets = 0 if shared else np.arange(len(env)) * env.num_states
+    self.episode_rewards = []
+    self.episode_lengths = []
+
+  def rows(self, s):
+    return s + self._offsets
+
+  def get_actions(self, s):
+    actions = self.Q.argmax(self.rows(s))
+    explore = np.random.uniform(size=len(s)) < self.epsilon.value()
+    actions[explore] = np.random.randint(self.env.num_actions, size=explore.sum())
+    return actions
+
+  def train(self, episodes=100):
+    """Runs until `episodes` episodes finished over all copies, returns the ticks it took."""
+    self.epsilon.isTraining = True
+    finished = 0
+    ticks = 0
+    returns = np.zeros(len(self.env))
+    s = self.env.reset()
+    while finished < episodes:
+      actions = self.get_actions(s)
+      s_1, r, done, truncated = self.env.step(actions)
+      self.Q.update(self.rows(s), actions, r, self.rows(s_1), done, self.alpha, self.gamma)
+      returns += r
+      ticks += 1
+
+      ended = np.flatnonzero(done | truncated)
+      s = s_1.copy()
+      if len(ended):
+        self.episode_rewards.extend(returns[ended])
+        self.episode_lengths.extend(self.env.steps[ended])
+        returns[ended] = 0
+        s[ended] = self.env.reset(ended)
+        self.epsilon.increment(len(ended))
+        finished += len(ended)
+    return ticks
@@ -1,111 +1,728 @@
 from collections import namedtuple, deque
+import json
+import os
 import random
+import threading
 import numpy as np
 
+from utils.sum_tree import SumTree, MinTree
+
 
 Transition = namedtuple("Transition", ["s", "a", "s_1", "r", "done"])
 
 
+class TransitionStorage(object):
+  """Ring of preallocated arrays, one per Transition field.
+
+  The arrays are sized to `capacity` on the first write, using that
+  transition's shapes. Rewards are always float64 and dones bool so n-step
+  returns and `1 - done` behave the same as with python lists.
+  """
+  dtypes = Transition(None, None, None, np.float64, np.bool_)
+
+  def __init__(self, capacity):
+    self.capacity = capacity
+    self.fields = None
+    self.size = 0
+
+  def allocate(self, name, shape, dtype):
+    return np.zeros(shape, dtype=dtype)
+
+  def _allocate_fields(self, item):
+    arrays = []
+    for name, value, dtype in zip(Transition._fields, item, self.dtypes):
+      value = np.asarray(value, dtype=dtype)
+      arrays.append(self.allocate(name, (self.capacity,) + value.shape, value.dtype))
+    self.fields = Transition(*arrays)
+
+  def write(self, index, item):
+    if self.fields is None:
+      self._allocate_fields(item)
+    fields = self.fields
+    fields.s[index] = item.s
+    fields.a[index] = item.a
+    fields.s_1[index] = item.s_1
+    fields.r[index] = item.r
+    fields.done[index] = item.done
+    if index >= self.size:
+      self.size = index + 1
+
+  def _attach(self, arrays, header):
+    if "s" in arrays:
+      self.fields = Transition(*[arrays[name] for name in Transition._fields])
+
+  def flush(self, state):
+    pass
+
+  def named_arrays(self):
+    if self.fields is None:
+      return {}
+    return dict(zip(Transition._fields, self.fields))
+
+  def state_dict(self):
+    """A copy of the filled part of every array plus the ring state."""
+    return {
+      "header": {"size": self.size, "count": len(self)},
+      "arrays": {name: array[:self.size].copy() for name, array in self.named_arrays().items()},
+    }
+
+  def load_state_dict(self, state):
+    header = state["header"]
+    if header["size"] > self.capacity:
+      raise ValueError("cannot load %s transitions into a capacity of %s" % (header["size"], self.capacity))
+    arrays = self.named_arrays()
+    for name, array in state["arrays"].items():
+      if name not in arrays:
+        arrays[name] = self.allocate(name, (self.capacity,) + array.shape[1:], array.dtype)
+      arrays[name][:len(array)] = array
+    self.size = header["size"]
+    self._attach(arrays, header)
+
+  def gather(self, indices):
+    """One fancy-index gather per field."""
+    return Transition(*[array[indices] for array in self.fields])
+
+  def successor(self, indices, newest):
+    """Slot of the transition stored right after each index, and whether it exists."""
+    following = (indices + 1) % self.capacity
+    return following, (following < self.size) & (indices != newest)
+
+  def next_states(self, indices):
+    return self.fields.s_1[indices]
+
+  def __getitem__(self, index):
+    if index >= self.size:
+      raise IndexError("transition index out of range")
+    return Transition(*[array[index] for array in self.fields])
+
+  def __len__(self):
+    return self.size
+
+  def bytes_per_transition(self):
+    if self.fields is None:
+      return 0
+    return sum(array.nbytes for array in self.fields) // self.capacity
+
+
+class FrameStorage(TransitionStorage):
+  """Stores every observation once, in a ring of frame slots.
+
+  Slot i holds frame i. When valid[i] is set, slot i also holds the
+  transition that starts at frame i and ends at frame next_index[i], so
+  s_1 is rebuilt from a neighbouring slot at sample time. Slots holding
+  the last frame of a stream have no transition of their own.
+  """
+  def __init__(self, capacity):
+    super().__init__(capacity)
+    self.frames = None
+    self.next_index = self.allocate("next_index", (capacity,), np.int64)
+    self.valid = self.allocate("valid", (capacity,), np.bool_)
+    self.count = 0
+
+  def _allocate_fields(self, item):
+    arrays = []
+    for name in ["a", "r", "done"]:
+      dtype = getattr(self.dtypes, name)
+      value = np.asarray(getattr(item, name), dtype=dtype)
+      arrays.append(self.allocate(name, (self.capacity,) + value.shape, value.dtype))
+    self.fields = Transition(None, arrays[0], None, arrays[1], arrays[2])
+
+  def write_frame(self, index, frame):
+    if self.frames is None:
+      frame = np.asarray(frame)
+      self.frames = self.allocate("s", (self.capacity,) + frame.shape, frame.dtype)
+    self.invalidate(index)
+    self.frames[index] = frame
+    self.size = max(self.size, index + 1)
+
+  def _attach(self, arrays, header):
+    if "s" in arrays:
+      self.frames = arrays["s"]
+    if "a" in arrays:
+      self.fields = Transition(None, arrays["a"], None, arrays["r"], arrays["done"])
+    # after a crash valid and next_index also hold what was written since the header's flush.
+    # The ring restarts at the flushed position, so a transition whose s_1 frame comes before
+    # its own slot in the new write order would point at a fresh frame, drop those
+    if "position" in header:
+      stored = np.flatnonzero(self.valid)
+      order = (stored - header["position"]) % self.capacity
+      self.valid[stored[(self.next_index[stored] - header["position"]) % self.capacity < order]] = False
+    stored = np.flatnonzero(self.valid)
+    self.count = len(stored)
+    if self.count:
+      self.size = max(self.size, int(stored[-1]) + 1, int(self.next_index[stored].max()) + 1)
+
+  def named_arrays(self):
+    arrays = {"next_index": self.next_index, "valid": self.valid}
+    if self.frames is not None:
+      arrays["s"] = self.frames
+    if self.fields is not None:
+      arrays.update(a=self.fields.a, r=self.fields.r, done=self.fields.done)
+    return arrays
+
+  def invalidate(self, index):
+    if self.valid[index]:
+      self.valid[index] = False
+      self.count -= 1
+
+  def write(self, index, item):
+    """Writes a transition whose s and s_1 are frame slot indices."""
+    if self.fields is None:
+      self._allocate_fields(item)
+    self.fields.a[index] = item.a
+    self.fields.r[index] = item.r
+    self.fields.done[index] = item.done
+    self.next_index[index] = item.s_1
+    if not self.valid[index]:
+      self.valid[index] = True
+      self.count += 1
+
+  def gather(self, indices):
+    return Transition(self.frames[indices], self.fields.a[indices],
+                      self.frames[self.next_index[indices]],
+                      self.fields.r[indices], self.fields.done[indices])
+
+  def successor(self, indices, newest):
+    # a stream continues in the slot of its s_1 frame, until the stream ends
+    following = self.next_index[indices]
+    return following, self.valid[following]
+
+  def next_states(self, indices):
+    return self.frames[self.next_index[indices]]
+
+  def __getitem__(self, index):
+    if index >= self.size or not self.valid[index]:
+      raise IndexError("no transition stored at index")
+    return Transition(self.frames[index], self.fields.a[index], self.frames[self.next_index[index]],
+                      self.fields.r[index], self.fields.done[index])
+
+  def __len__(self):
+    return self.count
+
+  def bytes_per_transition(self):
+    arrays = [self.frames, self.next_index, self.valid]
+    if self.fields is not None:
+      arrays += [self.fields.a, self.fields.r, self.fields.done]
+    return sum(array.nbytes for array in arrays if array is not None) // self.capacity
+
+
+class MemmapStorageMixin(object):
+  """Backs every array of a storage with a numpy.memmap file in `path`.
+
+  Each field gets its own `<name>.bin` file and `header.json` records their
+  dtypes and shapes plus the ring state at the last flush(), so reopening the
+  same path resumes with the buffer intact. The header is replaced
+  atomically, data written after the last flush may be lost on a crash.
+  """
+  header_name = "header.json"
+
+  def __init__(self, capacity, path):
+    self.path = path
+    self.arrays = {}
+    os.makedirs(path, exist_ok=True)
+    self.header = self._read_header()
+    if self.header and self.header["capacity"] != capacity:
+      raise ValueError("%s holds a replay memory of capacity %s, not %s" % (
+          path, self.header["capacity"], capacity))
+    super().__init__(capacity)
+    self.restored = bool(self.header)
+    if self.restored:
+      for name, spec in self.header["arrays"].items():
+        if name not in self.arrays:
+          self.allocate(name, tuple(spec["shape"]), spec["dtype"])
+      self.size = self.header["size"]
+      self._attach(self.arrays, self.header)
+
+  def _read_header(self):
+    filename = os.path.join(self.path, self.header_name)
+    if not os.path.isfile(filename):
+      return {}
+    with open(filename) as f:
+      return json.load(f)
+
+  def allocate(self, name, shape, dtype):
+    filename = os.path.join(self.path, name + ".bin")
+    exists = name in self.header.get("arrays", {}) and os.path.isfile(filename)
+    array = np.memmap(filename, dtype=dtype, mode="r+" if exists else "w+", shape=shape)
+    self.arrays[name] = array
+    return array
+
+  def flush(self, state):
+    for array in self.arrays.values():
+      array.flush()
+    header = dict(state)
+    header["capacity"] = self.capacity
+    header["size"] = self.size
+    header["count"] = getattr(self, "count", self.size)
+    header["arrays"] = {name: {"dtype": array.dtype.str, "shape": list(array.shape)}
+                        for name, array in self.arrays.items()}
+    filename = os.path.join(self.path, self.header_name)
+    with open(filename + ".tmp", "w") as f:
+      json.dump(header, f)
+    os.replace(filename + ".tmp", filename)
+    self.header = header
+
+
+class MemmapTransitionStorage(MemmapStorageMixin, TransitionStorage):
+  pass
+
+
+class MemmapFrameStorage(MemmapStorageMixin, FrameStorage):
+  pass
+
+
+class NStepStream(object):
+  """The n-step window still waiting to be stored for one stream of pushes."""
+  def __init__(self, n):
+    self.short_term_memory = deque(maxlen=n)
+    # rewards of short_term_memory, each written twice so the window is one contiguous slice
+    self._rewards = np.zeros(2 * n)
+    self._start = 0
+    self.last_frame = None
+
+  def append(self, item):
+    n = self.short_term_memory.maxlen
+    end = (self._start + len(self.short_term_memory)) % n
+    self._rewards[end] = self._rewards[end + n] = item.r
+    self.short_term_memory.append(item)
+
+  def popleft(self, gamma_powers):
+    """The oldest transition and its discounted return over the rest of the window."""
+    k = len(self.short_term_memory)
+    reward = float(np.dot(self._rewards[self._start:self._start + k], gamma_powers[:k]))
+    self._start = (self._start + 1) % self.short_term_memory.maxlen
+    return self.short_term_memory.popleft(), reward
+
+
 class ReplayMemory(object):
-  def __init__(self, capacity=1000, multi_step_n=0, multi_step_gamma=0.99):
+  """Replay memory of Transitions with optional n-step returns.
+
+  dedup_frames stores each observation once (see FrameStorage). path moves
+  the storage into memory mapped files under that directory, for capacities
+  beyond RAM; call flush() to make the current contents resumable.
+  lazy_multi_step stores 1-step transitions and builds the n-step ones at
+  sample time, so n can be changed per sample() without refilling. Without
+  dedup_frames it assumes consecutive pushes belong to a single stream.
+
+  Several actors can share one memory by pushing with their own `stream`
+  id, each stream keeps its own n-step window and frame chain.
+  """
+  def __init__(self, capacity=1000, multi_step_n=0, multi_step_gamma=0.99, dedup_frames=False, path=None,
+               lazy_multi_step=False):
     self.capacity = capacity
-    self.memory = []
+    self.dedup_frames = dedup_frames
+    self.path = path
+    self.lazy_multi_step = lazy_multi_step
+    self.memory = self._create_storage()
     self.n = multi_step_n + 1
     self.gamma = multi_step_gamma
-    self.short_term_memory = deque(maxlen=self.n)
+    self._gamma_powers = self.gamma ** np.arange(self.n)
+    self._streams = {}
     self.position = 0
+    if self.path is not None and self.memory.restored:
+      self.position = self.memory.header["position"]
+      for stream, last_frame in self.memory.header["last_frames"].items():
+        self._stream(int(stream)).last_frame = last_frame
 
-  def push(self, item):
-    self.short_term_memory.append(item)
-    if len(self.short_term_memory) == self.n:
-      self._pop_short_term_memory()
+  def _create_storage(self):
+    if self.path is not None:
+      if self.dedup_frames:
+        return MemmapFrameStorage(self.capacity, self.path)
+      return MemmapTransitionStorage(self.capacity, self.path)
+    if self.dedup_frames:
+      return FrameStorage(self.capacity)
+    return TransitionStorage(self.capacity)
+
+  def flush(self):
+    """Writes memory mapped storage to disk, a no-op for in-memory storage."""
+    last_frames = {str(i): stream.last_frame for i, stream in self._streams.items()}
+    self.memory.flush({"position": self.position, "last_frames": last_frames})
+
+  def state_dict(self):
+    """A copy of the stored transitions and ring state, numpy arrays plus a json-able header.
+
+    Transitions still waiting in an n-step window are not included.
+    """
+    state = self.memory.state_dict()
+    state["header"].update(capacity=self.capacity, position=self.position,
+                           last_frames={str(i): stream.last_frame for i, stream in self._streams.items()})
+    return state
+
+  def load_state_dict(self, state):
+    header = state["header"]
+    if header["capacity"] != self.capacity:
+      raise ValueError("cannot load a replay memory of capacity %s into one of %s" % (
+          header["capacity"], self.capacity))
+    self.memory.load_state_dict(state)
+    self.position = header["position"]
+    for stream, last_frame in header["last_frames"].items():
+      self._stream(int(stream)).last_frame = last_frame
+
+  def _stream(self, stream):
+    if stream not in self._streams:
+      self._streams[stream] = NStepStream(self.n)
+    return self._streams[stream]
+
+  def push(self, item, stream=0):
+    pending = self._stream(stream)
+    if self.dedup_frames:
+      item = self._push_frames(item, pending)
+
+    if self.n == 1 or self.lazy_multi_step:
+      self._store_memory(item)
+      return
+
+    pending.append(item)
+    if len(pending.short_term_memory) == self.n:
+      self._pop_short_term_memory(pending)
 
     if item.done == True:
-      while len(self.short_term_memory) > 0:
-        self._pop_short_term_memory()
-
-    # print("short term mem:", self.short_term_memory)
-    # print(len(self.short_term_memory))
-
-  def _pop_short_term_memory(self):
-    reward = 0
-    st_mem_len = len(self.short_term_memory)
-    last_transition = self.short_term_memory[st_mem_len-1]
-    for i in range(st_mem_len):
-      reward += self.short_term_memory[i].r * (self.gamma ** i)
-    # print("reward", reward)
-    transition = self.short_term_memory.popleft()
+      while len(pending.short_term_memory) > 0:
+        self._pop_short_term_memory(pending)
+
+  def _pop_short_term_memory(self, pending):
+    last_transition = pending.short_term_memory[-1]
+    transition, reward = pending.popleft(self._gamma_powers)
     transition = Transition(transition.s, transition.a, last_transition.s_1, reward, last_transition.done)
     self._store_memory(transition)
 
+  def _push_frames(self, item, pending):
+    """Writes the frames of item once and swaps them for their slot indices.
+
+    A stream continues while each s equals the previous s_1. When it breaks
+    (a new episode), the pending n-step window is flushed so no transition
+    spans the boundary, and the first frame of the new stream gets a slot.
+    """
+    last_frame = pending.last_frame
+    if last_frame is None or not np.array_equal(item.s, self.memory.frames[last_frame]):
+      while len(pending.short_term_memory) > 0:
+        self._pop_short_term_memory(pending)
+      s = self._write_frame(item.s)
+    else:
+      s = last_frame
+    pending.last_frame = self._write_frame(item.s_1)
+    return Transition(s, item.a, pending.last_frame, item.r, item.done)
+
+  def _write_frame(self, frame):
+    index = self.position
+    self._invalidate(index)
+    self.memory.write_frame(index, frame)
+    self.position = (self.position + 1) % self.capacity
+    return index
+
+  def _invalidate(self, index):
+    self.memory.invalidate(index)
+
   def _store_memory(self, item):
     """Saves a transition."""
-    if len(self.memory) < self.capacity:
-      self.memory.append(None)
-    self.memory[self.position] = item
-    self.position = (self.position + 1) % self.capacity
+    if self.dedup_frames:
+      # the transition lives in the slot of its first frame
+      index = item.s
+    else:
+      index = self.position
+      self.position = (self.position + 1) % self.capacity
+    self._write(index, item)
+
+  def _write(self, index, item):
+    self.memory.write(index, item)
 
-  def sample(self, batch_size=2):
-    samples = random.sample(self.memory, batch_size)
-    return self._split_transition_samples(samples)
+  def sample(self, batch_size=2, multi_step_n=None):
+    return self._gather(self._sample_indices(batch_size), multi_step_n)
 
-  """splits a list of Transitions into [s, a, s_1, r, done]"""
-  def _split_transition_samples(self, samples):
-    batched = Transition(*zip(*samples))
-    s = np.array(list(batched.s))
-    a = np.expand_dims(np.array(list(batched.a)), axis=1)
-    s_1 = np.array(list(batched.s_1))
-    r = np.expand_dims(np.array(list(batched.r)), axis=1)
-    done = np.expand_dims(np.array(list(batched.done)), axis=1)
-    return [s, a, s_1, r, done]
+  def _sample_indices(self, batch_size):
+    if not self.dedup_frames:
+      return random.sample(range(len(self)), batch_size)
+    # stream end frames and pending transitions are a small fraction, redraw them
+    valid = self.memory.valid
+    indices = np.random.randint(self.memory.size, size=batch_size)
+    invalid = ~valid[indices]
+    while invalid.any():
+      indices[invalid] = np.random.randint(self.memory.size, size=invalid.sum())
+      invalid = ~valid[indices]
+    return indices
+
+  def bytes_per_transition(self):
+    """Bytes of storage per replay slot, once the first transition is stored."""
+    return self.memory.bytes_per_transition()
+
+  """gathers the transitions at indices as [s, a, s_1, r, done]"""
+  def _gather(self, indices, multi_step_n=None):
+    batched = self.memory.gather(indices)
+    s_1, r, done = batched.s_1, batched.r, batched.done
+    if self.lazy_multi_step:
+      n = self.n if multi_step_n is None else multi_step_n + 1
+      if n > 1:
+        s_1, r, done = self._n_step(np.asarray(indices), n, r, done)
+    a = np.expand_dims(batched.a, axis=1)
+    r = np.expand_dims(r, axis=1)
+    done = np.expand_dims(done, axis=1)
+    return [batched.s, a, s_1, r, done]
+
+  def _n_step(self, indices, n, r, done):
+    """Folds the next n-1 stored rewards into r, stopping at done or the end of a stream."""
+    r = r.copy()
+    done = done.copy()
+    last = indices
+    active = ~done
+    newest = (self.position - 1) % self.capacity
+    for i in range(1, n):
+      following, exists = self.memory.successor(last, newest)
+      active &= exists
+      if not active.any():
+        break
+      last = np.where(active, following, last)
+      step_done = self.memory.fields.done[last]
+      r += np.where(active, self.memory.fields.r[last] * (self.gamma ** i), 0)
+      done |= active & step_done
+      active &= ~step_done
+    return self.memory.next_states(last), r, done
 
   def __len__(self):
     return len(self.memory)
 
   def __str__(self):
     result = []
-    for i in range(self.__len__()):
+    for i in self._stored_indices():
       result.append(self.memory[i].__str__() + " \n")
     return "".join(result)
 
+  def _stored_indices(self):
+    if self.dedup_frames:
+      return np.flatnonzero(self.memory.valid[:self.memory.size])
+    return range(self.__len__())
 
-# Proportional: I don't understand SumTrees
+
+# Proportional prioritisation backed by a sum tree for sampling and a min tree
+# for the smallest priority (needed for importance sampling weights).
+#
+# The importance sampling exponent starts at `beta` and grows by
+# `beta_increment` with every sample() call until it reaches `beta_end`.
 class PrioritisedReplayMemory(ReplayMemory):
-  def __init__(self, capacity, multi_step_n=0, multi_step_gamma=0.99, e=0.1, alpha=0.5):
-    super().__init__(capacity=capacity, multi_step_n=multi_step_n, multi_step_gamma=multi_step_gamma)
-    self.errors = []
+  def __init__(self, capacity, multi_step_n=0, multi_step_gamma=0.99, e=0.1, alpha=0.5, dedup_frames=False,
+               path=None, lazy_multi_step=False, beta=1.0, beta_end=1.0, beta_increment=0.0):
+    super().__init__(capacity=capacity, multi_step_n=multi_step_n, multi_step_gamma=multi_step_gamma,
+                     dedup_frames=dedup_frames, path=path, lazy_multi_step=lazy_multi_step)
+    self.errors = self.memory.allocate("errors", (capacity,), np.float64)
     self.e = e
     self.alpha = alpha
-    self.beta = 1
+    self.beta = beta
+    self.beta_end = beta_end
+    self.beta_increment = beta_increment
+    self.initial_error = 10000
+    self._push_error = None
+    self._sum_tree = SumTree(capacity)
+    self._min_tree = MinTree(capacity)
+    if self.path is not None and self.memory.restored:
+      self._rebuild_trees()
 
-  def _store_memory(self, item):
-    """Saves a transition."""
-    if len(self.memory) < self.capacity:
-      self.errors.append(None)
-    self.errors[self.position] = 10000
-    super()._store_memory(item)
-
-  def sample(self, batch_size=2):
-    probability = np.array(self.errors) ** self.alpha
-    probability = probability / np.sum(probability)
-    indices = np.random.choice(len(self.errors), size=batch_size, replace=False, p=probability)
-    samples = np.take(self.memory, indices, axis=0)
-    transitions = self._split_transition_samples(samples)
-    #importance sampling weights
-    # probability = np.take(probability, indices, axis=0)
-    # weights = (batch_size * probability) ** self.beta
-    # weights = weights / weights.max()
-    # weights = np.expand_dims(weights, axis=1)
-    return transitions, indices
+  def state_dict(self):
+    state = super().state_dict()
+    state["header"]["beta"] = self.beta
+    state["arrays"]["errors"] = self.errors[:self.memory.size].copy()
+    return state
+
+  def load_state_dict(self, state):
+    arrays = dict(state["arrays"])
+    errors = arrays.pop("errors")
+    super().load_state_dict(dict(state, arrays=arrays))
+    self.beta = state["header"].get("beta", self.beta)
+    self.errors[:] = 0
+    self.errors[:len(errors)] = errors
+    self._sum_tree = SumTree(self.capacity)
+    self._min_tree = MinTree(self.capacity)
+    self._rebuild_trees()
+
+  def _rebuild_trees(self):
+    if self.dedup_frames:
+      self.errors[~self.memory.valid] = 0
+    stored = np.flatnonzero(self.errors)
+    priorities = self.errors[stored] ** self.alpha
+    self._sum_tree.update(stored, priorities)
+    self._min_tree.update(stored, priorities)
+
+  def push(self, item, stream=0, error=None):
+    """error, when given, sets the initial priority instead of initial_error.
+
+    It is only used when the item is stored straight away (1-step or
+    lazy_multi_step memories), not once an n-step window delays it.
+    """
+    if error is not None and (self.n == 1 or self.lazy_multi_step):
+      self._push_error = np.absolute(error) + self.e
+    super().push(item, stream)
+    self._push_error = None
+
+  def _write(self, index, item):
+    error = self.initial_error if self._push_error is None else self._push_error
+    self.errors[index] = error
+    priority = error ** self.alpha
+    self._sum_tree.set(index, priority)
+    self._min_tree.set(index, priority)
+    super()._write(index, item)
+
+  def _invalidate(self, index):
+    # slots without a transition must never be drawn
+    self.errors[index] = 0
+    self._sum_tree.set(index, 0)
+    self._min_tree.set(index, np.inf)
+    super()._invalidate(index)
+
+  def sample(self, batch_size=2, multi_step_n=None, weights=False):
+    """Returns (transitions, indices), or (transitions, [indices, weights]) when weights is set.
+
+    The importance sampling weights (N * P(i)) ** -beta, normalised by their
+    largest possible value, simplify to (p_min / p_i) ** beta, a batch_size x 1
+    float32 array.
+    """
+    # stratified: one uniform draw from each of batch_size equal slices of the total priority
+    segment = self._sum_tree.total() / batch_size
+    values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * segment
+    indices = self._sum_tree.find(values)
+    transitions = self._gather(indices, multi_step_n)
+    if not weights:
+      return transitions, indices
+    is_weights = (self._min_tree.min() / self._sum_tree[indices]) ** self.beta
+    self.beta = min(self.beta_end, self.beta + self.beta_increment)
+    return transitions, [indices, np.expand_dims(is_weights, axis=1).astype(np.float32)]
 
   def update(self, indices, errors):
-    errors = np.absolute(errors)
-    for i in range(len(indices)):
-      self.errors[indices[i]] = errors[i] + self.e
+    indices = np.asarray(indices)
+    errors = np.absolute(errors) + self.e
+    if self.dedup_frames:
+      # a slot may have been overwritten by a frame since it was sampled
+      stored = self.memory.valid[indices]
+      indices, errors = indices[stored], errors[stored]
+    self.errors[indices] = errors
+    priorities = errors ** self.alpha
+    self._sum_tree.update(indices, priorities)
+    self._min_tree.update(indices, priorities)
 
   def __str__(self):
     result = []
-    for i in range(self.__len__()):
+    for i in self._stored_indices():
       result.append(self.memory[i].__str__() + " error:" + self.errors[i].__str__() + " \n")
     return "".join(result)
 
+
+class ShardedReplayMemory(object):
+  """Several replay memories behind one, safe to push to from many actor threads.
+
+  `shards` are ReplayMemory or PrioritisedReplayMemory instances of one
+  kind. A push with stream i goes to shard i % len(shards) under that
+  shard's own lock, so actors pushing to different shards never wait on
+  each other and only wait on the sampler while it reads their shard.
+  sample() splits the batch over the shards in proportion to their sizes
+  (uniform) or total priorities (prioritised). Sampled indices are global,
+  the shard's offset plus its local index, so update() routes every
+  priority back to the shard that owns it. Every method locks what it
+  touches, callers need no lock of their own.
+  """
+  def __init__(self, shards):
+    self.shards = list(shards)
+    self.prioritised = isinstance(self.shards[0], PrioritisedReplayMemory)
+    self._locks = [threading.Lock() for _ in self.shards]
+    self._offsets = np.cumsum([0] + [shard.capacity for shard in self.shards])
+    self.capacity = int(self._offsets[-1])
+    self.path = self.shards[0].path
+    if self.prioritised:
+      # importance sampling weights are annealed here, not in the shards
+      self.beta = self.shards[0].beta
+      self.beta_end = self.shards[0].beta_end
+      self.beta_increment = self.shards[0].beta_increment
+
+  def push(self, item, stream=0, error=None):
+    shard = stream % len(self.shards)
+    with self._locks[shard]:
+      if error is None:
+        self.shards[shard].push(item, stream)
+      else:
+        self.shards[shard].push(item, stream, error=error)
+
+  def sample(self, batch_size=2, multi_step_n=None, weights=False):
+    """Uniform memories return the transitions, prioritised ones (transitions, indices) or,
+    with weights, (transitions, [indices, weights]) like PrioritisedReplayMemory.sample."""
+    if not self.prioritised:
+      return self._sample_uniform(batch_size, multi_step_n)
+    totals = np.array([shard._sum_tree.total() for shard in self.shards])
+    min_priority = min(shard._min_tree.min() for shard in self.shards)
+    counts = np.random.multinomial(batch_size, totals / totals.sum())
+    batches, indices, priorities = [], [], []
+    for i in np.flatnonzero(counts):
+      shard = self.shards[i]
+      with self._locks[i]:
+        transitions, shard_indices = shard.sample(counts[i], multi_step_n)
+        priorities.append(shard._sum_tree[shard_indices])
+      batches.append(transitions)
+      indices.append(shard_indices + self._offsets[i])
+    transitions = _concatenate(batches)
+    indices = np.concatenate(indices)
+    if not weights:
+      return transitions, indices
+    # (p_min / p_i) ** beta holds across shards with the smallest priority of any shard
+    priorities = np.maximum(np.concatenate(priorities), min_priority)
+    is_weights = (min_priority / priorities) ** self.beta
+    self.beta = min(self.beta_end, self.beta + self.beta_increment)
+    return transitions, [indices, np.expand_dims(is_weights, axis=1).astype(np.float32)]
+
+  def _sample_uniform(self, batch_size, multi_step_n):
+    # batch_size distinct positions over all stored transitions, counted per shard
+    sizes = np.array([len(shard) for shard in self.shards])
+    positions = np.array(random.sample(range(sizes.sum()), batch_size))
+    counts = np.bincount(np.searchsorted(np.cumsum(sizes), positions, side="right"), minlength=len(sizes))
+    batches = []
+    for i in np.flatnonzero(counts):
+      with self._locks[i]:
+        batches.append(self.shards[i].sample(counts[i], multi_step_n))
+    return _concatenate(batches)
+
+  def update(self, indices, errors):
+    indices = np.asarray(indices)
+    errors = np.asarray(errors).reshape(-1)
+    owners = np.searchsorted(self._offsets, indices, side="right") - 1
+    for i in np.unique(owners):
+      mine = owners == i
+      with self._locks[i]:
+        self.shards[i].update(indices[mine] - self._offsets[i], errors[mine])
+
+  def flush(self):
+    for lock, shard in zip(self._locks, self.shards):
+      with lock:
+        shard.flush()
+
+  def state_dict(self):
+    """Every shard's state_dict, their arrays prefixed with the shard number."""
+    headers, arrays = [], {}
+    for i, (lock, shard) in enumerate(zip(self._locks, self.shards)):
+      with lock:
+        state = shard.state_dict()
+      headers.append(state["header"])
+      arrays.update(("%s.%s" % (i, name), array) for name, array in state["arrays"].items())
+    header = {"shards": headers}
+    if self.prioritised:
+      header["beta"] = self.beta
+    return {"header": header, "arrays": arrays}
+
+  def load_state_dict(self, state):
+    headers = state["header"]["shards"]
+    if len(headers) != len(self.shards):
+      raise ValueError("cannot load %s replay shards into %s" % (len(headers), len(self.shards)))
+    for i, (lock, shard, header) in enumerate(zip(self._locks, self.shards, headers)):
+      prefix = "%s." % i
+      arrays = {name[len(prefix):]: array for name, array in state["arrays"].items() if name.startswith(prefix)}
+      with lock:
+        shard.load_state_dict({"header": header, "arrays": arrays})
+    if self.prioritised:
+      self.beta = state["header"].get("beta", self.beta)
+
+  def bytes_per_transition(self):
+    return self.shards[0].bytes_per_transition()
+
+  def __len__(self):
+    return sum(len(shard) for shard in self.shards)
+
+  def __str__(self):
+    return "".join(str(shard) for shard in self.shards)
+
+
+def _concatenate(batches):
+  """Joins [s, a, s_1, r, done] batches field by field."""
+  return [np.concatenate(fields) for fields in zip(*batches)]
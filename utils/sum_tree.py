@@ -0,0 +1,81 @@
+import numpy as np
+
+
+class SegmentTree(object):
+  """Binary segment tree over `capacity` leaves stored in a flat numpy array.
+
+  Node i has children 2i and 2i+1, the root lives at index 1 and the leaves
+  start at `self._size`. Both single and batched updates cost O(log N).
+  """
+  def __init__(self, capacity, operation, neutral):
+    self.capacity = capacity
+    self._operation = operation
+    self._neutral = neutral
+    self._size = 1
+    while self._size < capacity:
+      self._size *= 2
+    self._tree = np.full(2 * self._size, neutral, dtype=np.float64)
+
+  def __getitem__(self, index):
+    return self._tree[np.asarray(index) + self._size]
+
+  def __len__(self):
+    return self.capacity
+
+  def set(self, index, value):
+    """Updates a single leaf, walking up to the root with scalar ops."""
+    tree = self._tree
+    i = index + self._size
+    tree[i] = value
+    i //= 2
+    while i >= 1:
+      tree[i] = self._operation(tree[2 * i], tree[2 * i + 1])
+      i //= 2
+
+  def update(self, indices, values):
+    """Updates many leaves at once, one vectorised pass per tree level."""
+    indices = np.asarray(indices, dtype=np.int64) + self._size
+    if indices.size == 0:
+      return
+    self._tree[indices] = values
+    indices = np.unique(indices // 2)
+    while indices[0] >= 1:
+      self._tree[indices] = self._operation(self._tree[2 * indices], self._tree[2 * indices + 1])
+      indices = np.unique(indices // 2)
+
+  def reduce(self):
+    return self._tree[1]
+
+
+class SumTree(SegmentTree):
+  def __init__(self, capacity):
+    super().__init__(capacity, np.add, 0.0)
+
+  def total(self):
+    return self.reduce()
+
+  def find(self, values):
+    """Returns the leaf index holding each prefix sum in `values`.
+
+    Every value is expected in [0, total()). Walks all values down the tree
+    together, so a batch costs O(batch * log N) in a handful of numpy calls.
+    A value that float round off (or a value >= total()) pushes past the
+    last leaf with a positive priority ends on that leaf, never on an empty one.
+    """
+    values = np.array(values, dtype=np.float64)
+    indices = np.ones(values.shape, dtype=np.int64)
+    while indices[0] < self._size:
+      left = 2 * indices
+      left_sum = self._tree[left]
+      go_right = (values >= left_sum) & (self._tree[left + 1] > 0)
+      values = np.where(go_right, values - left_sum, values)
+      indices = np.where(go_right, left + 1, left)
+    return indices - self._size
+
+
+class MinTree(SegmentTree):
+  def __init__(self, capacity):
+    super().__init__(capacity, np.minimum, np.inf)
+
+  def min(self):
+    return self.reduce()
@@ -0,0 +1,142 @@
+import math
+import unittest
+from collections import deque
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from utils.cartpole import BatchCartPole, CartPoleRenderer, FrameStack, train_batched
+from utils.epsilon import Epsilon
+from utils.replay_memory import ReplayMemory
+
+
+def gym_step(state, action):
+  """gym's CartPoleEnv.step, one pole at a time."""
+  x, x_dot, theta, theta_dot = state
+  force = 10.0 if action == 1 else -10.0
+  costheta = math.cos(theta)
+  sintheta = math.sin(theta)
+  temp = (force + 0.05 * theta_dot * theta_dot * sintheta) / 1.1
+  thetaacc = (9.8 * sintheta - costheta * temp) / (0.5 * (4.0 / 3.0 - 0.1 * costheta * costheta / 1.1))
+  xacc = temp - 0.05 * thetaacc * costheta / 1.1
+  x = x + 0.02 * x_dot
+  x_dot = x_dot + 0.02 * xacc
+  theta = theta + 0.02 * theta_dot
+  theta_dot = theta_dot + 0.02 * thetaacc
+  done = x < -2.4 or x > 2.4 or theta < -12 * 2 * math.pi / 360 or theta > 12 * 2 * math.pi / 360
+  return (x, x_dot, theta, theta_dot), done
+
+
+class TestBatchCartPole(unittest.TestCase):
+  def test_matches_gym(self):
+    env = BatchCartPole(16, seed=0)
+    states = env.reset()
+    self.assertTrue(np.all(np.abs(states) <= 0.05))
+    alive = np.ones(16, dtype=np.bool_)
+    random = np.random.RandomState(1)
+    while alive.any():
+      actions = random.randint(2, size=16)
+      s_1, r, done, truncated = env.step(actions)
+      for i in np.flatnonzero(alive):
+        expected, expected_done = gym_step(states[i], actions[i])
+        self.assertTrue(np.allclose(s_1[i], expected))
+        self.assertEqual(done[i], expected_done)
+      states = s_1
+      alive &= ~done
+    self.assertTrue(np.all(r == 1))
+
+  def test_reset(self):
+    env = BatchCartPole(2, max_steps=3, seed=0)
+    env.reset()
+    # pushing the first cart left and the second right keeps both up for 3 steps
+    for _ in range(2):
+      s_1, r, done, truncated = env.step([0, 1])
+      self.assertFalse((done | truncated).any())
+    s_1, r, done, truncated = env.step([0, 1])
+    self.assertEqual(list(truncated), [True, True])
+    self.assertEqual(list(env.steps), [0, 0])
+    self.assertTrue(np.all(np.abs(env.s) <= 0.05))
+    self.assertFalse(np.allclose(env.s, s_1))
+
+
+class TestCartPoleRenderer(unittest.TestCase):
+  def setUp(self):
+    self.renderer = CartPoleRenderer()
+
+  def test_upright(self):
+    frame = self.renderer.render(np.zeros(4))
+    self.assertEqual(frame.shape, (180, 600))
+    self.assertEqual(frame.dtype, np.float32)
+    self.assertEqual(frame[0, 0], 255)
+    # track, cart, axle and pole of gym's 600 x 400 screen cropped to rows 150 .. 330
+    self.assertEqual(list(np.flatnonzero(frame[:, 0] == 0)), [150])
+    self.assertEqual(list(np.flatnonzero(frame[160] == 0)), list(range(275, 325)))
+    self.assertEqual(frame[142, 300], 136)
+    self.assertEqual(list(np.flatnonzero(frame[100] == 162)), list(range(295, 305)))
+    self.assertEqual(frame[21, 300], 255)
+    self.assertEqual(frame[22, 300], 162)
+
+  def test_state(self):
+    frame = self.renderer.render([1.0, 0, 0.1, 0])
+    self.assertIs(frame, self.renderer.frame)
+    self.assertEqual(list(np.flatnonzero(frame[160] == 0)), list(range(400, 450)))
+    # theta > 0 leans the pole to the right
+    self.assertTrue(np.all(np.flatnonzero(frame[30] == 162) > 430))
+    # a cart off the screen leaves only the track
+    frame = self.renderer.render([-3.0, 0, 0, 0])
+    self.assertEqual(list(np.flatnonzero((frame < 255).any(axis=1))), [150])
+
+
+class TestFrameStack(unittest.TestCase):
+  def test_push(self):
+    frames = FrameStack((2, 3))
+    s = frames.reset(np.ones((2, 3)))
+    self.assertEqual(s.shape, (2, 2, 3))
+    self.assertTrue(np.all(s[0] == 1) and np.all(s[1] == 0))
+    s_1 = frames.push(np.full((2, 3), 2))
+    self.assertTrue(np.all(s_1[0] == 2) and np.all(s_1[1] == 1))
+    # the previous state is intact until the next push, which reuses its array
+    self.assertTrue(np.all(s[0] == 1) and np.all(s[1] == 0))
+    s_2 = frames.push(np.full((2, 3), 3))
+    self.assertIs(s_2, s)
+    self.assertTrue(np.all(s_2[0] == 3) and np.all(s_2[1] == 2))
+
+
+class Learner(object):
+  def __init__(self, num_envs):
+    self.env = BatchCartPole(num_envs, seed=0)
+    self.epsilon = Epsilon(start=1.0, end=0.01, update_increment=0.015)
+    self.train_q_per_step = 4
+    self.steps_before_training = 64
+    self.target_q_update_frequency = 100
+    self.memory = ReplayMemory(capacity=10000)
+    self.Q = nn.Linear(4, 2)
+    self.episode_rewards = []
+    self.epsilon_log = []
+    self.train_q_calls = 0
+    self.target_updates = 0
+
+  def train_q(self):
+    self.train_q_calls += 1
+
+  def update_target_q(self):
+    self.target_updates += 1
+
+
+class TestTrainBatched(unittest.TestCase):
+  def test_train(self):
+    learner = Learner(8)
+    train_batched(learner, nb_episodes=20)
+    self.assertEqual(len(learner.episode_rewards), 20)
+    self.assertEqual(len(learner.epsilon_log), 20)
+    steps = len(learner.memory)
+    self.assertEqual(steps % 8, 0)
+    self.assertGreaterEqual(steps, sum(learner.episode_rewards))
+    # one train_q per 4 transitions once past the first 64
+    self.assertEqual(learner.train_q_calls, (steps - 64) // 4)
+    self.assertGreater(learner.target_updates, 0)
+    self.assertLess(learner.epsilon.value(), 1.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
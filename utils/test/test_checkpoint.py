@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import torch
+from utils.checkpoint import Checkpointer, snapshot, save_replay, load_replay
+from utils.replay_memory import ReplayMemory, Transition
+
+
+class TestCheckpoint(unittest.TestCase):
+  def test_snapshot(self):
+    network = torch.nn.Linear(2, 1)
+    optimizer = torch.optim.Adam(network.parameters())
+    network(torch.ones(1, 2)).sum().backward()
+    optimizer.step()
+    state = snapshot({"network": network.state_dict(), "optimizer": optimizer.state_dict()})
+    with torch.no_grad():
+      network.weight.add_(1)
+    self.assertFalse(torch.equal(state["network"]["weight"], network.weight))
+    self.assertEqual(state["optimizer"]["state"][0]["step"], 1)
+
+  def test_save_load(self):
+    memory = ReplayMemory(capacity=10, dedup_frames=True)
+    for i in range(4):
+      memory.push(Transition(np.full((2, 2), i), i, np.full((2, 2), i+1), 0, False))
+    network = torch.nn.Linear(2, 1)
+    with tempfile.TemporaryDirectory() as directory:
+      checkpointer = Checkpointer(os.path.join(directory, "agent"))
+      self.assertFalse(checkpointer.exists())
+      checkpointer.save(snapshot({"network": network.state_dict(), "epsilon": {"value": 0.5}}),
+                        memory.state_dict())
+      checkpointer.wait()
+      self.assertEqual(sorted(os.listdir(directory)), ["agent", "agent.replay.npz"])
+
+      state, replay = checkpointer.load()
+      self.assertEqual(state["epsilon"]["value"], 0.5)
+      self.assertTrue(torch.equal(state["network"]["bias"], network.bias.data))
+      restored = ReplayMemory(capacity=10, dedup_frames=True)
+      restored.load_state_dict(replay)
+      self.assertEqual(len(restored), 4)
+      self.assertTrue((restored.memory[3].s_1 == 4).all())
+
+  def test_error(self):
+    with tempfile.TemporaryDirectory() as directory:
+      checkpointer = Checkpointer(os.path.join(directory, "agent"))
+      checkpointer.save({"bad": lambda: None})
+      self.assertRaises(Exception, checkpointer.wait)
+      self.assertFalse(checkpointer.exists())
+
+  def test_replay_roundtrip(self):
+    state = {"header": {"size": 2, "last_frames": {"0": 1}}, "arrays": {"s": np.arange(6).reshape(2, 3)}}
+    with tempfile.TemporaryDirectory() as directory:
+      filename = os.path.join(directory, "replay.npz")
+      save_replay(filename, state)
+      loaded = load_replay(filename)
+    self.assertEqual(loaded["header"], state["header"])
+    self.assertTrue((loaded["arrays"]["s"] == state["arrays"]["s"]).all())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+import numpy as np
+import torch
+from utils.device import get_device, to_device, as_tensor
+
+
+class TestDevice(unittest.TestCase):
+  def test_cpu(self):
+    device = get_device("cpu", num_threads=1)
+    self.assertEqual(device.type, "cpu")
+    self.assertEqual(torch.get_num_threads(), 1)
+
+  def test_unavailable_cuda(self):
+    if not torch.cuda.is_available():
+      self.assertRaises(ValueError, get_device, "cuda")
+
+  def test_as_tensor(self):
+    device = get_device("cpu", num_threads=1)
+    s = as_tensor(np.zeros((2, 1, 3, 3), dtype=np.uint8), device)
+    self.assertEqual(s.dtype, torch.float)
+    self.assertTrue(s.is_contiguous(memory_format=torch.channels_last))
+    a = as_tensor(np.arange(4).reshape(4, 1), device, torch.long)
+    self.assertEqual(a.dtype, torch.long)
+    self.assertEqual(a.view(-1).tolist(), [0, 1, 2, 3])
+
+  def test_channels_last_network(self):
+    device = get_device("cpu", num_threads=1)
+    network = torch.nn.Conv2d(1, 2, kernel_size=3, padding=1)
+    expected = network(torch.ones(1, 1, 4, 4))
+    to_device(network, device)
+    self.assertTrue(network.weight.is_contiguous(memory_format=torch.channels_last))
+    self.assertTrue(torch.allclose(network(as_tensor(np.ones((1, 1, 4, 4)), device)), expected))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import numpy as np
+from utils.frozen_lake import BatchFrozenLake, compile_transitions, frozen_lake_P, MAPS, LEFT, DOWN, RIGHT
+from utils.qtable import BatchQLearner
+
+
+class TestFrozenLake(unittest.TestCase):
+  def test_compile_transitions(self):
+    P = {0: {0: [(1.0, 1, 0, False)], 1: [(0.25, 0, 0, False), (0.75, 1, 1, True)]},
+         1: {0: [(1.0, 1, 0, True)], 1: [(1.0, 1, 0, True)]}}
+    cumulative, next_state, reward, done = compile_transitions(P, 2, 2)
+    self.assertEqual(cumulative.shape, (2, 2, 2))
+    self.assertTrue(np.allclose(cumulative[0, 1], [0.25, 1]))
+    self.assertEqual(list(next_state[0, 0]), [1, 1])
+    self.assertEqual(list(reward[0, 1]), [0, 1])
+    self.assertEqual(list(done[0, 1]), [False, True])
+
+  def test_step(self):
+    env = BatchFrozenLake(2, map_name="4x4", is_slippery=False)
+    self.assertEqual(list(env.reset()), [0, 0])
+    s_1, r, done, truncated = env.step([RIGHT, DOWN])
+    self.assertEqual(list(s_1), [1, 4])
+    for action in [DOWN, RIGHT, DOWN, RIGHT, RIGHT]:
+      s_1, r, done, truncated = env.step([DOWN, action])
+    # the first copy fell in the hole at 5 and stays there, the second reached the goal
+    self.assertEqual(list(s_1), [5, 15])
+    self.assertEqual(list(r), [0, 1])
+    self.assertEqual(list(done), [True, True])
+    self.assertEqual(list(env.reset([0])), [0])
+    self.assertEqual(list(env.s), [0, 15])
+
+  def test_slippery(self):
+    env = BatchFrozenLake(30000, map_name="8x8", seed=0)
+    env.reset()
+    s_1, r, done, truncated = env.step(np.full(30000, RIGHT))
+    # right slips up (stays at 0) or down (8) as often as it moves right (1)
+    counts = np.bincount(s_1, minlength=9)[[0, 1, 8]] / 30000.0
+    self.assertTrue(np.allclose(counts, 1 / 3.0, atol=0.02))
+
+  def test_matches_P(self):
+    desc = np.asarray(MAPS["4x4"], dtype="c")
+    P = frozen_lake_P(desc, is_slippery=True)
+    self.assertEqual(P[14][RIGHT], [(1 / 3.0, 14, 0.0, False), (1 / 3.0, 15, 1.0, True), (1 / 3.0, 10, 0.0, False)])
+    self.assertEqual(P[5][LEFT], [(1.0, 5, 0, True)])
+
+  def test_truncated(self):
+    env = BatchFrozenLake(1, map_name="1x8", is_slippery=False, max_steps=2)
+    env.reset()
+    env.step([LEFT])
+    s_1, r, done, truncated = env.step([LEFT])
+    self.assertEqual((bool(done[0]), bool(truncated[0])), (False, True))
+
+
+class TestBatchQLearner(unittest.TestCase):
+  def test_train(self):
+    np.random.seed(0)
+    learner = BatchQLearner(BatchFrozenLake(64, map_name="4x4", is_slippery=False, max_steps=100, seed=0))
+    learner.train(episodes=3000)
+    self.assertGreaterEqual(len(learner.episode_rewards), 3000)
+    self.assertEqual(learner.epsilon.value(), 0.01)
+    # the greedy policy walks to the goal
+    env = BatchFrozenLake(1, map_name="4x4", is_slippery=False)
+    s = env.reset()
+    for _ in range(6):
+      s, r, done, truncated = env.step(learner.Q.argmax(s))
+    self.assertEqual((int(s[0]), r[0]), (15, 1))
+
+  def test_per_copy_tables(self):
+    learner = BatchQLearner(BatchFrozenLake(3, map_name="1x8", is_slippery=False), shared=False)
+    self.assertEqual(learner.Q.Q.shape, (24, 4))
+    self.assertEqual(list(learner.rows(np.array([3, 3, 3]))), [3, 11, 19])
+    learner.train(episodes=10)
+    self.assertEqual(len(learner.episode_lengths), len(learner.episode_rewards))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,51 @@
+import threading
+import unittest
+import numpy as np
+import torch
+from utils.inference import InferenceServer
+
+
+class TestInferenceServer(unittest.TestCase):
+  def setUp(self):
+    self.network = torch.nn.Conv2d(1, 1, kernel_size=3, padding=1)
+    self.server = InferenceServer(self.network, torch.device("cpu"), max_batch_size=8, max_wait=0.05).start()
+
+  def tearDown(self):
+    self.server.close()
+
+  def argmax(self, s):
+    with torch.no_grad():
+      q = self.network(torch.from_numpy(s))
+    return q.view(len(s), -1).max(dim=1)[1].numpy()
+
+  def test_act(self):
+    s = np.random.rand(3, 1, 6, 6).astype(np.float32)
+    self.assertTrue((self.server.act(s) == self.argmax(s)).all())
+    self.assertEqual(self.server.stats()["batches"], 1)
+
+  def test_batches_threads(self):
+    screens = [np.random.rand(1, 1, 6, 6).astype(np.float32) for _ in range(8)]
+    results = [None] * len(screens)
+
+    def act(i):
+      results[i] = self.server.act(screens[i])
+
+    threads = [threading.Thread(target=act, args=(i,)) for i in range(len(screens))]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    for s, actions in zip(screens, results):
+      self.assertEqual(actions.shape, (1,))
+      self.assertEqual(actions[0], self.argmax(s)[0])
+    stats = self.server.stats()
+    self.assertLess(stats["batches"], len(screens))
+    self.assertGreater(stats["mean_batch_size"], 1)
+    self.assertIn("mean batch size", str(self.server))
+
+  def test_error(self):
+    self.assertRaises(RuntimeError, self.server.act, np.zeros((1, 2, 6, 6), dtype=np.float32))
+
+
+if __name__ == "__main__":
+  unittest.main()
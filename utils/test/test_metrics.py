@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import torch
+from utils.metrics import MetricsRing, FileSink, NullSink, DeferredScalars, make_sink
+
+
+class TestMetricsRing(unittest.TestCase):
+  def test_drain(self):
+    ring = MetricsRing(capacity=4)
+    for i in range(3):
+      ring.put(i)
+    self.assertEqual(len(ring), 3)
+    self.assertEqual(ring.drain(), [0, 1, 2])
+    self.assertEqual(ring.drain(), [])
+    ring.put(3)
+    self.assertEqual(ring.drain(), [3])
+
+  def test_overwrite(self):
+    ring = MetricsRing(capacity=4)
+    for i in range(10):
+      ring.put(i)
+    self.assertEqual(ring.drain(), [6, 7, 8, 9])
+    self.assertEqual(ring.dropped, 6)
+
+
+class Recorder(NullSink):
+  def __init__(self):
+    self.scalars = []
+
+  def scalar(self, name, value):
+    self.scalars.append((name, value))
+
+
+class TestDeferredScalars(unittest.TestCase):
+  def test_flush(self):
+    sink = Recorder()
+    scalars = DeferredScalars(sink, ["loss", "max_q"], every=3)
+    scalars.add(torch.tensor(1.0), torch.tensor([2.0]))
+    scalars.add(torch.tensor(3.0, requires_grad=True), torch.tensor(4))
+    self.assertEqual(sink.scalars, [])
+    scalars.add(torch.tensor(5.0), torch.tensor(6.0))
+    self.assertEqual(sink.scalars, [("loss", 1), ("max_q", 2), ("loss", 3), ("max_q", 4), ("loss", 5), ("max_q", 6)])
+    scalars.add(torch.tensor(7.0), torch.tensor(8.0))
+    scalars.flush()
+    self.assertEqual(sink.scalars[-2:], [("loss", 7), ("max_q", 8)])
+
+
+class TestFileSink(unittest.TestCase):
+  def test_render(self):
+    with tempfile.TemporaryDirectory() as directory:
+      sink = FileSink(directory, interval=0.01, history=5)
+      for i in range(8):
+        sink.scalar("loss", i)
+        sink.scalar("max_q", 2 * i)
+      sink.image("screen", np.zeros((4, 4)))
+      sink.image("action", None)
+      sink.start().close()
+      self.assertEqual(sink.state()["scalars"]["loss"], [3, 4, 5, 6, 7])
+      self.assertTrue(os.path.isfile(os.path.join(directory, "metrics.png")))
+      with open(os.path.join(directory, "metrics.csv")) as f:
+        self.assertEqual(len(f.readlines()), 16)
+
+  def test_make_sink(self):
+    self.assertIsInstance(make_sink("none"), NullSink)
+    self.assertRaises(ValueError, make_sink, "screen")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from collections import namedtuple
+import numpy as np
+from utils.policy_gradient_memory import PolicyGradientMemory, discounted_returns
+
+Transition = namedtuple("Transition", ["s", "a", "s1", "r"])
+
+
+def loop_returns(r, gamma):
+  """The notebook's reversed loop over one episode."""
+  r = list(r)
+  reward = 0.
+  for i in reversed(range(len(r))):
+    reward = r[i] + gamma * reward
+    r[i] = reward
+  return r
+
+
+class TestPolicyGradientMemory(unittest.TestCase):
+  def setUp(self):
+    self.memory = PolicyGradientMemory(gamma=0.5, capacity=2)
+    for episode, length in enumerate([3, 1, 2]):
+      for t in range(length):
+        self.memory.append(Transition([episode, t, 0.5], t % 2, [episode, t + 1, 0.5], t + 1))
+      self.memory.end_episode()
+
+  def test_sample(self):
+    s, a, s1, r = self.memory.sample()
+    self.assertEqual(len(self.memory), 6)
+    self.assertEqual(s.shape, (6, 3))
+    self.assertEqual(s.dtype, np.float32)
+    self.assertEqual(list(a), [0, 1, 0, 0, 0, 1])
+    self.assertEqual(r.dtype, np.float32)
+    self.assertTrue(np.allclose(r, [1 + 0.5 * 2 + 0.25 * 3, 2 + 0.5 * 3, 3, 1, 1 + 0.5 * 2, 2]))
+    self.assertEqual(list(self.memory.episode_steps()), [0, 1, 2, 0, 0, 1])
+
+  def test_padded(self):
+    s, a, s1, r, mask = self.memory.sample(padded=True)
+    self.assertEqual(s.shape, (3, 3, 3))
+    self.assertEqual(mask.tolist(), [[True, True, True], [True, False, False], [True, True, False]])
+    self.assertTrue(np.allclose(r, [[2.75, 3.5, 3], [1, 0, 0], [2, 2, 0]]))
+    self.assertEqual(s[2, 1].tolist(), [2, 1, 0.5])
+
+  def test_normalise(self):
+    r = self.memory.sample(normalise=True)[3]
+    self.assertAlmostEqual(float(r.mean()), 0, places=5)
+    self.assertAlmostEqual(float(r.std()), 1, places=5)
+
+  def test_reset(self):
+    self.memory.reset()
+    self.memory.append(Transition([1, 2, 3], 1, [4, 5, 6], 1))
+    self.memory.append(Transition([1, 2, 3], 0, [4, 5, 6], 1))
+    # the open episode counts as one
+    self.assertTrue(np.allclose(self.memory.sample()[3], [1.5, 1]))
+    self.assertIn("Transition(s=array([1., 2., 3.]", str(self.memory))
+
+  def test_discounted_returns(self):
+    random = np.random.RandomState(0)
+    lengths = random.randint(1, 50, size=20)
+    starts = np.cumsum(lengths) - lengths
+    r = random.uniform(size=lengths.sum())
+    returns = discounted_returns(r, starts, lengths, 0.99)
+    for start, length in zip(starts, lengths):
+      self.assertTrue(np.allclose(returns[start:start + length], loop_returns(r[start:start + length], 0.99)))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import torch
+from utils.precision import MixedPrecision, compile_network, make_adam
+
+
+class Net(torch.nn.Module):
+  def __init__(self):
+    super(Net, self).__init__()
+    self.linear = torch.nn.Linear(8, 4)
+
+  def forward(self, x):
+    return self.linear(x)
+
+
+class TestPrecision(unittest.TestCase):
+  def setUp(self):
+    torch.manual_seed(0)
+    self.network = Net()
+    self.x = torch.rand(16, 8)
+
+  def test_compile_network(self):
+    scripted = compile_network(self.network, "script")
+    self.assertIs(compile_network(self.network), self.network)
+    self.assertTrue(torch.allclose(scripted(self.x), self.network(self.x)))
+    with torch.no_grad():
+      self.network.linear.bias.add_(1)
+    self.assertTrue(torch.allclose(scripted(self.x), self.network(self.x)))
+    self.assertRaises(ValueError, compile_network, self.network, "jit")
+
+  def test_autocast(self):
+    precision = MixedPrecision(torch.device("cpu"), "bf16")
+    with precision.autocast():
+      q = self.network(self.x)
+    self.assertEqual(q.dtype, torch.bfloat16)
+    with MixedPrecision(torch.device("cpu")).autocast():
+      self.assertEqual(self.network(self.x).dtype, torch.float32)
+    self.assertRaises(ValueError, MixedPrecision, torch.device("cpu"), "fp8")
+
+  def test_step(self):
+    for precision, fused in [("fp32", False), ("bf16", True), ("fp16", False)]:
+      network = Net()
+      network.load_state_dict(self.network.state_dict())
+      optimizer = make_adam(network.parameters(), lr=0.1, fused=fused)
+      mixed = MixedPrecision(torch.device("cpu"), precision)
+      # fp16 skips the steps whose scaled gradients overflow while the scale settles
+      for _ in range(5):
+        with mixed.autocast():
+          loss = (network(self.x) ** 2).mean()
+        optimizer.zero_grad()
+        mixed.backward(loss)
+        mixed.step(optimizer)
+      self.assertEqual(network.linear.weight.dtype, torch.float32)
+      self.assertFalse(torch.equal(network.linear.weight, self.network.linear.weight), precision)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,80 @@
+import threading
+import time
+import unittest
+import numpy as np
+import torch
+from utils.prefetcher import BatchPrefetcher, PriorityWriter
+from utils.replay_memory import ReplayMemory, Transition
+
+
+class TestBatchPrefetcher(unittest.TestCase):
+  def setUp(self):
+    self.memory = ReplayMemory(capacity=100)
+    for i in range(50):
+      self.memory.push(Transition([i, i], i, [i+1, i+1], 0, False))
+    self.prefetcher = BatchPrefetcher(lambda: self.memory.sample(8), convert=lambda batch: batch[0] * 2, depth=3)
+
+  def tearDown(self):
+    self.prefetcher.close()
+
+  def test_get(self):
+    self.prefetcher.start()
+    for i in range(10):
+      s = self.prefetcher.get()
+      self.assertEqual(s.shape, (8, 2))
+      self.assertTrue((s % 2 == 0).all())
+    self.assertEqual(self.prefetcher.stats()["batches"], 10)
+
+  def test_bounded_queue(self):
+    self.prefetcher.start()
+    time.sleep(0.2)
+    self.assertEqual(self.prefetcher._queue.qsize(), 3)
+    self.prefetcher.get()
+    self.assertTrue(self.prefetcher.stats()["mean_queue_depth"] == 3)
+
+  def test_push_while_prefetching(self):
+    self.prefetcher.start()
+    for i in range(200):
+      with self.prefetcher.lock:
+        self.memory.push(Transition([i, i], i, [i+1, i+1], 0, False))
+      self.prefetcher.get()
+    self.assertEqual(len(self.memory), 100)
+
+  def test_error(self):
+    prefetcher = BatchPrefetcher(lambda: self.memory.sample(1000)).start()
+    self.assertRaises(ValueError, prefetcher.get)
+    prefetcher.close()
+
+
+class TestPriorityWriter(unittest.TestCase):
+  def setUp(self):
+    self.updates = []
+    self.lock = threading.Lock()
+    self.writer = PriorityWriter(lambda indices, errors: self.updates.append((indices, errors)), self.lock)
+
+  def test_put(self):
+    self.writer.put([0, 1, 2], torch.tensor([0.5, 1.0, 1.5]))
+    self.writer.put(np.array([2, 3]), np.array([2.0, 2.5]))
+    self.writer.close()
+    indices = np.concatenate([indices for indices, _ in self.updates])
+    errors = np.concatenate([errors for _, errors in self.updates])
+    self.assertEqual(dict(zip(indices, errors)), {0: 0.5, 1: 1.0, 2: 2.0, 3: 2.5})
+    self.assertEqual(self.writer.updates, 2)
+
+  def test_lock(self):
+    with self.lock:
+      self.writer.put([0], [1.0])
+      time.sleep(0.2)
+      self.assertEqual(self.updates, [])
+    self.writer.flush()
+    self.assertEqual(len(self.updates), 1)
+    self.writer.close()
+
+  def test_error(self):
+    writer = PriorityWriter(lambda indices, errors: 1 / 0, self.lock)
+    writer.put([0], [1.0])
+    self.assertRaises(ZeroDivisionError, writer.close)
+
+
+if __name__ == "__main__":
+  unittest.main()
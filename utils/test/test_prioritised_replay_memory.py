@@ -1,4 +1,6 @@
+import tempfile
 import unittest
+import numpy as np
 from utils.replay_memory import PrioritisedReplayMemory, Transition
 
 
@@ -40,6 +42,91 @@ class TestPrioritisedReplayMemory(unittest.TestCase):
     # print(self.memory)
     # self.memory.sample(2)
 
+  def test_sample_proportional(self):
+    np.random.seed(0)
+    for i in range(10):
+      a = Transition([0, 1, 2, i], i, [4, 5, 6, i*i], 0, True)
+      self.memory.push(a)
+
+    self.memory.update(range(10), [0] * 10)
+    self.memory.update([7], [1e8])
+    [s, a, s1, r, done], indices = self.memory.sample(4)
+    self.assertTrue((indices == 7).all())
+    self.assertTrue((a == 7).all())
+
+  def test_importance_sampling_weights(self):
+    self.memory = PrioritisedReplayMemory(capacity=10, e=0, alpha=1, beta=0.5, beta_increment=0.25)
+    for i in range(4):
+      self.memory.push(Transition([0, 1, 2, i], i, [4, 5, 6, i*i], 0, True), error=i + 1)
+    (s, a, s1, r, done), [indices, weights] = self.memory.sample(8, weights=True)
+    self.assertEqual(weights.shape, (8, 1))
+    self.assertEqual(weights.dtype, np.float32)
+    # (p_min / p_i) ** beta, the rarest transition gets weight 1
+    self.assertTrue(np.allclose(weights, (1.0 / (a + 1)) ** 0.5))
+    self.assertEqual(self.memory.beta, 0.75)
+    self.memory.sample(8, weights=True)
+    self.memory.sample(8, weights=True)
+    self.assertEqual(self.memory.beta, 1)
+    transition, indices = self.memory.sample(8)
+    self.assertEqual(indices.shape, (8,))
+
+  def test_push_with_error(self):
+    for i in range(4):
+      self.memory.push(Transition([0, 1, 2, i], i, [4, 5, 6, i*i], 0, True), error=-i)
+    self.memory.push(Transition([0, 1, 2, 4], 4, [4, 5, 6, 16], 0, True))
+    self.assertEqual(self.memory.errors[0], 0.1)
+    self.assertEqual(self.memory.errors[3], 3.1)
+    self.assertEqual(self.memory.errors[4], self.memory.initial_error)
+
+  def test_dedup_frames(self):
+    self.memory = PrioritisedReplayMemory(capacity=10, e=0.1, alpha=0.5, dedup_frames=True)
+    for episode in range(3):
+      for i in range(4):
+        self.memory.push(Transition([10 * episode + i], 0, [10 * episode + i + 1], 0, False))
+    self.assertEqual(len(self.memory), 8)
+    self.assertEqual(self.memory.errors[9], 0)
+
+    [s, a, s1, r, done], indices = self.memory.sample(8)
+    self.assertTrue(self.memory.memory.valid[indices].all())
+    self.assertTrue((s1 == s + 1).all())
+
+    # draws past the real total, as round off can make them, land on the newest transition
+    # instead of the frame-only slot after it
+    self.memory._sum_tree._tree[1] *= 1.5
+    [s, a, s1, r, done], [indices, weights] = self.memory.sample(8, weights=True)
+    self.assertTrue(self.memory.memory.valid[indices].all())
+    self.assertTrue((s1 == s + 1).all())
+    self.assertTrue((weights <= 1).all())
+
+  def test_memmap_resume(self):
+    np.random.seed(0)
+    with tempfile.TemporaryDirectory() as path:
+      self.memory = PrioritisedReplayMemory(capacity=10, e=0.1, alpha=0.5, path=path)
+      for i in range(10):
+        self.memory.push(Transition([0, 1, 2, i], i, [4, 5, 6, i*i], 0, True))
+      self.memory.update(range(10), [0] * 10)
+      self.memory.update([3], [1e8])
+      self.memory.flush()
+
+      self.memory = PrioritisedReplayMemory(capacity=10, e=0.1, alpha=0.5, path=path)
+      self.assertEqual(len(self.memory), 10)
+      self.assertEqual(self.memory.errors[1], 0.1)
+      [s, a, s1, r, done], indices = self.memory.sample(2)
+      self.assertTrue((a == 3).all())
+
+  def test_state_dict(self):
+    np.random.seed(0)
+    for i in range(10):
+      self.memory.push(Transition([0, 1, 2, i], i, [4, 5, 6, i*i], 0, True))
+    self.memory.update(range(10), [0] * 10)
+    self.memory.update([3], [1e8])
+
+    restored = PrioritisedReplayMemory(capacity=10, e=0.1, alpha=0.5)
+    restored.load_state_dict(self.memory.state_dict())
+    self.assertEqual(len(restored), 10)
+    self.assertAlmostEqual(restored._sum_tree.total(), self.memory._sum_tree.total())
+    [s, a, s1, r, done], indices = restored.sample(2)
+    self.assertTrue((a == 3).all())
 
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+from utils.qtable import QTable
+
+
+class TestQTable(unittest.TestCase):
+  def setUp(self):
+    self.Q = QTable(num_actions=4, capacity=2)
+
+  def test_get_set(self):
+    s = tuple([5, 6])
+    self.assertEqual(self.Q.get_Q(s, 1), 0)
+    s = tuple([5, 3])
+    self.Q.set_Q(s, 1, 90)
+    self.assertEqual(self.Q.get_Q(s, 1), 90)
+    self.Q.set_Q(s, 2, 85)
+    self.assertEqual(self.Q.get_max_Q(s), 90)
+    self.assertEqual(self.Q.get_max_a_for_Q(s), 1)
+    self.assertEqual(len(self.Q), 2)
+
+  def test_grow(self):
+    for i in range(5):
+      self.Q.set_Q((i,), 0, i)
+    self.assertEqual(self.Q.Q.shape, (8, 4))
+    self.assertEqual([self.Q.get_Q((i,), 0) for i in range(5)], list(range(5)))
+    self.assertEqual(self.Q.states(), [(i,) for i in range(5)])
+
+  def test_argmax_ties(self):
+    self.Q.set_Q("s", 1, 1)
+    self.Q.set_Q("s", 3, 1)
+    actions = self.Q.argmax(np.full(1000, self.Q.index("s")))
+    self.assertEqual(set(actions), {1, 3})
+    self.assertAlmostEqual(np.mean(actions == 1), 0.5, delta=0.1)
+    self.assertEqual(self.Q.get_max_a_for_Q("t") in range(4), True)
+
+  def test_update(self):
+    Q = QTable(num_actions=2, num_states=3)
+    Q.Q[2] = [1, 4]
+    errors = Q.update([0, 1, 0], [1, 0, 1], [1, 0, 1], [2, 2, 1], [False, True, False], alpha=0.5, gamma=0.5)
+    # both updates of (0, 1) start from the table before the call, it moves by their mean
+    self.assertTrue(np.allclose(errors, [3, 0, 1]))
+    self.assertTrue(np.allclose(Q.Q[:2], [[0, 1], [0, 0]]))
+    self.assertEqual(Q.index(2), 2)
+
+  def test_str(self):
+    self.Q.set_Q((1,), 2, 0.5)
+    self.assertEqual(str(self.Q), "QTable (number of actions = 4, states = 1):\n"
+                                  "(1,): ['00.0000', '00.0000', '00.5000', '00.0000']")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,4 +1,6 @@
+import tempfile
 import unittest
+import numpy as np
 from utils.replay_memory import ReplayMemory, Transition
 
 
@@ -24,6 +26,16 @@ class TestReplayMemory(unittest.TestCase):
     self.assertEqual(r.shape, (2, 1))
     self.assertEqual(done.shape, (2, 1))
 
+  def test_wraps_in_place(self):
+    for i in range(15):
+      a = Transition([0, 1, 2, i], i, [4, 5, 6, i*i], 0, False)
+      self.memory.push(a)
+    self.assertEqual(len(self.memory), 10)
+    self.assertEqual(self.memory.position, 5)
+    self.assertEqual(self.memory.memory[0].a, 10)
+    self.assertEqual(self.memory.memory[5].a, 5)
+    self.assertEqual(self.memory.memory.fields.s.shape, (10, 4))
+
   def test_multi_step(self):
     self.memory = ReplayMemory(capacity=10, multi_step_n=2)
     for i in range(5):
@@ -36,6 +48,59 @@ class TestReplayMemory(unittest.TestCase):
     self.assertEqual(self.memory.memory[4].r, 10.9)
     self.assertEqual(self.memory.memory[5].r, 10)
 
+  def test_lazy_multi_step(self):
+    eager = ReplayMemory(capacity=10, multi_step_n=2)
+    lazy = ReplayMemory(capacity=10, multi_step_n=2, lazy_multi_step=True)
+    for memory in [eager, lazy]:
+      for i in range(5):
+        memory.push(Transition([i], i, [i+1], 1, False))
+      memory.push(Transition([5], 5, [6], 10, True))
+    self.assertEqual(len(lazy), 6)
+    self.assertEqual(lazy.memory[0].r, 1)
+
+    s, a, s1, r, done = lazy.sample(6)
+    order = np.argsort(a[:, 0])
+    for i in range(6):
+      j = order[i]
+      self.assertAlmostEqual(r[j, 0], eager.memory[i].r)
+      self.assertEqual(s1[j, 0], eager.memory[i].s_1[0])
+      self.assertEqual(done[j, 0], eager.memory[i].done)
+
+    # n can be changed per sample without refilling
+    s, a, s1, r, done = lazy.sample(6, multi_step_n=0)
+    self.assertTrue((s1 == s + 1).all())
+    s, a, s1, r, done = lazy.sample(6, multi_step_n=10)
+    self.assertTrue((s1 == 6).all())
+    self.assertTrue(done.all())
+
+  def test_lazy_multi_step_dedup_frames(self):
+    self.memory = ReplayMemory(capacity=20, multi_step_n=2, multi_step_gamma=0.5, dedup_frames=True,
+                               lazy_multi_step=True)
+    for i in range(4):
+      self.memory.push(Transition([i], i, [i+1], 1, False))
+    # a new stream, its windows must not reach back into the first one
+    for i in range(10, 12):
+      self.memory.push(Transition([i], i, [i+1], 1, False))
+    s, a, s1, r, done = self.memory.sample(6)
+    returns = {0: 1.75, 1: 1.75, 2: 1.5, 3: 1, 10: 1.5, 11: 1}
+    ends = {0: 3, 1: 4, 2: 4, 3: 4, 10: 12, 11: 12}
+    for i in range(6):
+      self.assertEqual(r[i, 0], returns[a[i, 0]])
+      self.assertEqual(s1[i, 0], ends[a[i, 0]])
+      self.assertFalse(done[i, 0])
+
+  def test_interleaved_streams(self):
+    for dedup_frames in [False, True]:
+      self.memory = ReplayMemory(capacity=20, multi_step_n=1, multi_step_gamma=0.5, dedup_frames=dedup_frames)
+      for i in range(4):
+        self.memory.push(Transition([i], i, [i+1], 1, False), stream=0)
+        self.memory.push(Transition([100 + i], 100 + i, [101 + i], 4, False), stream=1)
+      s, a, s1, r, done = self.memory.sample(6)
+      self.assertEqual(len(self.memory), 6)
+      self.assertTrue((s1 == s + 2).all())
+      self.assertTrue((r[a < 100] == 1.5).all())
+      self.assertTrue((r[a >= 100] == 6).all())
+
   def test_zero_step(self):
     self.memory = ReplayMemory(capacity=10, multi_step_n=0)
     for i in range(5):
@@ -48,5 +113,142 @@ class TestReplayMemory(unittest.TestCase):
     self.assertEqual(self.memory.memory[4].r, 1)
     self.assertEqual(self.memory.memory[5].r, 10)
 
+  def test_dedup_frames(self):
+    self.memory = ReplayMemory(capacity=10, dedup_frames=True)
+    for i in range(4):
+      self.memory.push(Transition([i, i], i, [i+1, i+1], 0, False))
+    # new episode, the last frame of the first one ends its stream
+    for i in range(10, 12):
+      self.memory.push(Transition([i, i], i, [i+1, i+1], 0, False))
+    self.assertEqual(len(self.memory), 6)
+    self.assertEqual(self.memory.memory.size, 8)
+
+    s, a, s1, r, done = self.memory.sample(20)
+    self.assertEqual(s.shape, (20, 2))
+    self.assertTrue((s1 == s + 1).all())
+    self.assertTrue((s[:, 0] == a[:, 0]).all())
+
+  def test_dedup_frames_multi_step(self):
+    self.memory = ReplayMemory(capacity=10, multi_step_n=2, dedup_frames=True)
+    for i in range(5):
+      self.memory.push(Transition([i], 0, [i+1], 1, False))
+    self.memory.push(Transition([5], 0, [6], 10, True))
+    self.assertEqual(len(self.memory), 6)
+    self.assertEqual(self.memory.memory[0].r, 2.9701)
+    self.assertEqual(self.memory.memory[0].s_1, [3])
+    self.assertEqual(self.memory.memory[3].r, 11.791)
+    self.assertEqual(self.memory.memory[3].s_1, [6])
+    self.assertEqual(self.memory.memory[5].r, 10)
+
+    # a new episode flushes the window without crossing the boundary
+    self.memory.push(Transition([6], 0, [7], 1, False))
+    self.memory.push(Transition([7], 0, [8], 1, False))
+    self.memory.push(Transition([20], 0, [21], 1, False))
+    self.assertEqual(self.memory.memory[6].r, 1.99)
+    self.assertEqual(self.memory.memory[6].s_1, [8])
+    self.assertEqual(self.memory.memory[7].r, 1)
+
+  def test_dedup_frames_wraps(self):
+    self.memory = ReplayMemory(capacity=5, dedup_frames=True)
+    for i in range(12):
+      self.memory.push(Transition([i], 0, [i+1], 0, False))
+    self.assertEqual(len(self.memory), 4)
+    s, a, s1, r, done = self.memory.sample(10)
+    self.assertTrue((s1 == s + 1).all())
+    self.assertTrue((s >= 8).all())
+
+  def test_bytes_per_transition(self):
+    screen = [[0] * 28] * 28
+    plain = ReplayMemory(capacity=10)
+    dedup = ReplayMemory(capacity=10, dedup_frames=True)
+    for memory in [plain, dedup]:
+      memory.push(Transition(screen, 0, screen, 0, False))
+    self.assertTrue(dedup.bytes_per_transition() < 0.6 * plain.bytes_per_transition())
+
+  def test_memmap_resume(self):
+    with tempfile.TemporaryDirectory() as path:
+      memory = ReplayMemory(capacity=10, path=path)
+      for i in range(13):
+        memory.push(Transition([i, i], i, [i+1, i+1], 0.5, False))
+      memory.flush()
+      del memory
+
+      memory = ReplayMemory(capacity=10, path=path)
+      self.assertEqual(len(memory), 10)
+      self.assertEqual(memory.position, 3)
+      self.assertEqual(memory.memory[2].a, 12)
+      self.assertEqual(memory.memory[2].r, 0.5)
+      s, a, s1, r, done = memory.sample(4)
+      self.assertTrue((s1 == s + 1).all())
+      self.assertRaises(ValueError, ReplayMemory, capacity=20, path=path)
+
+  def test_memmap_dedup_frames_resume(self):
+    with tempfile.TemporaryDirectory() as path:
+      memory = ReplayMemory(capacity=10, dedup_frames=True, path=path)
+      for i in range(5):
+        memory.push(Transition([i], i, [i+1], 0, False))
+      memory.flush()
+
+      memory = ReplayMemory(capacity=10, dedup_frames=True, path=path)
+      self.assertEqual(len(memory), 5)
+      memory.push(Transition([5], 5, [6], 0, False))
+      self.assertEqual(len(memory), 6)
+      self.assertEqual(memory.memory[5].s_1, [6])
+
+  def test_memmap_dedup_frames_crash(self):
+    with tempfile.TemporaryDirectory() as path:
+      memory = ReplayMemory(capacity=10, dedup_frames=True, path=path)
+      for i in range(3):
+        memory.push(Transition([i], i, [i+1], 0, False))
+      memory.flush()
+      # written after the flush and never flushed, as if the process died here
+      for i in range(3, 8):
+        memory.push(Transition([i], i, [i+1], 0, False))
+      del memory
+
+      memory = ReplayMemory(capacity=10, dedup_frames=True, path=path)
+      self.assertEqual(len(memory), memory.memory.valid.sum())
+      self.assertEqual(memory.position, 4)
+      for i in range(20):
+        memory.push(Transition([100 + i], i, [101 + i], 0, False))
+        self.assertEqual(len(memory), memory.memory.valid.sum())
+      s, a, s1, r, done = memory.sample(10)
+      self.assertTrue((s1 == s + 1).all())
+
+  def test_memmap_dedup_frames_crash_few_pushes(self):
+    with tempfile.TemporaryDirectory() as path:
+      memory = ReplayMemory(capacity=10, dedup_frames=True, path=path)
+      for i in range(3):
+        memory.push(Transition([i], i, [i+1], 0, False))
+      memory.flush()
+      for i in range(3, 8):
+        memory.push(Transition([i], i, [i+1], 0, False))
+      del memory
+
+      # the first new frame lands on slot 4, the s_1 of the unflushed transition in slot 3
+      memory = ReplayMemory(capacity=10, dedup_frames=True, path=path)
+      memory.push(Transition([100], 0, [101], 0, False))
+      self.assertEqual(len(memory), memory.memory.valid.sum())
+      self.assertFalse(memory.memory.valid[3])
+      s, a, s1, r, done = memory.sample(50)
+      self.assertTrue((s1 == s + 1).all())
+
+  def test_state_dict(self):
+    memory = ReplayMemory(capacity=10, dedup_frames=True)
+    for i in range(5):
+      memory.push(Transition([i], i, [i+1], 0, False))
+    state = memory.state_dict()
+    memory.push(Transition([5], 5, [6], 0, False))
+
+    restored = ReplayMemory(capacity=10, dedup_frames=True)
+    restored.load_state_dict(state)
+    self.assertEqual(len(restored), 5)
+    self.assertEqual(restored.position, 6)
+    self.assertEqual(restored.memory[4].s_1, [5])
+    restored.push(Transition([5], 5, [6], 0, False))
+    self.assertEqual(len(restored), 6)
+    self.assertRaises(ValueError, ReplayMemory(capacity=20, dedup_frames=True).load_state_dict, state)
+
+
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
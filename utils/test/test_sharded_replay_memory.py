@@ -0,0 +1,102 @@
+import threading
+import unittest
+import numpy as np
+from utils.replay_memory import ReplayMemory, PrioritisedReplayMemory, ShardedReplayMemory, Transition
+
+
+def transition(stream, i):
+  return Transition([stream, i], stream, [stream, i + 1], i, False)
+
+
+class TestShardedReplayMemory(unittest.TestCase):
+  def setUp(self):
+    self.memory = ShardedReplayMemory([ReplayMemory(capacity=100) for _ in range(3)])
+
+  def test_push(self):
+    for i in range(10):
+      for stream in range(4):
+        self.memory.push(transition(stream, i), stream=stream)
+    # stream 3 shares shard 0 with stream 0
+    self.assertEqual([len(shard) for shard in self.memory.shards], [20, 10, 10])
+    self.assertEqual(len(self.memory), 40)
+    self.assertEqual(self.memory.capacity, 300)
+
+  def test_sample_uniform(self):
+    for i in range(50):
+      self.memory.push(transition(0, i), stream=0)
+    for i in range(10):
+      self.memory.push(transition(1, i), stream=1)
+    s, a, s1, r, done = self.memory.sample(60)
+    self.assertEqual(s.shape, (60, 2))
+    self.assertEqual(a.shape, (60, 1))
+    self.assertEqual(r.shape, (60, 1))
+    # without replacement over all shards, every transition once
+    self.assertEqual(sorted(map(tuple, s)), sorted([(0, i) for i in range(50)] + [(1, i) for i in range(10)]))
+
+  def test_concurrent_push(self):
+    def actor(stream):
+      for i in range(500):
+        self.memory.push(transition(stream, i), stream=stream)
+    threads = [threading.Thread(target=actor, args=(stream,)) for stream in range(3)]
+    for thread in threads:
+      thread.start()
+    for _ in range(50):
+      if len(self.memory) > 10:
+        s, a, s1, r, done = self.memory.sample(10)
+        # a transition is never torn between two actors' writes
+        self.assertTrue(np.array_equal(s[:, 0], a[:, 0]))
+        self.assertTrue(np.array_equal(s1[:, 1], s[:, 1] + 1))
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(self.memory), 300)
+
+  def test_state_dict(self):
+    for i in range(10):
+      self.memory.push(transition(i % 3, i), stream=i % 3)
+    memory = ShardedReplayMemory([ReplayMemory(capacity=100) for _ in range(3)])
+    memory.load_state_dict(self.memory.state_dict())
+    self.assertEqual([len(shard) for shard in memory.shards], [4, 3, 3])
+    self.assertEqual(str(memory), str(self.memory))
+    with self.assertRaises(ValueError):
+      ShardedReplayMemory([ReplayMemory(capacity=100)]).load_state_dict(self.memory.state_dict())
+
+
+class TestShardedPrioritisedReplayMemory(unittest.TestCase):
+  def setUp(self):
+    self.memory = ShardedReplayMemory([PrioritisedReplayMemory(capacity=10, e=0, alpha=1, beta=0.5)
+                                       for _ in range(2)])
+
+  def test_sample_proportional(self):
+    for i in range(5):
+      self.memory.push(transition(0, i), stream=0, error=1)
+      self.memory.push(transition(1, i), stream=1, error=9)
+    (s, a, s1, r, done), [indices, weights] = self.memory.sample(1000, weights=True)
+    # shard 1 holds 90% of the total priority
+    self.assertAlmostEqual(np.mean(a == 1), 0.9, delta=0.05)
+    self.assertTrue(np.all((indices >= 10) == (a[:, 0] == 1)))
+    # weights use the smallest priority of any shard
+    self.assertTrue(np.allclose(weights[a == 0], 1))
+    self.assertTrue(np.allclose(weights[a == 1], (1 / 9.0) ** 0.5))
+
+  def test_update(self):
+    for i in range(5):
+      self.memory.push(transition(0, i), stream=0)
+      self.memory.push(transition(1, i), stream=1)
+    self.memory.update([1, 13], [2, 5])
+    self.assertEqual(self.memory.shards[0].errors[1], 2)
+    self.assertEqual(self.memory.shards[1].errors[3], 5)
+    self.assertEqual(self.memory.shards[0].errors[3], 10000)
+
+  def test_state_dict(self):
+    for i in range(5):
+      self.memory.push(transition(0, i), stream=0, error=i)
+    self.memory.sample(4, weights=True)
+    memory = ShardedReplayMemory([PrioritisedReplayMemory(capacity=10, e=0, alpha=1) for _ in range(2)])
+    memory.load_state_dict(self.memory.state_dict())
+    self.assertEqual(memory.beta, self.memory.beta)
+    self.assertTrue(np.array_equal(memory.shards[0].errors, self.memory.shards[0].errors))
+    self.assertEqual(len(memory), 5)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from utils.sum_tree import SumTree, MinTree
+
+
+class TestSumTree(unittest.TestCase):
+  def setUp(self):
+    self.tree = SumTree(5)
+
+  def test_set(self):
+    for i in range(5):
+      self.tree.set(i, i + 1)
+    self.assertEqual(self.tree.total(), 15)
+    self.tree.set(2, 0)
+    self.assertEqual(self.tree.total(), 12)
+    self.assertEqual(self.tree[1], 2)
+
+  def test_update(self):
+    self.tree.update([0, 1, 2, 3, 4], [1, 2, 3, 4, 5])
+    self.assertEqual(self.tree.total(), 15)
+    self.tree.update([1, 4], [0, 0])
+    self.assertEqual(self.tree.total(), 8)
+    np.testing.assert_array_equal(self.tree[[0, 1, 2, 3, 4]], [1, 0, 3, 4, 0])
+
+  def test_find(self):
+    self.tree.update([0, 1, 2, 3, 4], [1, 2, 3, 4, 5])
+    indices = self.tree.find([0, 0.5, 1, 2.9, 3, 5.99, 6, 9.5, 10, 14.99])
+    np.testing.assert_array_equal(indices, [0, 0, 1, 1, 2, 2, 3, 3, 4, 4])
+
+  def test_find_skips_empty(self):
+    self.tree.update([0, 2], [1, 1])
+    indices = self.tree.find([0.5, 1.5])
+    np.testing.assert_array_equal(indices, [0, 2])
+
+  def test_find_past_total(self):
+    self.tree.update([0, 1, 2], [1, 2, 3])
+    # values at or beyond the total end on the last leaf with a priority, not the empty ones after it
+    indices = self.tree.find([6, 6 + 1e-9, 100])
+    np.testing.assert_array_equal(indices, [2, 2, 2])
+    self.tree.set(2, 0)
+    np.testing.assert_array_equal(self.tree.find([3]), [1])
+
+
+class TestMinTree(unittest.TestCase):
+  def test_min(self):
+    tree = MinTree(6)
+    self.assertEqual(tree.min(), np.inf)
+    tree.update([0, 1, 2], [3, 1, 2])
+    self.assertEqual(tree.min(), 1)
+    tree.set(1, 5)
+    self.assertEqual(tree.min(), 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
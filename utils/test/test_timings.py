@@ -0,0 +1,56 @@
+import time
+import unittest
+from utils.timings import Timings
+
+
+class Stopwatch(object):
+  def __init__(self):
+    self.added = []
+
+  def add(self, name, duration):
+    self.added.append(name)
+
+
+class TestTimings(unittest.TestCase):
+  def test_disabled(self):
+    timings = Timings()
+    with timings("step"):
+      pass
+    self.assertEqual(timings.stats(), {})
+    self.assertIs(timings("step"), timings("other"))
+
+  def test_sections(self):
+    timings = Timings(enabled=True)
+    for _ in range(10):
+      with timings("step"):
+        time.sleep(0.001)
+    stats = timings.stats()["step"]
+    self.assertEqual(stats["count"], 10)
+    self.assertGreaterEqual(stats["p50_ms"], 1)
+    self.assertGreaterEqual(stats["p99_ms"], stats["p50_ms"])
+
+  def test_decorate(self):
+    timings = Timings(enabled=True, stopwatch=Stopwatch())
+
+    @timings.decorate("double")
+    def double(x):
+      return 2 * x
+
+    self.assertEqual(double(2), 4)
+    self.assertEqual(timings.stats()["double"]["count"], 1)
+    self.assertEqual(timings.stopwatch.added, ["double"])
+
+  def test_report(self):
+    timings = Timings(enabled=True)
+    timings.reset(100)
+    with timings("step"):
+      pass
+    report = timings.report(300)
+    self.assertTrue(report.startswith("200 frames in"))
+    self.assertIn("step", report)
+    self.assertEqual(timings.stats(), {})
+    self.assertTrue(timings.report(400).startswith("100 frames in"))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,104 @@
+import collections
+import functools
+import time
+
+import numpy as np
+
+
+class _NullSection(object):
+  __slots__ = ()
+
+  def __enter__(self):
+    pass
+
+  def __exit__(self, *args):
+    pass
+
+
+_null_section = _NullSection()
+
+
+class _Section(object):
+  __slots__ = ("_timings", "_name", "_start")
+
+  def __init__(self, timings, name):
+    self._timings = timings
+    self._name = name
+
+  def __enter__(self):
+    self._start = time.perf_counter()
+
+  def __exit__(self, *args):
+    self._timings.add(self._name, time.perf_counter() - self._start)
+
+
+class Timings(object):
+  """Named timing sections, reported per interval with p50/p99 latencies and fps.
+
+  Used like pysc2's stopwatch:
+      with timings("env_step"):
+        env.step(actions)
+      @timings.decorate("sample")
+      def sample(): ...
+  While disabled a section is a shared no-op context. When `stopwatch` is set
+  (e.g. pysc2.lib.stopwatch.sw) every measurement is added to it as well.
+  """
+  def __init__(self, enabled=False, stopwatch=None):
+    self.enabled = enabled
+    self.stopwatch = stopwatch
+    self._samples = collections.defaultdict(list)
+    self._start_time = time.time()
+    self._start_frames = 0
+
+  def __call__(self, name):
+    if not self.enabled:
+      return _null_section
+    return _Section(self, name)
+
+  def decorate(self, name):
+    def decorator(func):
+      @functools.wraps(func)
+      def _timed(*args, **kwargs):
+        with self(name):
+          return func(*args, **kwargs)
+      return _timed
+    return decorator
+
+  def add(self, name, seconds):
+    self._samples[name].append(seconds)
+    if self.stopwatch is not None:
+      self.stopwatch.add(name, seconds)
+
+  def stats(self):
+    """count, p50_ms, p99_ms and total seconds of every section timed this interval."""
+    stats = {}
+    for name, samples in list(self._samples.items()):
+      samples = np.array(samples)
+      stats[name] = {
+        "count": len(samples),
+        "p50_ms": np.percentile(samples, 50) * 1000,
+        "p99_ms": np.percentile(samples, 99) * 1000,
+        "total": samples.sum(),
+      }
+    return stats
+
+  def reset(self, frames=0):
+    self._samples = collections.defaultdict(list)
+    self._start_time = time.time()
+    self._start_frames = frames
+
+  def report(self, frames):
+    """Formats the sections timed since the last report, then starts a new interval at frames."""
+    elapsed_time = max(time.time() - self._start_time, 1e-9)
+    lines = ["%s frames in %.3f seconds: %.3f fps" % (
+        frames - self._start_frames, elapsed_time, (frames - self._start_frames) / elapsed_time)]
+    stats = sorted(self.stats().items(), key=lambda item: -item[1]["total"])
+    for name, stat in stats:
+      lines.append("  %-16s %8d calls  p50 %9.3f ms  p99 %9.3f ms  %5.1f%% of wall time" % (
+          name, stat["count"], stat["p50_ms"], stat["p99_ms"], 100 * stat["total"] / elapsed_time))
+    self.reset(frames)
+    return "\n".join(lines)
+
+
+# Global timings, disabled by default like pysc2's stopwatch. Enable with `timings.enabled = True`.
+timings = Timings()